@@ -0,0 +1,4 @@
+"""
+AI compliance clause pipeline.
+Import CompliancePipeline from aix.main_pipeline; run `python -m aix` for the CLI.
+"""
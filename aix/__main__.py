@@ -0,0 +1,5 @@
+"""Entry point for `python -m aix`."""
+
+from .main_pipeline import main
+
+main()
@@ -1,333 +1,877 @@
 """
 Unified MVP AI Compliance Pipeline — Hackathon Deploy-Ready
+
+CompliancePipeline loads the rulebook, resources, embedding model, rule
+embeddings and Claude client once; run() and run_iter() then analyze any
+number of clause lists without paying that startup again.
+
+Usage:
+    python -m aix analyze [--clauses startup_clauses.json] [--output compliance_results.json]
+    python -m aix analyze --clauses clauses.jsonl --jsonl results.jsonl [--resume]
+    python -m aix analyze --documents data-room/ --jsonl results.jsonl
+    python -m aix bench [--repeat 3] [--scale 100] [--no-claude]
+    python -m aix warm
 """
 
 import os
+import sys
 import json
+import hashlib
 import re
+import pathlib
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from itertools import islice
 from sentence_transformers import SentenceTransformer, util
-from anthropic import Anthropic
 from dotenv import load_dotenv
 
+# Shared backend helpers (outbound LLM limiter, retries, circuit breaker)
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "backend"))
+from schemas import ClauseMapping, MAP_CLAUSE_TOOL
+from model_router import ModelRouter
+import embedding_store
+from keyword_matcher import KeywordMatcher
+from rule_engine import load_predicates, evaluate_each
+from segmentation import iter_document_clauses
+import llm_cassette
+
 # === Setup ===
 load_dotenv()
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-assert ANTHROPIC_API_KEY, "Set your ANTHROPIC_API_KEY in the environment first."
-
-client = Anthropic(api_key=ANTHROPIC_API_KEY)
 
 # === Config ===
-CLAUSE_FILE = "startup_clauses.json"
-RULE_FILE = "qcb_rulebook.json"
-RESOURCE_FILE = "resources.json"
-CONFIG_FILE = "config.json"
-OUTPUT_FILE = "compliance_results.json"
-
-# === Load Data ===
-clauses = json.load(open(CLAUSE_FILE, "r", encoding="utf-8"))
-rules = json.load(open(RULE_FILE, "r", encoding="utf-8"))
-resources = json.load(open(RESOURCE_FILE, "r", encoding="utf-8"))
-config = json.load(open(CONFIG_FILE, "r", encoding="utf-8"))
-
-# Extract config values
-SIM_THRESHOLD = config["pipeline_config"]["similarity_threshold"]
-MAX_RECOMMENDATIONS = config["pipeline_config"]["max_recommendations"]
-CLAUDE_MODEL = config["pipeline_config"]["claude_model"]
-MAX_TOKENS = config["pipeline_config"]["max_tokens"]
-DEFAULT_CONFIDENCE = config["pipeline_config"]["default_confidence"]
-
-# === Load SentenceTransformer Model ===
-model = SentenceTransformer('all-MiniLM-L6-v2')
-rule_texts = [r["description"] for r in rules]
-rule_embeddings = model.encode(rule_texts, convert_to_tensor=True)
-
-# === Gap Severity Classification ===
-def classify_gap_severity(rule_id, compliance):
-    """Classify gap severity based on rule type and compliance status from config"""
-    if compliance == "no":
-        severity_data = config["severity_mapping"].get(rule_id, {
-            "severity": "Regulatory Gap",
-            "category": "General",
-            "priority": 3,
-            "description": "Unclassified regulatory gap"
-        })
-        return severity_data
+AIX_DIR = pathlib.Path(__file__).resolve().parent
+CLAUSE_FILE = AIX_DIR / "startup_clauses.json"
+RULE_FILE = AIX_DIR / "qcb_rulebook.json"
+RESOURCE_FILE = AIX_DIR / "resources.json"
+CONFIG_FILE = AIX_DIR / "config.json"
+OUTPUT_FILE = AIX_DIR / "compliance_results.json"
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Wording that marks an amount as paid-up capital rather than funding or targets
+PAID_UP_CAPITAL_CONTEXT = ["paid-up capital", "paid up capital", "paid-in capital", "share capital"]
+
+
+def load_json(path):
+    """Load a JSON file"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_predicates(rules, config):
+    """Shared predicates for rules in this rulebook, with capital thresholds from config"""
+    rule_ids = {r["rule_id"] for r in rules}
+    return [
+        p for p in load_predicates()
+        if p["rule"] in rule_ids and p["rule"] not in config["capital_requirements"]
+    ] + [
+        {
+            "rule": rule_id,
+            "check": "money",
+            "label": "Paid-up capital",
+            "context": PAID_UP_CAPITAL_CONTEXT,
+            "fail_below": req["minimum_capital"],
+            "pass_at_least": req["minimum_capital"],
+            "action": f"Raise paid-up capital to at least {req['currency']} {req['minimum_capital']:,}"
+        }
+        for rule_id, req in config["capital_requirements"].items()
+        if rule_id in rule_ids
+    ]
+
+
+def pick_local_result(local_results):
+    """
+    Pick the failed check that resolves a clause, if any.
+
+    A passed predicate checks only one condition of its rule, so it never
+    marks a clause compliant; the clause goes to matching and Claude instead.
+    """
+    failed = [r for r in local_results.values() if r["status"] == "fail"]
+    return failed[0] if failed else None
+
+
+def clause_hash(clause_text):
+    """Content hash identifying a clause across runs"""
+    return hashlib.sha256(clause_text.encode("utf-8")).hexdigest()[:32]
+
+
+def checkpoint_key(item):
+    """
+    Resume key of a clause or result entry.
+
+    Identical text from different sources or positions is a different
+    clause; exact repeats share a key and are counted.
+    """
+    return item.get("source") or "", item.get("position") or None, clause_hash(item["clause"])
+
+
+def iter_clauses(path):
+    """Stream clauses from a JSONL file (one clause object per line) or load a JSON list"""
+    if str(path).endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from load_json(path)
+
+
+def read_checkpoint(path):
+    """
+    Read the results already written to a JSONL results file.
+
+    A partial last line left by a crash mid-write is cut off so appending
+    resumes from the last complete result.
+
+    Args:
+        path: JSONL results file
+
+    Yields:
+        Result entry dictionaries
+    """
+    if not os.path.exists(path):
+        return
+
+    good_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            good_bytes += len(line)
+            yield entry
+
+    if good_bytes < os.path.getsize(path):
+        print(f"⚠️ Dropping partial record at the end of {path}")
+        with open(path, "r+b") as f:
+            f.truncate(good_bytes)
+
+
+class SummaryStats:
+    """Running summary statistics, updated one result at a time."""
+
+    def __init__(self):
+        self.total = 0
+        self.gaps = 0
+        self.resolved_locally = 0
+        self.sent_to_claude = 0
+        self.confidence_sum = 0.0
+
+    def add(self, entry):
+        """Count one result entry"""
+        self.total += 1
+        self.confidence_sum += entry["confidence"]
+        if entry["compliance"] == "no":
+            self.gaps += 1
+        if entry.get("resolved_by") == "rule_engine":
+            self.resolved_locally += 1
+        elif entry.get("resolved_by") == "claude":
+            self.sent_to_claude += 1
+
+    def to_dict(self):
+        """Summary block of the report"""
+        average_conf = round(self.confidence_sum / self.total, 2) if self.total else 0.0
+        compliance_rate = round((self.total - self.gaps) / self.total * 100, 1) if self.total else 0.0
+        return {
+            "total_clauses": self.total,
+            "compliant_clauses": self.total - self.gaps,
+            "gaps_detected": self.gaps,
+            "resolved_locally": self.resolved_locally,
+            "sent_to_claude": self.sent_to_claude,
+            "compliance_rate": f"{compliance_rate}%",
+            "average_confidence": average_conf
+        }
+
+
+def unknown_mapping(reason):
+    """Mapping for a clause Claude could not map"""
     return {
-        "severity": "Compliant",
-        "category": "N/A",
-        "priority": 0,
-        "description": "Meets regulatory requirements"
+        "mapped_rule": "unknown",
+        "compliance": "unknown",
+        "reason": reason,
+        "confidence": 0.0,
+        "action_required": None
     }
 
-# === Financial Gap Calculator ===
-def calculate_financial_gap(clause_text, rule_id):
-    """Extract and calculate financial shortfalls for capital requirements"""
-    capital_req = config["capital_requirements"].get(rule_id)
-    if not capital_req:
-        return None
-    
-    # Extract capital amount from clause
-    capital_match = re.search(r'QAR\s*([\d,]+)', clause_text)
-    if not capital_match:
-        return None
-    
-    current_capital = int(capital_match.group(1).replace(',', ''))
-    required_capital = capital_req["minimum_capital"]
-    
-    if current_capital < required_capital:
-        shortfall = required_capital - current_capital
+
+class CompliancePipeline:
+    """Maps startup clauses to QCB rules, classifies gaps and recommends resources."""
+
+    def __init__(self, rule_file=RULE_FILE, resource_file=RESOURCE_FILE, config_file=CONFIG_FILE,
+                 model=None, client=None, use_claude=True, verbose=True):
+        """
+        Load rules, resources, the embedding model and the Claude client.
+
+        Args:
+            rule_file: QCB rulebook JSON
+            resource_file: Programs and experts JSON
+            config_file: Pipeline config JSON
+            model: SentenceTransformer to reuse (loaded if None)
+            client: Anthropic client to reuse (built from the environment if None)
+            use_claude: False disables the Claude fallback
+            verbose: Print per-clause progress
+        """
+        self.verbose = verbose
+        self.rules = load_json(rule_file)
+        self.resources = load_json(resource_file)
+        self.config = load_json(config_file)
+
+        # Extract config values
+        pipeline_config = self.config["pipeline_config"]
+        self.sim_threshold = pipeline_config["similarity_threshold"]
+        self.max_recommendations = pipeline_config["max_recommendations"]
+        self.claude_model = pipeline_config["claude_model"]
+        self.max_tokens = pipeline_config["max_tokens"]
+        self.default_confidence = pipeline_config["default_confidence"]
+
+        # Clause embedding: clauses per encode() call, sentences per forward pass,
+        # and rule candidates kept per clause
+        self.encode_chunk_size = pipeline_config.get("encode_chunk_size", 4096)
+        self.encode_batch_size = pipeline_config.get("encode_batch_size", 64)
+        self.top_k = pipeline_config.get("top_k", 3)
+
+        # Claude fallback calls in flight at once
+        self.claude_concurrency = max(1, pipeline_config.get("claude_concurrency", 8))
+
+        # Model routing: clauses just below the similarity threshold try the fast model first
+        routing = self.config.get("model_routing", {})
+        self.fast_similarity_min = routing.get("fast_similarity_min", self.sim_threshold)
+        self.router = ModelRouter(
+            routing.get("fast_model") if routing.get("enabled", False) else None,
+            self.claude_model,
+            escalate_below_confidence=routing.get("escalate_below_confidence", self.default_confidence),
+            pricing=routing.get("pricing_per_million_tokens")
+        )
+
+        # === Deterministic Rule Predicates ===
+        self.predicates = build_predicates(self.rules, self.config)
+
+        # Recommendations per rule, matched against the keyword table once
+        self.resource_index = self._build_resource_index()
+
+        # Live client, or record/replay against a cassette (LLM_MODE, LLM_CASSETTE).
+        # Without a key in live mode only the Claude fallback is disabled.
+        if not use_claude:
+            self.client = None
+        elif client is not None:
+            self.client = client
+        else:
+            self.client = llm_cassette.create_client(os.getenv("ANTHROPIC_API_KEY"))
+            if self.client is None:
+                print("⚠️ ANTHROPIC_API_KEY not set: Claude fallback disabled (set LLM_MODE=replay to use a cassette)")
+
+        # === Rule Embeddings ===
+        # Loaded from the embedding store when the rulebook is unchanged; the
+        # SentenceTransformer is then only loaded once a clause needs encoding
+        self._model = model
+        self.rule_embeddings = embedding_store.load_or_build(
+            "aix-qcb-rulebook",
+            EMBEDDING_MODEL,
+            [r["rule_id"] for r in self.rules],
+            [r["description"] for r in self.rules],
+            encode=self._encode
+        )
+
+        # Create rulebook context for Claude
+        self.rulebook_context = "\n".join([
+            f"• {r['rule_id']}: {r['title']} - {r['description']}"
+            for r in self.rules
+        ])
+
+        self.encode_seconds = 0.0
+
+    def _print(self, *args):
+        if self.verbose:
+            print(*args)
+
+    @property
+    def model(self):
+        """SentenceTransformer, loaded on first use"""
+        if self._model is None:
+            self._model = SentenceTransformer(EMBEDDING_MODEL)
+        return self._model
+
+    def _encode(self, texts):
+        return self.model.encode(
+            texts,
+            batch_size=self.encode_batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+
+    # === Gap Severity Classification ===
+    def classify_gap_severity(self, rule_id, compliance):
+        """Classify gap severity based on rule type and compliance status from config"""
+        if compliance == "no":
+            severity_data = self.config["severity_mapping"].get(rule_id, {
+                "severity": "Regulatory Gap",
+                "category": "General",
+                "priority": 3,
+                "description": "Unclassified regulatory gap"
+            })
+            return severity_data
         return {
-            "current": f"QAR {current_capital:,}",
-            "required": f"QAR {required_capital:,}",
-            "shortfall": f"QAR {shortfall:,}",
-            "category": capital_req["category"]
+            "severity": "Compliant",
+            "category": "N/A",
+            "priority": 0,
+            "description": "Meets regulatory requirements"
         }
-    return None
-
-# === Resource Recommendation Engine ===
-def recommend_resources(rule_id, severity_data):
-    """Match identified gaps to relevant resources from resources.json"""
-    recommendations = []
-    
-    # Get relevant keywords from config
-    relevant_keywords = config["resource_keywords_mapping"].get(rule_id, [])
-    
-    # Process QDB Programs
-    for program in resources.get("qdb_programs", []):
+
+    # === Financial Gap Calculator ===
+    def calculate_financial_gap(self, clause_text, rule_id):
+        """Extract and calculate financial shortfalls for capital requirements"""
+        capital_req = self.config["capital_requirements"].get(rule_id)
+        if not capital_req:
+            return None
+
+        # Extract capital amount from clause
+        capital_match = re.search(r'QAR\s*([\d,]+)', clause_text)
+        if not capital_match:
+            return None
+
+        current_capital = int(capital_match.group(1).replace(',', ''))
+        required_capital = capital_req["minimum_capital"]
+
+        if current_capital < required_capital:
+            shortfall = required_capital - current_capital
+            return {
+                "current": f"QAR {current_capital:,}",
+                "required": f"QAR {required_capital:,}",
+                "shortfall": f"QAR {shortfall:,}",
+                "category": capital_req["category"]
+            }
+        return None
+
+    # === Resource Recommendation Engine ===
+    def _build_resource_index(self):
+        """
+        Match every resource against the config keyword table once.
+
+        Returns:
+            Dictionary of rule_id to its recommendation entries, programs
+            before experts in resources.json order
+        """
+        keywords = self.config["resource_keywords_mapping"]
+        matcher = KeywordMatcher(keywords)
+        index = {rule_id: [] for rule_id in keywords}
+
         # Match based on keywords in program name and focus areas
-        program_text = " ".join([
-            program.get("program_name", ""),
-            " ".join(program.get("focus_areas", []))
-        ]).lower()
-        
-        # Check if any keyword matches
-        if any(keyword in program_text for keyword in relevant_keywords):
-            recommendations.append({
+        for program in self.resources.get("qdb_programs", []):
+            program_text = " ".join([
+                program.get("program_name", ""),
+                " ".join(program.get("focus_areas", []))
+            ])
+            entry = {
                 "resource_id": program.get("program_id", "N/A"),
                 "name": program.get("program_name", "Unknown Program"),
                 "type": "QDB Program",
                 "provider": "Qatar Development Bank",
                 "focus_areas": program.get("focus_areas", []),
                 "description": f"QDB Program focusing on: {', '.join(program.get('focus_areas', []))}"
-            })
-    
-    # Process Compliance Experts
-    for expert in resources.get("compliance_experts", []):
+            }
+            for rule_id in matcher.find_labels(program_text):
+                index[rule_id].append(entry)
+
         # Match based on keywords in name and specialization
-        expert_text = " ".join([
-            expert.get("name", ""),
-            expert.get("specialization", "")
-        ]).lower()
-        
-        # Check if any keyword matches
-        if any(keyword in expert_text for keyword in relevant_keywords):
-            recommendations.append({
+        for expert in self.resources.get("compliance_experts", []):
+            expert_text = " ".join([
+                expert.get("name", ""),
+                expert.get("specialization", "")
+            ])
+            entry = {
                 "resource_id": expert.get("expert_id", "N/A"),
                 "name": expert.get("name", "Unknown Expert"),
                 "type": "Compliance Expert",
                 "provider": "QCB Network",
                 "specialization": expert.get("specialization", "N/A"),
                 "description": expert.get("specialization", "Compliance specialist")
-            })
-    
-    return recommendations[:MAX_RECOMMENDATIONS]
-
-# === Claude API Function ===
-def map_with_claude(clause_text, rulebook_context):
-    """Use Claude API to map clause to QCB rule with enhanced context"""
-    system_prompt = (
-        "You are an expert AI compliance assistant for Qatar Central Bank (QCB) fintech regulations. "
-        "Analyze the startup clause against QCB rules and respond with valid JSON:\n\n"
-        '{\n'
-        '  "mapped_rule": "QCB x.x.x",\n'
-        '  "compliance": "yes"|"no",\n'
-        '  "reason": "detailed explanation of compliance status",\n'
-        '  "confidence": 0.85,\n'
-        '  "action_required": "specific action if non-compliant or null if compliant"\n'
-        '}\n\n'
-        "IMPORTANT: Return raw JSON only, no markdown code blocks."
-    )
-    
-    user_message = (
-        f"Available QCB Rules:\n{rulebook_context}\n\n"
-        f"Analyze this startup clause:\n{clause_text}"
-    )
-
-    try:
-        response = client.messages.create(
-            model=CLAUDE_MODEL,
-            max_tokens=MAX_TOKENS,
-            system=system_prompt,
-            messages=[{"role": "user", "content": user_message}]
+            }
+            for rule_id in matcher.find_labels(expert_text):
+                index[rule_id].append(entry)
+
+        return index
+
+    def recommend_resources(self, rule_id, severity_data):
+        """Match identified gaps to relevant resources from resources.json"""
+        return [dict(entry) for entry in self.resource_index.get(rule_id, [])[:self.max_recommendations]]
+
+    # === Batched Clause-to-Rule Matching ===
+    def match_clauses(self, clause_texts):
+        """Encode clauses in batches and return the top-k (rule index, score) pairs per clause"""
+        if not clause_texts:
+            return []
+
+        started = time.perf_counter()
+        clause_embeddings = self._encode(clause_texts)
+        # One similarity matrix per chunk; embeddings are normalized so dot = cosine
+        matches = [
+            [(hit["corpus_id"], float(hit["score"])) for hit in hits]
+            for hits in util.semantic_search(clause_embeddings, self.rule_embeddings, top_k=self.top_k,
+                                             score_function=util.dot_score)
+        ]
+        elapsed = time.perf_counter() - started
+        self.encode_seconds += elapsed
+        self._print(f"Matched {len(clause_texts)} clauses against {len(self.rules)} rules in {elapsed:.2f}s "
+                    f"({len(clause_texts) / max(elapsed, 1e-9):.0f} clauses/s)\n")
+        return matches
+
+    # === Claude API Function ===
+    def map_with_claude(self, clause_text, use_fast=False):
+        """Use Claude API to map clause to QCB rule with enhanced context"""
+        system_prompt = (
+            "You are an expert AI compliance assistant for Qatar Central Bank (QCB) fintech regulations. "
+            "Analyze the startup clause against QCB rules and report the mapped rule, "
+            "compliance (yes/no), a detailed reason, your confidence (0-1) and the action "
+            "required if non-compliant by calling the map_clause tool."
         )
 
-        text = response.content[0].text.strip()
-        
-        # Remove markdown code blocks if present
-        if text.startswith("```json"):
-            text = text.replace("```json", "", 1)
-        if text.startswith("```"):
-            text = text.replace("```", "", 1)
-        if text.endswith("```"):
-            text = text.rsplit("```", 1)[0]
-        
-        text = text.strip()
-        parsed = json.loads(text)
-
-        # Validate and provide defaults
-        if "confidence" not in parsed or not isinstance(parsed["confidence"], (int, float)):
-            parsed["confidence"] = DEFAULT_CONFIDENCE
-        if parsed.get("compliance") not in ["yes", "no"]:
-            parsed["compliance"] = "unknown"
-        if "action_required" not in parsed:
-            parsed["action_required"] = None
-
-        return parsed
-
-    except json.JSONDecodeError as e:
-        print(f"❌ JSON parsing error for clause: {clause_text[:50]}...")
-        print(f"   Raw response: {text[:200] if 'text' in locals() else 'No response'}")
+        user_message = (
+            f"Available QCB Rules:\n{self.rulebook_context}\n\n"
+            f"Analyze this startup clause:\n{clause_text}"
+        )
+
+        if self.client is None:
+            return unknown_mapping("Claude fallback disabled: ANTHROPIC_API_KEY not set")
+
+        try:
+            # Forced map_clause tool call, validated and repaired against the schema;
+            # routed to the fast model first when the clause is an easy case
+            mapping, route = self.router.create(
+                self.client,
+                ClauseMapping,
+                MAP_CLAUSE_TOOL,
+                use_fast=use_fast,
+                max_tokens=self.max_tokens,
+                system=system_prompt,
+                messages=[{"role": "user", "content": user_message}]
+            )
+            parsed = mapping.model_dump()
+            parsed["model_route"] = route["route"]
+
+            # ClauseMapping already validated compliance and action_required;
+            # confidence is optional in the tool schema
+            if parsed["confidence"] is None:
+                parsed["confidence"] = self.default_confidence
+
+            return parsed
+
+        except ValueError as e:
+            print(f"❌ Invalid response for clause: {clause_text[:50]}...")
+            print(f"   Error: {str(e)[:200]}")
+            return unknown_mapping(f"Invalid response: {str(e)}")
+        except Exception as e:
+            print(f"❌ API error for clause: {clause_text[:50]}...")
+            print(f"   Error: {str(e)}")
+            return unknown_mapping(f"API error: {str(e)}")
+
+    def map_queue_with_claude(self, queue):
+        """
+        Run the Claude fallback for queued clauses with bounded concurrency.
+
+        Mappings are yielded in queue order as soon as each one and every
+        earlier one have finished, so a caller that writes them out loses
+        at most the calls still in flight if the run is interrupted.
+
+        Args:
+            queue: List of (clause index, clause text, best similarity score)
+
+        Yields:
+            (clause index, mapping) tuples; a clause that fails gets an
+            'unknown' mapping instead of aborting the run
+        """
+        if not queue:
+            return
+
+        self._print(f"Calling Claude for {len(queue)} low-similarity clauses ({self.claude_concurrency} concurrent)...")
+        executor = ThreadPoolExecutor(max_workers=self.claude_concurrency, thread_name_prefix="claude-fallback")
+        try:
+            futures = {
+                executor.submit(self.map_with_claude, clause_text, best_score >= self.fast_similarity_min): (index, clause_text, best_score)
+                for index, clause_text, best_score in queue
+            }
+            # Reorder buffer: finished mappings wait here for earlier clauses
+            order = [index for index, _, _ in queue]
+            ready = {}
+            next_up = 0
+            for done, future in enumerate(as_completed(futures), 1):
+                index, clause_text, best_score = futures[future]
+                try:
+                    ready[index] = future.result()
+                except Exception as e:
+                    print(f"❌ Fallback failed for clause: {clause_text[:50]}...")
+                    print(f"   Error: {str(e)}")
+                    ready[index] = unknown_mapping(f"Fallback error: {str(e)}")
+                self._print(f"[Claude {done}/{len(queue)}] Low similarity ({best_score:.2f}): {clause_text[:60]}...")
+
+                while next_up < len(order) and order[next_up] in ready:
+                    yield order[next_up], ready.pop(order[next_up])
+                    next_up += 1
+        finally:
+            # A consumer that stops early doesn't wait for (or pay for) queued calls
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    # === Main Processing Loop ===
+    def run_iter(self, clauses, skip=None):
+        """
+        Analyze clauses, yielding one result entry per clause in input order.
+
+        Clauses are processed in chunks of encode_chunk_size: rule engine,
+        batched similarity, then concurrent Claude fallback for the chunk.
+        Each result is yielded as soon as it and every earlier clause are
+        done, so a Claude call's result is never held back until the rest of
+        its chunk finishes.
+
+        Args:
+            clauses: Iterable of {'clause': str, 'source': str} dictionaries
+            skip: Counter of checkpoint_key() values already processed; that
+                many occurrences of each key are skipped
+
+        Yields:
+            Result entry dictionaries
+        """
+        clauses = iter(clauses)
+        if skip:
+            clauses = self._skip_done(clauses, Counter(skip))
+        position = 0
+        while True:
+            chunk = list(islice(clauses, self.encode_chunk_size))
+            if not chunk:
+                return
+            yield from self._run_chunk(chunk, position)
+            position += len(chunk)
+
+    @staticmethod
+    def _skip_done(clauses, remaining):
+        for clause in clauses:
+            key = checkpoint_key(clause)
+            if remaining[key] > 0:
+                remaining[key] -= 1
+                continue
+            yield clause
+
+    def _run_chunk(self, clauses, position):
+        texts = [c["clause"] for c in clauses]
+
+        # Resolve mechanically checkable clauses in one pass before any model calls
+        local_picks = [pick_local_result(local) for local in evaluate_each(texts, self.predicates)]
+
+        # Embed every clause the rule engine did not resolve in batches, then take
+        # the top-k rules per clause from one similarity matrix
+        pending = [i for i, local_result in enumerate(local_picks) if local_result is None]
+        clause_matches = dict(zip(pending, self.match_clauses([texts[i] for i in pending])))
+
+        # Only clauses whose best match is below the threshold go to Claude, all
+        # at once; their mappings arrive in clause order
+        claude_results = self.map_queue_with_claude([
+            (i, texts[i], clause_matches[i][0][1])
+            for i in pending if clause_matches[i][0][1] < self.sim_threshold
+        ])
+
+        for i, clause in enumerate(clauses):
+            clause_text = texts[i]
+            self._print(f"[{position + i + 1}] Processing: {clause_text[:60]}...")
+
+            local_result = local_picks[i]
+            model_route = None
+            top_matches = None
+            if local_result:
+                resolved_by = "rule_engine"
+                mapped_rule = local_result["rule_ref"]
+                compliance = "no"
+                reason = local_result["explanation"]
+                confidence = 1.0
+                action_required = local_result["action"]
+                self._print(f"   ✅ Rule engine: {mapped_rule} | {compliance}")
+            else:
+                top_matches = [
+                    {"rule_id": self.rules[rule_idx]["rule_id"], "score": round(score, 4)}
+                    for rule_idx, score in clause_matches[i]
+                ]
+                best_idx, best_score = clause_matches[i][0]
+                matched_rule = self.rules[best_idx]
+
+                # Low confidence fallback → Claude API
+                if best_score < self.sim_threshold:
+                    resolved_by = "claude"
+                    _, ai_result = next(claude_results)
+                    mapped_rule = ai_result["mapped_rule"]
+                    compliance = ai_result["compliance"]
+                    reason = ai_result["reason"]
+                    confidence = ai_result.get("confidence", 0.0)
+                    action_required = ai_result.get("action_required")
+                    model_route = ai_result.get("model_route")
+                    self._print(f"   ✅ Claude ({model_route}): {mapped_rule} | {compliance} | confidence={confidence}")
+                else:
+                    resolved_by = "similarity"
+                    mapped_rule = matched_rule["rule_id"]
+                    compliance = "yes"
+                    reason = f"Matched with {matched_rule['title']} (cosine similarity={best_score:.2f})"
+                    confidence = best_score
+                    action_required = None
+                    self._print(f"   ✅ High similarity: {mapped_rule} | confidence={confidence:.2f}")
+
+            # Classify severity
+            severity_data = self.classify_gap_severity(mapped_rule, compliance)
+
+            # Calculate financial gap if applicable
+            financial_gap = self.calculate_financial_gap(clause_text, mapped_rule)
+
+            # Recommend resources for non-compliant items
+            recommendations = []
+            if compliance == "no":
+                recommendations = self.recommend_resources(mapped_rule, severity_data)
+                self._print(f"   🔴 GAP DETECTED: {severity_data['severity']}")
+                if recommendations:
+                    self._print(f"   💡 {len(recommendations)} resource(s) recommended")
+                if financial_gap:
+                    self._print(f"   💰 Financial shortfall: {financial_gap['shortfall']}")
+
+            # Build result entry
+            result_entry = {
+                "clause_hash": clause_hash(clause_text),
+                "clause": clause_text,
+                "source": clause.get("source", ""),
+                "mapped_rule": mapped_rule,
+                "compliance": compliance,
+                "severity": severity_data["severity"],
+                "severity_category": severity_data["category"],
+                "priority": severity_data["priority"],
+                "reason": reason,
+                "confidence": round(confidence, 2),
+                "resolved_by": resolved_by
+            }
+
+            # Where a segmented document clause came from
+            for key in ("section", "position"):
+                if clause.get(key):
+                    result_entry[key] = clause[key]
+
+            if action_required:
+                result_entry["action_required"] = action_required
+
+            if model_route:
+                result_entry["model_route"] = model_route
+
+            if top_matches:
+                result_entry["top_matches"] = top_matches
+
+            if financial_gap:
+                result_entry["financial_gap"] = financial_gap
+
+            if recommendations:
+                result_entry["recommendations"] = recommendations
+
+            yield result_entry
+
+    def run(self, clauses):
+        """
+        Analyze clauses and build the full report.
+
+        Args:
+            clauses: Iterable of {'clause': str, 'source': str} dictionaries
+
+        Returns:
+            Dictionary with configuration, routing stats, summary and results
+        """
+        self._print(f"\n{'='*60}")
+        self._print(f"Starting AI Compliance Analysis Pipeline")
+        self._print(f"{'='*60}\n")
+
+        self.encode_seconds = 0.0
+        stats = SummaryStats()
+        results = []
+        for entry in self.run_iter(clauses):
+            stats.add(entry)
+            results.append(entry)
+
+        output = self.report(stats)
+        output["results"] = results
+        return output
+
+    def run_to_jsonl(self, clauses, results_file, resume=False):
+        """
+        Analyze clauses, appending each result to a JSONL file as it completes.
+
+        Memory stays constant in the number of clauses. With resume,
+        clauses already in results_file (by source, position and text,
+        counting repeats) are skipped and the summary includes the earlier
+        results.
+
+        Args:
+            clauses: Iterable of {'clause': str, 'source': str} dictionaries
+            results_file: JSONL results path
+            resume: Continue an interrupted run instead of starting over
+
+        Returns:
+            Report dictionary without 'results'
+        """
+        self.encode_seconds = 0.0
+        stats = SummaryStats()
+        done = Counter()
+        if resume:
+            for entry in read_checkpoint(results_file):
+                stats.add(entry)
+                done[checkpoint_key(entry)] += 1
+            self._print(f"Resuming: {sum(done.values())} clauses already in {results_file}")
+
+        self._print(f"\n{'='*60}")
+        self._print(f"Starting AI Compliance Analysis Pipeline")
+        self._print(f"{'='*60}\n")
+
+        with open(results_file, "a" if resume else "w", encoding="utf-8") as f:
+            for entry in self.run_iter(clauses, skip=done):
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                stats.add(entry)
+
+        output = self.report(stats)
+        output["results_file"] = str(results_file)
+        return output
+
+    def report(self, stats):
+        """Report header: configuration, routing stats and summary"""
+        summary = stats.to_dict()
+        summary["encode_seconds"] = round(self.encode_seconds, 3)
         return {
-            "mapped_rule": "unknown",
-            "compliance": "unknown",
-            "reason": f"JSON parse error: {str(e)}",
-            "confidence": 0.0,
-            "action_required": None
+            "model": self.claude_model,
+            "timestamp": datetime.utcnow().isoformat(),
+            "configuration": self.configuration(),
+            "routing": self.router.get_stats(),
+            "summary": summary
         }
-    except Exception as e:
-        print(f"❌ API error for clause: {clause_text[:50]}...")
-        print(f"   Error: {str(e)}")
+
+    def configuration(self):
+        """Pipeline settings recorded with each report"""
         return {
-            "mapped_rule": "unknown",
-            "compliance": "unknown",
-            "reason": f"API error: {str(e)}",
-            "confidence": 0.0,
-            "action_required": None
+            "similarity_threshold": self.sim_threshold,
+            "max_recommendations": self.max_recommendations,
+            "default_confidence": self.default_confidence,
+            "top_k": self.top_k,
+            "claude_concurrency": self.claude_concurrency,
+            "fast_model": self.router.fast_model,
+            "fast_similarity_min": self.fast_similarity_min
         }
 
-# === Main Processing Loop ===
-results = []
-total_confidence = 0.0
-gaps_detected = 0
-
-# Create rulebook context for Claude
-rulebook_context = "\n".join([
-    f"• {r['rule_id']}: {r['title']} - {r['description']}" 
-    for r in rules
-])
-
-print(f"\n{'='*60}")
-print(f"Starting AI Compliance Analysis Pipeline")
-print(f"{'='*60}\n")
-
-for i, clause in enumerate(clauses, 1):
-    clause_text = clause["clause"]
-    print(f"[{i}/{len(clauses)}] Processing: {clause_text[:60]}...")
-    
-    # Encode clause and compute similarity with all rules
-    clause_emb = model.encode(clause_text, convert_to_tensor=True)
-    cos_scores = util.cos_sim(clause_emb, rule_embeddings)[0].cpu().numpy()
-
-    best_idx = cos_scores.argmax()
-    best_score = float(cos_scores[best_idx])
-    matched_rule = rules[best_idx]
-
-    # Low confidence fallback → Claude API
-    if best_score < SIM_THRESHOLD:
-        print(f"   ⚠️ Low similarity ({best_score:.2f}) → Calling Claude API...")
-        ai_result = map_with_claude(clause_text, rulebook_context)
-        mapped_rule = ai_result["mapped_rule"]
-        compliance = ai_result["compliance"]
-        reason = ai_result["reason"]
-        confidence = ai_result.get("confidence", 0.0)
-        action_required = ai_result.get("action_required")
-        print(f"   ✅ Claude: {mapped_rule} | {compliance} | confidence={confidence}")
-    else:
-        mapped_rule = matched_rule["rule_id"]
-        compliance = "yes"
-        reason = f"Matched with {matched_rule['title']} (cosine similarity={best_score:.2f})"
-        confidence = best_score
-        action_required = None
-        print(f"   ✅ High similarity: {mapped_rule} | confidence={confidence:.2f}")
-
-    # Classify severity
-    severity_data = classify_gap_severity(mapped_rule, compliance)
-    
-    # Calculate financial gap if applicable
-    financial_gap = calculate_financial_gap(clause_text, mapped_rule)
-    
-    # Recommend resources for non-compliant items
-    recommendations = []
-    if compliance == "no":
-        gaps_detected += 1
-        recommendations = recommend_resources(mapped_rule, severity_data)
-        print(f"   🔴 GAP DETECTED: {severity_data['severity']}")
-        if recommendations:
-            print(f"   💡 {len(recommendations)} resource(s) recommended")
-        if financial_gap:
-            print(f"   💰 Financial shortfall: {financial_gap['shortfall']}")
-
-    total_confidence += confidence
-
-    # Build result entry
-    result_entry = {
-        "clause": clause_text,
-        "source": clause.get("source", ""),
-        "mapped_rule": mapped_rule,
-        "compliance": compliance,
-        "severity": severity_data["severity"],
-        "severity_category": severity_data["category"],
-        "priority": severity_data["priority"],
-        "reason": reason,
-        "confidence": round(confidence, 2)
-    }
-    
-    if action_required:
-        result_entry["action_required"] = action_required
-    
-    if financial_gap:
-        result_entry["financial_gap"] = financial_gap
-    
-    if recommendations:
-        result_entry["recommendations"] = recommendations
-    
-    results.append(result_entry)
-
-# === Calculate Summary Statistics ===
-average_conf = round(total_confidence / len(results), 2) if results else 0.0
-compliance_rate = round((len(results) - gaps_detected) / len(results) * 100, 1) if results else 0.0
-
-# === Save Output ===
-final_output = {
-    "model": CLAUDE_MODEL,
-    "timestamp": datetime.utcnow().isoformat(),
-    "configuration": {
-        "similarity_threshold": SIM_THRESHOLD,
-        "max_recommendations": MAX_RECOMMENDATIONS,
-        "default_confidence": DEFAULT_CONFIDENCE
-    },
-    "summary": {
-        "total_clauses": len(results),
-        "compliant_clauses": len(results) - gaps_detected,
-        "gaps_detected": gaps_detected,
-        "compliance_rate": f"{compliance_rate}%",
-        "average_confidence": average_conf
-    },
-    "results": results
-}
-
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(final_output, f, indent=2, ensure_ascii=False)
 
 # === Final Report ===
-print(f"\n{'='*60}")
-print(f"✅ Pipeline Complete!")
-print(f"{'='*60}")
-print(f"Total clauses analyzed: {len(results)}")
-print(f"✅ Compliant: {len(results) - gaps_detected}")
-print(f"Gaps detected: {gaps_detected}")
-print(f"Compliance rate: {compliance_rate}%")
-print(f"Average confidence: {average_conf}")
-print(f"Results saved to: {OUTPUT_FILE}")
-print(f"{'='*60}\n")
\ No newline at end of file
+def print_report(output, output_file):
+    """Print the run summary"""
+    summary = output["summary"]
+    print(f"\n{'='*60}")
+    print(f"✅ Pipeline Complete!")
+    print(f"{'='*60}")
+    print(f"Total clauses analyzed: {summary['total_clauses']}")
+    print(f"✅ Compliant: {summary['compliant_clauses']}")
+    print(f"Gaps detected: {summary['gaps_detected']}")
+    print(f"Resolved by rule engine: {summary['resolved_locally']}")
+    print(f"Compliance rate: {summary['compliance_rate']}")
+    print(f"Average confidence: {summary['average_confidence']}")
+    print(f"Results saved to: {output.get('results_file', output_file)}")
+    print(f"{'='*60}\n")
+
+
+def load_clauses(args):
+    """Clauses segmented from --documents, else read from --clauses"""
+    if args.documents:
+        return iter_document_clauses(args.documents)
+    return iter_clauses(args.clauses)
+
+
+def cmd_analyze(args):
+    pipeline = CompliancePipeline(args.rules, args.resources, args.config,
+                                  use_claude=not args.no_claude, verbose=not args.quiet)
+    clauses = load_clauses(args)
+    if args.jsonl:
+        output = pipeline.run_to_jsonl(clauses, args.jsonl, resume=args.resume)
+    else:
+        output = pipeline.run(clauses)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+
+    print_report(output, args.output)
+
+
+def cmd_bench(args):
+    started = time.perf_counter()
+    pipeline = CompliancePipeline(args.rules, args.resources, args.config,
+                                  use_claude=not args.no_claude, verbose=False)
+    load_seconds = time.perf_counter() - started
+
+    clauses = list(load_clauses(args)) * args.scale
+    runs = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        output = pipeline.run(clauses)
+        elapsed = time.perf_counter() - started
+        runs.append({
+            "seconds": round(elapsed, 3),
+            "clauses_per_second": round(len(clauses) / max(elapsed, 1e-9), 1),
+            "encode_seconds": output["summary"]["encode_seconds"],
+            "sent_to_claude": output["summary"]["sent_to_claude"]
+        })
+
+    print(json.dumps({
+        "clauses": len(clauses),
+        "startup_seconds": round(load_seconds, 3),
+        "runs": runs,
+        "routing": pipeline.router.get_stats()
+    }, indent=2))
+
+
+def cmd_warm(args):
+    # Downloads the model into the local cache, stores the rule embeddings and
+    # pays first-call setup, so the next analyze run starts from cached artifacts
+    started = time.perf_counter()
+    pipeline = CompliancePipeline(args.rules, args.resources, args.config, use_claude=False, verbose=False)
+    pipeline.match_clauses(["warm-up clause"])
+    print(f"✅ {EMBEDDING_MODEL} loaded and {len(pipeline.rules)} rules embedded in "
+          f"{time.perf_counter() - started:.2f}s")
+
+
+def main(argv=None):
+    """Command line entry point; runs 'analyze' when no command is given"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--rules", default=RULE_FILE, help="QCB rulebook JSON")
+    common.add_argument("--resources", default=RESOURCE_FILE, help="Programs and experts JSON")
+    common.add_argument("--config", default=CONFIG_FILE, help="Pipeline config JSON")
+    common.add_argument("--clauses", default=CLAUSE_FILE, help="Startup clauses JSON, or JSONL with one clause per line")
+    common.add_argument("--documents", nargs="+", metavar="PATH",
+                        help="Segment clauses from PDF/DOCX/TXT files or directories instead of --clauses")
+    common.add_argument("--no-claude", action="store_true", help="Disable the Claude fallback")
+
+    parser = argparse.ArgumentParser(prog="aix", description="QCB compliance clause pipeline")
+    commands = parser.add_subparsers(dest="command")
+
+    analyze = commands.add_parser("analyze", parents=[common], help="Analyze clauses and write the report")
+    analyze.add_argument("--output", default=OUTPUT_FILE, help="Report JSON path")
+    analyze.add_argument("--quiet", action="store_true", help="Only print the final summary")
+    analyze.add_argument("--jsonl", help="Stream results to this JSONL file; --output then gets the summary only")
+    analyze.add_argument("--resume", action="store_true", help="Skip clauses already in the --jsonl file")
+    analyze.set_defaults(handler=cmd_analyze)
+
+    bench = commands.add_parser("bench", parents=[common], help="Time repeated runs in one process")
+    bench.add_argument("--repeat", type=int, default=3, help="Runs to time")
+    bench.add_argument("--scale", type=int, default=1, help="Repeat the clause list this many times")
+    bench.set_defaults(handler=cmd_bench)
+
+    warm = commands.add_parser("warm", parents=[common], help="Download and load the embedding model")
+    warm.set_defaults(handler=cmd_warm)
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in commands.choices and argv[0] not in ("-h", "--help"):
+        argv = ["analyze"] + argv
+    args = parser.parse_args(argv)
+    if args.command == "analyze" and args.resume and not args.jsonl:
+        parser.error("--resume requires --jsonl")
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
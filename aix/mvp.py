@@ -1,7 +1,13 @@
 import json
+import pathlib
+import sys
 from sentence_transformers import SentenceTransformer, util
 import numpy as np
 
+# Shared on-disk rule embedding store
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "backend"))
+import embedding_store
+
 # Load rules (regulatory framework)
 with open("rules.json", "r", encoding="utf-8") as f:
     rules = json.load(f)
@@ -17,9 +23,11 @@ with open("resources.json", "r", encoding="utf-8") as f:
 # Load embedding model
 model = SentenceTransformer('all-MiniLM-L6-v2')
 
-# Precompute embeddings for rules
+# Precompute embeddings for rules, reused across runs until rules.json changes
 rule_texts = [r['text'] for r in rules]
-rule_embeddings = model.encode(rule_texts, convert_to_tensor=True)
+rule_embeddings = embedding_store.load_or_build(
+    "aix-mvp-rules", "all-MiniLM-L6-v2", [r['ref'] for r in rules], rule_texts, encode=model.encode
+)
 
 # Threshold for semantic similarity
 SIM_THRESHOLD = 0.7
@@ -28,7 +36,7 @@ results = []
 
 for clause in clauses:
     clause_text = clause['clause']
-    clause_embedding = model.encode(clause_text, convert_to_tensor=True)
+    clause_embedding = model.encode(clause_text)
     
     # Compute cosine similarity
     cosine_scores = util.cos_sim(clause_embedding, rule_embeddings)[0].cpu().numpy()
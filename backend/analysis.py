@@ -0,0 +1,433 @@
+"""
+Analysis module shared by the Flask (app.py) and ASGI (asgi_app.py) backends.
+Holds the gap analysis prompts and model routing, the CPU-bound steps around
+the Claude call (prepare_analysis and finalize_analysis), the mapping of
+analysis failures to HTTP responses and the startup data loading.
+
+Importing it creates no web app, Anthropic client or background thread;
+each entry point builds its own.
+"""
+
+import os
+import logging
+import time
+from dotenv import load_dotenv
+from anthropic import APIError
+
+import numpy as np
+
+from rag import search, embed_texts, get_chunk_embeddings
+from rules import load_rules, get_rules_text, get_rules_summary, get_rule_embeddings, select_relevant_rules
+from scoring import get_detailed_score_breakdown
+from rule_engine import evaluate_with_hints, format_hints
+from recommender import recommend, load_resources, get_all_programs, get_all_experts, get_resource_embeddings
+import llm_limiter
+import llm_resilience
+import llm_cassette
+import singleflight
+import metrics
+import precomputed
+from schemas import GapAnalysis, REPORT_GAPS_TOOL
+from model_router import ModelRouter
+from token_budget import (
+    ANALYSIS_INPUT_TOKEN_BUDGET,
+    SUMMARY_MAX_TOKENS,
+    accounting,
+    count_tokens,
+    fit_evidence,
+    truncate_to_tokens
+)
+
+# Model and routing settings below are read from the environment
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Largest accepted request body (uploads)
+MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max file size
+
+# Claude model used for gap analysis
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+
+# Fast model tried first for easy analyses (few rules, strong retrieval matches)
+FAST_CLAUDE_MODEL = os.getenv("FAST_CLAUDE_MODEL", "claude-3-5-haiku-20241022")
+ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "False") == "True"
+ROUTE_FAST_MIN_SIMILARITY = float(os.getenv("ROUTE_FAST_MIN_SIMILARITY", "0.5"))
+ROUTE_FAST_MAX_RULES = int(os.getenv("ROUTE_FAST_MAX_RULES", "5"))
+ROUTE_ESCALATE_BELOW_CONFIDENCE = float(os.getenv("ROUTE_ESCALATE_BELOW_CONFIDENCE", "0.6"))
+
+analysis_router = ModelRouter(
+    FAST_CLAUDE_MODEL if ROUTING_ENABLED else None,
+    CLAUDE_MODEL,
+    escalate_below_confidence=ROUTE_ESCALATE_BELOW_CONFIDENCE
+)
+
+# System prompt for Claude
+SYSTEM_PROMPT = """You are an expert compliance analyst specializing in Qatar Central Bank (QCB) fintech regulations.
+
+Your task is to analyze startup documentation and compare it against QCB regulatory requirements.
+
+Report your findings by calling the report_gaps tool. Each gap has a brief title,
+the QCB regulation reference, the evidence (what the startup currently has or lacks),
+a clear explanation of the compliance gap, and a severity of high, medium or low.
+Use notes for additional observations, and set confidence to your overall
+confidence in the analysis from 0 to 1.
+
+Severity guidelines:
+- HIGH: Critical requirement missing or major non-compliance (e.g., no data residency, no compliance officer)
+- MEDIUM: Important requirement partially met or unclear (e.g., AML policy exists but not board-approved)
+- LOW: Minor gaps or documentation issues (e.g., missing specific procedures, unclear policies)
+
+Be thorough but fair. If evidence suggests compliance, don't create artificial gaps.
+"""
+
+# User prompt for gap analysis
+ANALYSIS_PROMPT_TEMPLATE = """
+STARTUP DOCUMENTATION EXCERPTS:
+{context_text}
+
+STARTUP DECLARED SUMMARY:
+{startup_summary}
+
+QCB REGULATORY REQUIREMENTS:
+{rules_text}
+
+Analyze the startup's compliance status and identify gaps. Report them with the report_gaps tool.
+"""
+
+EVIDENCE_SEPARATOR = "\n\n---\n\n"
+
+# Output tokens requested for a gap analysis
+ANALYSIS_MAX_TOKENS = 2000
+
+# Endpoints whose span timings are logged with the request ID
+TRACED_ENDPOINTS = ("/upload", "/analyze")
+
+
+class AnalysisError(Exception):
+    """Analysis failure that maps to a specific HTTP error response."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Expected analysis failures, mapped to responses by analysis_error_response()
+ANALYSIS_ERRORS = (
+    AnalysisError,
+    llm_limiter.LimiterRejected,
+    llm_resilience.CircuitOpenError,
+    llm_cassette.CassetteMiss,
+    singleflight.WaitTimeout,
+    APIError
+)
+
+
+
+def prepare_analysis(startup_summary: str) -> dict:
+    """
+    Retrieve evidence, resolve checkable rules locally and build the Claude
+    request for the remaining relevant rules.
+
+    This is the CPU-bound part of an analysis (query embedding and search).
+
+    Args:
+        startup_summary: Startup description provided by the user
+
+    Returns:
+        Dictionary with the messages.create 'request' arguments without
+        the model (None when every relevant rule was resolved locally), the
+        'contexts' and 'relevant_rules' used to build it, the 'local_results',
+        'use_fast', whether the analysis is easy enough for the fast model,
+        and the prompt's 'token_accounting'
+
+    Raises:
+        AnalysisError: If the prompt exceeds the input budget even without
+            any document evidence
+    """
+    # Cap user input before it reaches retrieval or the prompt
+    startup_summary, summary_truncated = truncate_to_tokens(startup_summary, SUMMARY_MAX_TOKENS)
+    if summary_truncated:
+        logger.info(f"Summary truncated to {SUMMARY_MAX_TOKENS} tokens")
+
+    # Retrieve relevant document chunks, best match first
+    search_results = search(startup_summary, k=10)
+    contexts = [chunk for _, chunk, _ in search_results]
+
+    # Keep only the QCB rules relevant to the evidence and summary
+    evidence_embeddings = np.vstack([
+        get_chunk_embeddings([metadata["vector_id"] for _, _, metadata in search_results]),
+        embed_texts([startup_summary])
+    ])
+    # Rules the deterministic engine decided unambiguously (in practice,
+    # failed checks) are not sent to Claude; its undecided findings and
+    # single-condition passes go into the prompt as hints
+    with metrics.timed("rule_engine"):
+        local_results, local_hints = evaluate_with_hints([startup_summary] + contexts)
+    with metrics.timed("rule_selection"):
+        relevant_rules = [
+            rule for rule in select_relevant_rules(evidence_embeddings)
+            if rule["ref"] not in local_results
+        ]
+    metrics.inc("rules_resolved_total", len(local_results), resolver="local")
+    metrics.inc("rules_resolved_total", len(relevant_rules), resolver="llm")
+    if local_results:
+        logger.info(f"Resolved {len(local_results)} rules locally: {', '.join(local_results)}")
+
+    if not relevant_rules:
+        logger.info("All relevant rules resolved locally, skipping Claude")
+        return {
+            "request": None,
+            "contexts": contexts,
+            "relevant_rules": relevant_rules,
+            "local_results": local_results,
+            "use_fast": False,
+            "token_accounting": None
+        }
+
+    prompt_started = time.perf_counter()
+    rules_text = get_rules_text(relevant_rules)
+    hints_text = format_hints(local_hints, [rule["ref"] for rule in relevant_rules])
+    if hints_text:
+        rules_text = f"{rules_text}\n\n{hints_text}"
+
+    # Preflight: fixed prompt parts first, then as much evidence as still fits
+    parts = {
+        "system_tokens": count_tokens(SYSTEM_PROMPT) + count_tokens(REPORT_GAPS_TOOL),
+        "template_tokens": count_tokens(
+            ANALYSIS_PROMPT_TEMPLATE.format(context_text="", startup_summary="", rules_text="")
+        ),
+        "rules_tokens": count_tokens(rules_text),
+        "summary_tokens": count_tokens(startup_summary)
+    }
+    available = ANALYSIS_INPUT_TOKEN_BUDGET - sum(parts.values())
+    if available < 0:
+        raise AnalysisError(
+            f"Analysis input exceeds the {ANALYSIS_INPUT_TOKEN_BUDGET} token budget. "
+            "Please shorten the summary.", 413
+        )
+
+    evidence, parts["evidence_tokens"] = fit_evidence(contexts, available, EVIDENCE_SEPARATOR)
+    metrics.inc("evidence_chunks_dropped_total", len(contexts) - len(evidence))
+    if len(evidence) < len(contexts):
+        logger.info(f"Dropped {len(contexts) - len(evidence)} lowest-ranked chunks to fit the token budget")
+
+    token_accounting = accounting(
+        parts,
+        ANALYSIS_INPUT_TOKEN_BUDGET,
+        ANALYSIS_MAX_TOKENS,
+        evidence_chunks_used=len(evidence),
+        evidence_chunks_dropped=len(contexts) - len(evidence),
+        summary_truncated=summary_truncated
+    )
+
+    # Construct prompt
+    prompt = ANALYSIS_PROMPT_TEMPLATE.format(
+        context_text=EVIDENCE_SEPARATOR.join(evidence),
+        startup_summary=startup_summary,
+        rules_text=rules_text
+    )
+    metrics.record_stage("prompt_build", time.perf_counter() - prompt_started)
+
+    logger.info(
+        f"Sending prompt to Claude (~{token_accounting['total_input_tokens']} tokens, "
+        f"budget {ANALYSIS_INPUT_TOKEN_BUDGET})"
+    )
+
+    # Strong retrieval matches and few rules to judge make an easy analysis
+    top_similarity = search_results[0][0] if search_results else 0.0
+    use_fast = top_similarity >= ROUTE_FAST_MIN_SIMILARITY and len(relevant_rules) <= ROUTE_FAST_MAX_RULES
+
+    return {
+        "request": {
+            "system": SYSTEM_PROMPT,
+            "max_tokens": ANALYSIS_MAX_TOKENS,
+            "temperature": 0,
+            "messages": [{"role": "user", "content": prompt}]
+        },
+        "contexts": evidence,
+        "relevant_rules": relevant_rules,
+        "local_results": local_results,
+        "use_fast": use_fast,
+        "token_accounting": token_accounting
+    }
+
+
+def finalize_analysis(analysis: GapAnalysis, prepared: dict, route: dict) -> dict:
+    """
+    Score the gaps, generate recommendations and build the response.
+
+    Args:
+        analysis: Validated gap analysis from Claude
+        prepared: Output of prepare_analysis()
+        route: Model route taken (None if Claude was not called)
+
+    Returns:
+        JSON-serializable analysis response
+    """
+    local_results = prepared["local_results"]
+    # Claude's gaps only duplicate a failed local check; a local pass never
+    # overrides them
+    failed = {rule_ref for rule_ref, result in local_results.items() if result["status"] == "fail"}
+    gaps = local_gaps(local_results) + [
+        gap.model_dump() for gap in analysis.gaps
+        if gap.rule_ref not in failed
+    ]
+    notes = analysis.notes
+
+    # Calculate score and breakdown
+    score_breakdown = get_detailed_score_breakdown(gaps)
+
+    # Generate recommendations
+    recommendations = recommend(gaps)
+
+    # Prepare response
+    response = {
+        "success": True,
+        "score": score_breakdown["final_score"],
+        "grade": score_breakdown["grade"],
+        "category": score_breakdown["category"],
+        "color": score_breakdown["color"],
+        "needs_expert_review": score_breakdown["needs_expert_review"],
+        "gaps": gaps,
+        "gap_count": len(gaps),
+        "score_breakdown": score_breakdown,
+        "recommendations": recommendations,
+        "notes": notes,
+        "context_chunks_used": len(prepared["contexts"]),
+        "rules_considered": len(prepared["relevant_rules"]),
+        "rules_resolved_locally": len(local_results),
+        "local_checks": list(local_results.values()),
+        "model_route": route,
+        "token_accounting": prepared["token_accounting"]
+    }
+
+    logger.info(
+        f"Analysis complete: Score={response['score']}, "
+        f"Gaps={len(gaps)}, Recommendations={len(recommendations)}"
+    )
+
+    return response
+
+
+def local_gaps(local_results: dict) -> list:
+    """
+    Convert failed local rule checks into gaps.
+
+    Args:
+        local_results: Resolutions from rule_engine.evaluate()
+
+    Returns:
+        List of gap dictionaries in the report_gaps format
+    """
+    titles = {rule["ref"]: rule["title"] for rule in load_rules()}
+    return [
+        {
+            "title": titles.get(result["rule_ref"], result["rule_ref"]),
+            "rule_ref": result["rule_ref"],
+            "evidence": result["evidence"],
+            "explanation": result["explanation"],
+            "severity": result["severity"]
+        }
+        for result in local_results.values()
+        if result["status"] == "fail"
+    ]
+
+
+def analysis_error_response(error: Exception):
+    """
+    Map an analysis failure to an HTTP error response.
+
+    Args:
+        error: Exception raised while running an analysis
+
+    Returns:
+        Tuple of (payload, status_code, headers), or None if the error is
+        not an expected analysis failure
+    """
+    if isinstance(error, AnalysisError):
+        return {"error": str(error)}, error.status_code, {}
+
+    if isinstance(error, llm_limiter.LimiterRejected):
+        logger.warning(f"LLM limiter rejected analysis: {str(error)}")
+        return {
+            "error": str(error),
+            "code": "RATE_LIMITED",
+            "retry_after": error.retry_after
+        }, 429, {"Retry-After": str(error.retry_after)}
+
+    if isinstance(error, llm_resilience.CircuitOpenError):
+        logger.warning(f"Circuit breaker open, failing fast: {str(error)}")
+        return {
+            "error": str(error),
+            "code": "AI_SERVICE_DEGRADED",
+            "retry_after": error.retry_after
+        }, 503, {"Retry-After": str(error.retry_after)}
+
+    if isinstance(error, singleflight.WaitTimeout):
+        # The identical analysis is still running; a retry can join or reuse it
+        logger.warning(f"Gave up waiting for coalesced analysis: {str(error)}")
+        return {
+            "error": "An identical analysis is still running. Please retry shortly.",
+            "code": "ANALYSIS_TIMEOUT",
+            "retry_after": error.retry_after
+        }, 503, {"Retry-After": str(error.retry_after)}
+
+    if isinstance(error, llm_cassette.CassetteMiss):
+        # A replay gap, not a crash; load tests count these separately
+        logger.warning(f"Cassette miss: {str(error)}")
+        return {
+            "error": str(error),
+            "code": "CASSETTE_MISS"
+        }, 424, {}
+
+    if isinstance(error, APIError):
+        logger.error(f"Anthropic API error: {str(error)}")
+        return {"error": f"AI service error: {str(error)}"}, 503, {}
+
+    return None
+
+
+def rules_payload() -> dict:
+    """Build the /rules response body."""
+    rules = load_rules()
+    return {
+        "rules": rules,
+        "summary": get_rules_summary(rules)
+    }
+
+
+def resources_payload() -> dict:
+    """Build the /resources response body."""
+    resources = load_resources()
+    programs = resources.get("qdb_programs", [])
+    experts = resources.get("compliance_experts", [])
+    return {
+        "programs": programs,
+        "experts": experts,
+        "total_programs": len(programs),
+        "total_experts": len(experts)
+    }
+
+
+def load_data():
+    """
+    Load rules and resources with their embeddings and precomputed
+    responses, logging (not raising) errors.
+    """
+    try:
+        rules = load_rules()
+        logger.info(f"Loaded {len(rules)} rules on startup")
+        get_rule_embeddings()
+        precomputed.get("rules", rules_payload)
+    except Exception as e:
+        logger.error(f"Failed to load rules: {e}")
+
+    try:
+        programs = get_all_programs()
+        experts = get_all_experts()
+        logger.info(f"Loaded {len(programs)} programs and {len(experts)} experts on startup")
+        get_resource_embeddings()
+        precomputed.get("resources", resources_payload)
+    except Exception as e:
+        logger.error(f"Failed to load resources: {e}")
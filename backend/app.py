@@ -4,18 +4,40 @@ Provides endpoints for document upload, analysis, and recommendations.
 """
 
 import os
-import json
+import functools
 import logging
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
-from anthropic import Anthropic, APIError
 from werkzeug.exceptions import RequestEntityTooLarge
 
-from rag import build_index, search, get_index_stats, clear_index
-from rules import load_rules, get_rules_text, get_rules_summary
-from scoring import compute_score, get_detailed_score_breakdown
-from recommender import recommend, get_all_programs, get_all_experts, search_resources
+from rag import build_index, get_index_stats, get_memory_stats, clear_index
+from rules import get_rules_text
+from recommender import search_resources
+from analysis import (
+    ANALYSIS_ERRORS,
+    CLAUDE_MODEL,
+    MAX_CONTENT_LENGTH,
+    TRACED_ENDPOINTS,
+    AnalysisError,
+    analysis_error_response,
+    analysis_router,
+    finalize_analysis,
+    load_data,
+    prepare_analysis,
+    resources_payload,
+    rules_payload
+)
+import singleflight
+import llm_limiter
+import llm_resilience
+import llm_cassette
+import metrics
+import debug_tools
+import precomputed
+import hot_reload
+from schemas import GapAnalysis, REPORT_GAPS_TOOL
 
 # Load environment variables
 load_dotenv()
@@ -29,49 +51,78 @@ logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Request-ID", "Server-Timing"])
 
 # Configuration
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-# Initialize Anthropic client
+# Initialize Anthropic client (live, or record/replay against a cassette)
 anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
-if not anthropic_api_key:
+client = llm_cassette.create_client(anthropic_api_key)
+if client is None:
     logger.warning("ANTHROPIC_API_KEY not found in environment. Analysis endpoint will be disabled.")
-    client = None
 else:
-    client = Anthropic(api_key=anthropic_api_key)
-    logger.info("Anthropic client initialized successfully")
+    logger.info(f"Anthropic client initialized successfully ({llm_cassette.LLM_MODE} mode)")
+
+
+@app.before_request
+def start_request_trace():
+    """Start the span trace and request ID of this request."""
+    g.trace, g.trace_token = metrics.start_trace(request.headers.get("X-Request-ID"))
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Observe request latency, add trace headers and keep this worker's metrics published."""
+    trace = g.get("trace")
+    if trace is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe(
+            "request_duration_seconds",
+            trace.elapsed(),
+            endpoint=endpoint,
+            method=request.method,
+            status=response.status_code
+        )
+        response.headers["X-Request-ID"] = trace.request_id
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["Timing-Allow-Origin"] = "*"
+        if endpoint in TRACED_ENDPOINTS:
+            logger.info(f"Request {trace.request_id} {request.method} {endpoint} {response.status_code} "
+                        f"timings: {response.headers['Server-Timing']}")
+    metrics.ensure_flusher()
+    return response
+
+
+@app.teardown_request
+def end_request_trace(error=None):
+    """Stop tracing once the request is done."""
+    token = g.pop("trace_token", None)
+    if token is not None:
+        metrics.end_trace(token)
+
+
+def with_timings(payload: dict) -> dict:
+    """
+    Add the request's span breakdown to a response when asked for.
 
-# System prompt for Claude
-SYSTEM_PROMPT = """You are an expert compliance analyst specializing in Qatar Central Bank (QCB) fintech regulations.
+    Args:
+        payload: JSON response body
 
-Your task is to analyze startup documentation and compare it against QCB regulatory requirements.
+    Returns:
+        payload, or a copy with a 'timings' field if the request has
+        ?timings=1
+    """
+    trace = metrics.current_trace()
+    if trace is None or request.args.get("timings") not in ("1", "true"):
+        return payload
+    return {**payload, "timings": trace.to_dict()}
 
-You must return ONLY valid JSON in this exact format:
-{
-  "gaps": [
-    {
-      "title": "Brief gap title",
-      "rule_ref": "QCB regulation reference",
-      "evidence": "What the startup currently has (or lacks)",
-      "explanation": "Clear explanation of the compliance gap",
-      "severity": "high|medium|low"
-    }
-  ],
-  "notes": [
-    "Additional observation 1",
-    "Additional observation 2"
-  ]
-}
-
-Severity guidelines:
-- HIGH: Critical requirement missing or major non-compliance (e.g., no data residency, no compliance officer)
-- MEDIUM: Important requirement partially met or unclear (e.g., AML policy exists but not board-approved)
-- LOW: Minor gaps or documentation issues (e.g., missing specific procedures, unclear policies)
-
-Be thorough but fair. If evidence suggests compliance, don't create artificial gaps.
-"""
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage timings and counters of all workers in Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route('/health', methods=['GET'])
@@ -81,7 +132,11 @@ def health_check():
         "status": "healthy",
         "claude_configured": client is not None,
         "api_key_present": anthropic_api_key is not None,
-        "index_stats": get_index_stats()
+        "llm_mode": llm_cassette.LLM_MODE,
+        "index_stats": get_index_stats(),
+        "llm_limiter": llm_limiter.get_limiter_stats(),
+        "llm_resilience": llm_resilience.get_resilience_stats(),
+        "model_routing": analysis_router.get_stats()
     })
 
 
@@ -117,11 +172,11 @@ def upload_files():
             stats = build_index(files_data)
             logger.info(f"Index built: {stats}")
 
-            return jsonify({
+            return jsonify(with_timings({
                 "success": True,
                 "message": f"Successfully indexed {stats['files_processed']} files",
                 **stats
-            })
+            }))
 
         except ValueError as e:
             logger.error(f"Indexing error: {str(e)}")
@@ -142,6 +197,7 @@ def upload_files():
         }), 500
 
 
+
 @app.route('/analyze', methods=['POST'])
 def analyze_compliance():
     """
@@ -152,6 +208,9 @@ def analyze_compliance():
       "summary": "Startup description and key facts"
     }
 
+    Identical concurrent requests (same summary, documents and rules) are
+    coalesced into a single Claude call and share its result.
+
     Returns compliance analysis with gaps, score, and recommendations.
     """
     try:
@@ -180,106 +239,80 @@ def analyze_compliance():
         startup_summary = data["summary"]
         logger.info(f"Analyzing startup with summary: {startup_summary[:100]}...")
 
-        # Retrieve relevant document chunks
-        search_results = search(startup_summary, k=10)
-        contexts = [chunk for _, chunk, _ in search_results]
-        context_text = "\n\n---\n\n".join(contexts)
-
-        # Get QCB rules
-        rules_text = get_rules_text()
+        analysis_key = singleflight.make_key(
+            startup_summary, stats["fingerprint"], get_rules_text(), CLAUDE_MODEL, analysis_router.fast_model
+        )
 
-        # Construct prompt
-        prompt = f"""
-STARTUP DOCUMENTATION EXCERPTS:
-{context_text}
-
-STARTUP DECLARED SUMMARY:
-{startup_summary}
+        try:
+            started = time.perf_counter()
+            response, coalesced = singleflight.do(
+                analysis_key, lambda: run_analysis(startup_summary)
+            )
+        except ANALYSIS_ERRORS as e:
+            payload, status_code, headers = analysis_error_response(e)
+            return jsonify(payload), status_code, headers
 
-QCB REGULATORY REQUIREMENTS:
-{rules_text}
+        metrics.inc("cache_requests_total", cache="analysis_singleflight", result="hit" if coalesced else "miss")
+        if coalesced:
+            metrics.record_stage("coalesced_wait", time.perf_counter() - started)
+            logger.info(f"Served coalesced analysis result {analysis_key[:12]}")
 
-Analyze the startup's compliance status and identify gaps. Return valid JSON only.
-"""
+        return jsonify(with_timings(response))
 
-        logger.info(f"Sending prompt to Claude (length: {len(prompt)} chars)")
+    except Exception as e:
+        logger.error(f"Analysis error: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
-        # Call Claude API
-        try:
-            message = client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                system=SYSTEM_PROMPT,
-                max_tokens=2000,
-                temperature=0,
-                messages=[{"role": "user", "content": prompt}]
-            )
 
-            response_text = message.content[0].text
-            logger.info(f"Received Claude response (length: {len(response_text)} chars)")
+def run_analysis(startup_summary: str) -> dict:
+    """
+    Run retrieval, Claude gap analysis, scoring and recommendations.
 
-            # Parse JSON response
-            try:
-                analysis_data = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse Claude response as JSON: {e}")
-                logger.error(f"Response text: {response_text[:500]}")
-                return jsonify({
-                    "error": "Failed to parse AI response. Please try again."
-                }), 500
+    Args:
+        startup_summary: Startup description provided by the user
 
-            gaps = analysis_data.get("gaps", [])
-            notes = analysis_data.get("notes", [])
+    Returns:
+        JSON-serializable analysis response
 
-            # Calculate score and breakdown
-            score_breakdown = get_detailed_score_breakdown(gaps)
+    Raises:
+        AnalysisError: If the AI response cannot be used
+        LimiterRejected: If the outbound LLM limiter cannot admit the call
+        CircuitOpenError: If the Claude circuit breaker is open
+        APIError: If the Anthropic API call fails
+    """
+    prepared = prepare_analysis(startup_summary)
 
-            # Generate recommendations
-            recommendations = recommend(gaps)
+    if prepared["request"] is None:
+        return finalize_analysis(GapAnalysis(), prepared, None)
 
-            # Prepare response
-            response = {
-                "success": True,
-                "score": score_breakdown["final_score"],
-                "grade": score_breakdown["grade"],
-                "category": score_breakdown["category"],
-                "color": score_breakdown["color"],
-                "needs_expert_review": score_breakdown["needs_expert_review"],
-                "gaps": gaps,
-                "gap_count": len(gaps),
-                "score_breakdown": score_breakdown,
-                "recommendations": recommendations,
-                "notes": notes,
-                "context_chunks_used": len(contexts)
-            }
-
-            logger.info(
-                f"Analysis complete: Score={response['score']}, "
-                f"Gaps={len(gaps)}, Recommendations={len(recommendations)}"
+    # Call Claude with the report_gaps tool; invalid output gets a repair pass
+    # and invalid or low-confidence fast-model output escalates
+    try:
+        with metrics.timed("llm_call"):
+            analysis, route = analysis_router.create(
+                client, GapAnalysis, REPORT_GAPS_TOOL, use_fast=prepared["use_fast"], **prepared["request"]
             )
+    except ValueError as e:
+        logger.error(f"Failed to get a valid gap analysis from Claude: {e}")
+        raise AnalysisError("Failed to parse AI response. Please try again.", 500)
 
-            return jsonify(response)
+    return finalize_analysis(analysis, prepared, route)
 
-        except APIError as e:
-            logger.error(f"Anthropic API error: {str(e)}")
-            return jsonify({
-                "error": f"AI service error: {str(e)}"
-            }), 503
 
-    except Exception as e:
-        logger.error(f"Analysis error: {str(e)}", exc_info=True)
-        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+
+def precomputed_response(name: str, build_payload):
+    """Serve a precomputed JSON payload, honoring If-None-Match and Accept-Encoding."""
+    body, status_code, headers = precomputed.get(name, build_payload).respond(
+        request.headers.get("Accept-Encoding"), request.headers.get("If-None-Match")
+    )
+    return Response(body, status=status_code, headers=headers, content_type="application/json")
 
 
 @app.route('/rules', methods=['GET'])
 def get_rules():
     """Get all QCB regulatory rules."""
     try:
-        rules = load_rules()
-        summary = get_rules_summary()
-        return jsonify({
-            "rules": rules,
-            "summary": summary
-        })
+        return precomputed_response("rules", rules_payload)
     except Exception as e:
         logger.error(f"Error loading rules: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -289,14 +322,7 @@ def get_rules():
 def get_resources():
     """Get all QDB programs and compliance experts."""
     try:
-        programs = get_all_programs()
-        experts = get_all_experts()
-        return jsonify({
-            "programs": programs,
-            "experts": experts,
-            "total_programs": len(programs),
-            "total_experts": len(experts)
-        })
+        return precomputed_response("resources", resources_payload)
     except Exception as e:
         logger.error(f"Error loading resources: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -334,6 +360,87 @@ def clear_data():
         return jsonify({"error": str(e)}), 500
 
 
+def admin_only(view):
+    """Serve a debug endpoint only when enabled and given the admin token."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        status_code = debug_tools.check_access(request.headers)
+        if status_code == 404:
+            return jsonify({"error": "Endpoint not found"}), 404
+        if status_code == 403:
+            return jsonify({"error": "Admin token required"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.route('/admin/debug/profile', methods=['GET'])
+@admin_only
+def debug_profile():
+    """
+    Sample the CPU stacks of this worker's other threads.
+
+    Query parameters: seconds (default 10), interval_ms (default 5) and
+    format, 'collapsed' (default, for flamegraph.pl or speedscope) or 'json'.
+    The worker needs spare threads (gunicorn --threads or the ASGI app) to
+    serve the traffic being profiled; a single-threaded worker answers 409.
+    """
+    try:
+        seconds = float(request.args.get("seconds", 10))
+        interval_ms = float(request.args.get("interval_ms", 5))
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+
+    output_format = request.args.get("format", "collapsed")
+    if output_format not in ("collapsed", "json"):
+        return jsonify({"error": "format must be 'collapsed' or 'json'"}), 400
+
+    try:
+        stacks, rounds = debug_tools.sample_profile(
+            seconds, interval_ms, concurrent=request.environ.get("wsgi.multithread", False)
+        )
+    except (debug_tools.NothingToProfile, debug_tools.ProfilerBusy) as e:
+        return jsonify({"error": str(e)}), 409
+
+    if output_format == "json":
+        return jsonify(debug_tools.summarize_profile(stacks, rounds))
+    return Response(debug_tools.format_collapsed(stacks), content_type="text/plain; charset=utf-8")
+
+
+@app.route('/admin/debug/memory/snapshot', methods=['POST'])
+@admin_only
+def debug_memory_snapshot():
+    """
+    Take a tracemalloc snapshot of this worker and diff it with the previous one.
+
+    Query parameters: limit (default 25) and group_by ('lineno', 'filename'
+    or 'traceback'). The first call starts tracemalloc.
+    """
+    try:
+        return jsonify(debug_tools.memory_snapshot(
+            limit=int(request.args.get("limit", 25)),
+            group_by=request.args.get("group_by", "lineno")
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/admin/debug/memory/stop', methods=['POST'])
+@admin_only
+def debug_memory_stop():
+    """Stop tracemalloc in this worker."""
+    return jsonify(debug_tools.stop_tracemalloc())
+
+
+@app.route('/admin/debug/memory/rag', methods=['GET'])
+@admin_only
+def debug_memory_rag():
+    """Get the memory held by this worker's index globals and its RSS."""
+    return jsonify({
+        "process": debug_tools.process_memory(),
+        "rag": get_memory_stats()
+    })
+
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors."""
@@ -347,21 +454,16 @@ def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 
-if __name__ == '__main__':
-    # Load rules and resources on startup to check for errors
-    try:
-        rules = load_rules()
-        logger.info(f"Loaded {len(rules)} rules on startup")
-    except Exception as e:
-        logger.error(f"Failed to load rules: {e}")
+# Load rules and resources and embed them once per process, so the first
+# /analyze in a gunicorn worker doesn't pay for it (workers import this module)
+load_data()
 
-    try:
-        programs = get_all_programs()
-        experts = get_all_experts()
-        logger.info(f"Loaded {len(programs)} programs and {len(experts)} experts on startup")
-    except Exception as e:
-        logger.error(f"Failed to load resources: {e}")
+# Reload rules.json and resources.json when they change; gunicorn workers
+# import this module and each watches the files for its own caches
+hot_reload.start()
 
+
+if __name__ == '__main__':
     # Run app
     port = int(os.getenv("PORT", 5000))
     logger.info(f"Starting Flask server on port {port}")
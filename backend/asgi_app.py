@@ -0,0 +1,626 @@
+"""
+ASGI backend API for Fintech Regulatory Readiness Platform.
+Serves the same endpoints as app.py on an event loop: Claude calls use the
+AsyncAnthropic client and CPU-bound RAG work runs on a thread pool, so a
+worker keeps serving other requests while analyses wait on the LLM.
+
+Usage:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000 --workers 2
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 2 --bind 0.0.0.0:5000 asgi_app:app
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from analysis import (
+    ANALYSIS_ERRORS,
+    CLAUDE_MODEL,
+    MAX_CONTENT_LENGTH,
+    TRACED_ENDPOINTS,
+    AnalysisError,
+    analysis_error_response,
+    analysis_router,
+    finalize_analysis,
+    load_data,
+    prepare_analysis,
+    resources_payload,
+    rules_payload
+)
+from rag import build_index, get_index_stats, get_memory_stats, clear_index
+from rules import get_rules_text
+from recommender import search_resources
+import singleflight
+import llm_limiter
+import llm_resilience
+import llm_cassette
+import metrics
+import debug_tools
+import precomputed
+import hot_reload
+from schemas import GapAnalysis, REPORT_GAPS_TOOL
+
+logger = logging.getLogger(__name__)
+
+# Threads for embedding, FAISS and parsing work. The RAG index lives in this
+# process's memory, so a process pool could not search it.
+CPU_WORKERS = int(os.getenv("ASGI_CPU_WORKERS", "4"))
+_cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="rag")
+
+# Threads that wait on cross-worker singleflight locks, one per distinct
+# in-flight analysis. Kept off the default executor, which asyncio also uses
+# for DNS lookups of the Anthropic connection.
+MAX_PENDING_ANALYSES = int(os.getenv("ASGI_MAX_PENDING_ANALYSES", "64"))
+_coalesce_executor = ThreadPoolExecutor(max_workers=MAX_PENDING_ANALYSES, thread_name_prefix="singleflight")
+
+# Initialize Anthropic client (live, or record/replay against a cassette)
+anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
+client = llm_cassette.create_client(anthropic_api_key, async_client=True)
+if client is None:
+    logger.warning("ANTHROPIC_API_KEY not found in environment. Analysis endpoint will be disabled.")
+else:
+    logger.info(f"Async Anthropic client initialized successfully ({llm_cassette.LLM_MODE} mode)")
+
+# In-flight analyses in this worker keyed by singleflight key
+_inflight_analyses = {}
+
+
+async def run_in_cpu_pool(fn, *args):
+    """Run a CPU-bound function on the RAG thread pool."""
+    loop = asyncio.get_running_loop()
+    # Carry the request trace into the pool thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_cpu_executor, partial(context.run, fn, *args))
+
+
+class RequestEntityTooLarge(Exception):
+    """Raised by the body size limit when a request body exceeds MAX_CONTENT_LENGTH."""
+
+
+FILE_TOO_LARGE = {
+    "error": "File too large. Maximum size is 50MB per file.",
+    "code": "FILE_TOO_LARGE",
+    "max_size_mb": 50
+}
+
+
+class BodySizeLimitMiddleware:
+    """
+    Answer 413 for request bodies over MAX_CONTENT_LENGTH.
+
+    A Content-Length over the limit is refused before the body is read.
+    Chunked or unlabelled bodies are counted while the endpoint reads them;
+    past the limit the read fails and the endpoint's own response is
+    replaced by the 413.
+    """
+
+    def __init__(self, app, max_size: int = MAX_CONTENT_LENGTH):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_size:
+            await self.too_large(send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    exceeded = True
+                    raise RequestEntityTooLarge(f"Request body exceeds {self.max_size} bytes")
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except RequestEntityTooLarge:
+            pass
+        if exceeded and not started:
+            logger.warning(f"Rejected {scope['path']} request body over {self.max_size} bytes")
+            await self.too_large(send)
+
+    @staticmethod
+    async def too_large(send):
+        body = json.dumps(FILE_TOO_LARGE).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+async def record_request_metrics(request: Request, call_next):
+    """Trace the request, observe its latency and keep this worker's metrics published."""
+    trace, token = metrics.start_trace(request.headers.get("x-request-id"))
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.end_trace(token)
+
+    endpoint = request.url.path if request.url.path in ROUTE_PATHS else "unmatched"
+    metrics.observe(
+        "request_duration_seconds",
+        trace.elapsed(),
+        endpoint=endpoint,
+        method=request.method,
+        status=response.status_code
+    )
+    response.headers["X-Request-ID"] = trace.request_id
+    response.headers["Server-Timing"] = trace.server_timing()
+    response.headers["Timing-Allow-Origin"] = "*"
+    if endpoint in TRACED_ENDPOINTS:
+        logger.info(f"Request {trace.request_id} {request.method} {endpoint} {response.status_code} "
+                    f"timings: {response.headers['Server-Timing']}")
+    metrics.ensure_flusher()
+    return response
+
+
+def with_timings(request: Request, payload: dict) -> dict:
+    """
+    Add the request's span breakdown to a response when asked for.
+
+    Args:
+        request: Incoming request
+        payload: JSON response body
+
+    Returns:
+        payload, or a copy with a 'timings' field if the request has
+        ?timings=1
+    """
+    trace = metrics.current_trace()
+    if trace is None or request.query_params.get("timings") not in ("1", "true"):
+        return payload
+    return {**payload, "timings": trace.to_dict()}
+
+
+async def metrics_endpoint(request: Request):
+    """Stage timings and counters of all workers in Prometheus text format."""
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def health_check(request: Request):
+    """Health check endpoint."""
+    return JSONResponse({
+        "status": "healthy",
+        "claude_configured": client is not None,
+        "api_key_present": anthropic_api_key is not None,
+        "llm_mode": llm_cassette.LLM_MODE,
+        "index_stats": get_index_stats(),
+        "llm_limiter": llm_limiter.get_limiter_stats(),
+        "llm_resilience": llm_resilience.get_resilience_stats(),
+        "model_routing": analysis_router.get_stats()
+    })
+
+
+async def upload_files(request: Request):
+    """
+    Upload and index documents.
+
+    Accepts multipart/form-data with one or more files.
+    Returns indexing statistics.
+    """
+    try:
+        logger.info("Received upload request")
+
+        # Bodies over MAX_CONTENT_LENGTH are answered 413 by BodySizeLimitMiddleware
+        form = await request.form()
+        uploads = [value for _, value in form.multi_items() if isinstance(value, UploadFile)]
+
+        # Check if files were provided
+        if not uploads:
+            return JSONResponse({"error": "No files provided"}, status_code=400)
+
+        # Collect all files
+        files_data = []
+        for file in uploads:
+            if file.filename:
+                file_bytes = await file.read()
+                files_data.append((file_bytes, file.filename))
+                logger.info(f"Received file: {file.filename} ({len(file_bytes)} bytes)")
+
+        if not files_data:
+            return JSONResponse({"error": "No valid files found"}, status_code=400)
+
+        # Build index
+        try:
+            stats = await run_in_cpu_pool(build_index, files_data)
+            logger.info(f"Index built: {stats}")
+
+            return JSONResponse(with_timings(request, {
+                "success": True,
+                "message": f"Successfully indexed {stats['files_processed']} files",
+                **stats
+            }))
+
+        except ValueError as e:
+            logger.error(f"Indexing error: {str(e)}")
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.error(f"Upload error: {str(e)}", exc_info=True)
+        return JSONResponse({
+            "error": f"Upload failed: {str(e)}",
+            "code": "UPLOAD_ERROR"
+        }, status_code=500)
+
+
+async def analyze_compliance(request: Request):
+    """
+    Analyze startup compliance against QCB regulations.
+
+    Expects JSON body with:
+    {
+      "summary": "Startup description and key facts"
+    }
+
+    Identical concurrent requests are coalesced into a single Claude call,
+    within this worker and across workers.
+
+    Returns compliance analysis with gaps, score, and recommendations.
+    """
+    try:
+        logger.info("Received analysis request")
+
+        # Check if Claude is configured
+        if client is None:
+            return JSONResponse({
+                "error": "AI analysis not configured. Please set ANTHROPIC_API_KEY environment variable.",
+                "requires_api_key": True,
+                "code": "MISSING_API_KEY"
+            }, status_code=503)
+
+        # Check if index exists
+        stats = get_index_stats()
+        if not stats["indexed"]:
+            return JSONResponse({
+                "error": "No documents have been uploaded yet. Please upload documents first."
+            }, status_code=400)
+
+        # Parse request
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not data.get("summary"):
+            return JSONResponse({"error": "Missing 'summary' in request body"}, status_code=400)
+
+        startup_summary = data["summary"]
+        logger.info(f"Analyzing startup with summary: {startup_summary[:100]}...")
+
+        analysis_key = singleflight.make_key(
+            startup_summary, stats["fingerprint"], get_rules_text(), CLAUDE_MODEL, analysis_router.fast_model
+        )
+
+        try:
+            started = time.perf_counter()
+            response, coalesced = await coalesced_analysis(analysis_key, startup_summary)
+        except ANALYSIS_ERRORS as e:
+            payload, status_code, headers = analysis_error_response(e)
+            return JSONResponse(payload, status_code=status_code, headers=headers)
+
+        metrics.inc("cache_requests_total", cache="analysis_singleflight", result="hit" if coalesced else "miss")
+        if coalesced:
+            metrics.record_stage("coalesced_wait", time.perf_counter() - started)
+            logger.info(f"Served coalesced analysis result {analysis_key[:12]}")
+
+        return JSONResponse(with_timings(request, response))
+
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.error(f"Analysis error: {str(e)}", exc_info=True)
+        return JSONResponse({"error": f"Analysis failed: {str(e)}"}, status_code=500)
+
+
+async def coalesced_analysis(key: str, startup_summary: str):
+    """
+    Run an analysis once for all concurrent requests with the same key.
+
+    Requests in this worker await one shared task, which keeps running if the
+    request that started it disconnects. The task goes through singleflight
+    so identical analyses in other workers are coalesced as well.
+
+    Args:
+        key: singleflight key of the analysis inputs
+        startup_summary: Startup description provided by the user
+
+    Returns:
+        Tuple of (response, shared) where shared is True if the result was
+        computed for another request
+    """
+    task = _inflight_analyses.get(key)
+    shared = task is not None
+
+    if task is None:
+        loop = asyncio.get_running_loop()
+
+        def run_leader():
+            # Blocks a coordination thread, not the event loop, while another
+            # worker or the analysis coroutine produces the result
+            future = asyncio.run_coroutine_threadsafe(run_analysis(startup_summary), loop)
+            return future.result()
+
+        # The leader's spans go to the request that started the analysis
+        context = contextvars.copy_context()
+        task = asyncio.ensure_future(
+            loop.run_in_executor(_coalesce_executor, context.run, singleflight.do, key, run_leader)
+        )
+        _inflight_analyses[key] = task
+
+        def forget(done):
+            _inflight_analyses.pop(key, None)
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(forget)
+
+    response, shared_across_processes = await asyncio.shield(task)
+    return response, shared or shared_across_processes
+
+
+async def run_analysis(startup_summary: str) -> dict:
+    """
+    Run retrieval, Claude gap analysis, scoring and recommendations.
+
+    Args:
+        startup_summary: Startup description provided by the user
+
+    Returns:
+        JSON-serializable analysis response
+
+    Raises:
+        AnalysisError: If the AI response cannot be used
+        LimiterRejected: If the outbound LLM limiter cannot admit the call
+        CircuitOpenError: If the Claude circuit breaker is open
+        APIError: If the Anthropic API call fails
+    """
+    prepared = await run_in_cpu_pool(prepare_analysis, startup_summary)
+
+    if prepared["request"] is None:
+        return await run_in_cpu_pool(finalize_analysis, GapAnalysis(), prepared, None)
+
+    # Call Claude with the report_gaps tool; invalid output gets a repair pass
+    # and invalid or low-confidence fast-model output escalates
+    try:
+        with metrics.timed("llm_call"):
+            analysis, route = await analysis_router.acreate(
+                client, GapAnalysis, REPORT_GAPS_TOOL, use_fast=prepared["use_fast"], **prepared["request"]
+            )
+    except ValueError as e:
+        logger.error(f"Failed to get a valid gap analysis from Claude: {e}")
+        raise AnalysisError("Failed to parse AI response. Please try again.", 500)
+
+    return await run_in_cpu_pool(finalize_analysis, analysis, prepared, route)
+
+
+def precomputed_response(request: Request, name: str, build_payload):
+    """Serve a precomputed JSON payload, honoring If-None-Match and Accept-Encoding."""
+    body, status_code, headers = precomputed.get(name, build_payload).respond(
+        request.headers.get("accept-encoding"), request.headers.get("if-none-match")
+    )
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+async def get_rules(request: Request):
+    """Get all QCB regulatory rules."""
+    try:
+        return precomputed_response(request, "rules", rules_payload)
+    except Exception as e:
+        logger.error(f"Error loading rules: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def get_resources(request: Request):
+    """Get all QDB programs and compliance experts."""
+    try:
+        return precomputed_response(request, "resources", resources_payload)
+    except Exception as e:
+        logger.error(f"Error loading resources: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def search_resources_endpoint(request: Request):
+    """Search programs and experts by keyword."""
+    try:
+        data = await request.json()
+        query = data.get("query", "")
+
+        if not query:
+            return JSONResponse({"error": "Missing 'query' parameter"}, status_code=400)
+
+        results = await run_in_cpu_pool(search_resources, query)
+        return JSONResponse(results)
+
+    except Exception as e:
+        logger.error(f"Error searching resources: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def clear_data(request: Request):
+    """Clear indexed documents."""
+    try:
+        clear_index()
+        return JSONResponse({
+            "success": True,
+            "message": "Index cleared successfully"
+        })
+    except Exception as e:
+        logger.error(f"Error clearing index: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+def admin_error(request: Request):
+    """Get the error response for a debug request that may not proceed, or None."""
+    status_code = debug_tools.check_access(request.headers)
+    if status_code == 404:
+        return JSONResponse({"error": "Endpoint not found"}, status_code=404)
+    if status_code == 403:
+        return JSONResponse({"error": "Admin token required"}, status_code=403)
+    return None
+
+
+async def debug_profile(request: Request):
+    """
+    Sample the CPU stacks of this worker's threads, including the event loop.
+
+    Query parameters: seconds (default 10), interval_ms (default 5) and
+    format, 'collapsed' (default, for flamegraph.pl or speedscope) or 'json'.
+    """
+    error = admin_error(request)
+    if error is not None:
+        return error
+
+    try:
+        seconds = float(request.query_params.get("seconds", 10))
+        interval_ms = float(request.query_params.get("interval_ms", 5))
+    except ValueError:
+        return JSONResponse({"error": "seconds and interval_ms must be numbers"}, status_code=400)
+
+    output_format = request.query_params.get("format", "collapsed")
+    if output_format not in ("collapsed", "json"):
+        return JSONResponse({"error": "format must be 'collapsed' or 'json'"}, status_code=400)
+
+    # Sample from a thread so the event loop keeps serving the traffic being profiled
+    loop = asyncio.get_running_loop()
+    try:
+        stacks, rounds = await loop.run_in_executor(None, debug_tools.sample_profile, seconds, interval_ms)
+    except (debug_tools.NothingToProfile, debug_tools.ProfilerBusy) as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+
+    if output_format == "json":
+        return JSONResponse(debug_tools.summarize_profile(stacks, rounds))
+    return Response(debug_tools.format_collapsed(stacks), media_type="text/plain")
+
+
+async def debug_memory_snapshot(request: Request):
+    """
+    Take a tracemalloc snapshot of this worker and diff it with the previous one.
+
+    Query parameters: limit (default 25) and group_by ('lineno', 'filename'
+    or 'traceback'). The first call starts tracemalloc.
+    """
+    error = admin_error(request)
+    if error is not None:
+        return error
+
+    try:
+        limit = int(request.query_params.get("limit", 25))
+        group_by = request.query_params.get("group_by", "lineno")
+        return JSONResponse(await run_in_cpu_pool(debug_tools.memory_snapshot, limit, group_by))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+
+async def debug_memory_stop(request: Request):
+    """Stop tracemalloc in this worker."""
+    error = admin_error(request)
+    if error is not None:
+        return error
+    return JSONResponse(debug_tools.stop_tracemalloc())
+
+
+async def debug_memory_rag(request: Request):
+    """Get the memory held by this worker's index globals and its RSS."""
+    error = admin_error(request)
+    if error is not None:
+        return error
+    return JSONResponse({
+        "process": debug_tools.process_memory(),
+        "rag": get_memory_stats()
+    })
+
+
+async def not_found(request: Request, exc: HTTPException):
+    """Handle 404 errors."""
+    return JSONResponse({"error": "Endpoint not found"}, status_code=404)
+
+
+async def internal_error(request: Request, exc: Exception):
+    """Handle 500 errors."""
+    logger.error(f"Internal error: {str(exc)}")
+    return JSONResponse({"error": "Internal server error"}, status_code=500)
+
+
+async def startup():
+    """Load rules and resources on startup to check for errors."""
+    # Embedding runs on the RAG pool; the loop isn't serving requests yet
+    await run_in_cpu_pool(load_data)
+    hot_reload.start()
+
+
+async def shutdown():
+    _cpu_executor.shutdown(wait=False)
+    _coalesce_executor.shutdown(wait=False)
+    if client is not None:
+        await client.close()
+
+
+routes = [
+    Route("/health", health_check, methods=["GET"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+    Route("/upload", upload_files, methods=["POST"]),
+    Route("/analyze", analyze_compliance, methods=["POST"]),
+    Route("/rules", get_rules, methods=["GET"]),
+    Route("/resources", get_resources, methods=["GET"]),
+    Route("/resources/search", search_resources_endpoint, methods=["POST"]),
+    Route("/clear", clear_data, methods=["POST"]),
+    Route("/admin/debug/profile", debug_profile, methods=["GET"]),
+    Route("/admin/debug/memory/snapshot", debug_memory_snapshot, methods=["POST"]),
+    Route("/admin/debug/memory/stop", debug_memory_stop, methods=["POST"]),
+    Route("/admin/debug/memory/rag", debug_memory_rag, methods=["GET"])
+]
+
+# Known paths used as the endpoint label; anything else is "unmatched"
+ROUTE_PATHS = {route.path for route in routes}
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=["X-Request-ID", "Server-Timing"]),
+        Middleware(BaseHTTPMiddleware, dispatch=record_request_metrics),
+        Middleware(BodySizeLimitMiddleware)
+    ],
+    exception_handlers={
+        404: not_found,
+        500: internal_error
+    },
+    on_startup=[startup],
+    on_shutdown=[shutdown]
+)
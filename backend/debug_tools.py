@@ -0,0 +1,296 @@
+"""
+Production debugging module.
+Backs the admin-only /admin/debug endpoints: a time-boxed sampling CPU
+profiler of the serving worker with collapsed-stack output, tracemalloc
+snapshots diffed against the previous one, and memory sizes of the RAG
+globals. Everything is off unless DEBUG_ENDPOINTS_ENABLED=True and an
+ADMIN_TOKEN is set.
+"""
+
+import collections
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Dict, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows development machines
+    resource = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEBUG_ENDPOINTS_ENABLED = os.getenv("DEBUG_ENDPOINTS_ENABLED", "False") == "True"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Longest CPU profile a request may ask for
+PROFILE_MAX_SECONDS = float(os.getenv("DEBUG_PROFILE_MAX_SECONDS", "30"))
+PROFILE_MIN_INTERVAL_MS = 1.0
+
+# Stack depth recorded per allocation once tracemalloc is started
+TRACEMALLOC_FRAMES = int(os.getenv("DEBUG_TRACEMALLOC_FRAMES", "10"))
+
+if DEBUG_ENDPOINTS_ENABLED and not ADMIN_TOKEN:
+    logger.warning("DEBUG_ENDPOINTS_ENABLED is set without ADMIN_TOKEN; debug endpoints stay disabled")
+
+# One profile per process at a time; overlapping samplers skew each other
+_profile_lock = threading.Lock()
+
+_snapshot_lock = threading.Lock()
+_last_snapshot = None
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is already running in this worker."""
+
+
+class NothingToProfile(RuntimeError):
+    """Raised when no other thread of this worker can serve requests meanwhile."""
+
+
+def check_access(headers) -> Optional[int]:
+    """
+    Check whether a request may use the debug endpoints.
+
+    The token is read from 'Authorization: Bearer <token>' or 'X-Admin-Token'.
+
+    Args:
+        headers: Request headers (Flask or Starlette)
+
+    Returns:
+        None if allowed, else the HTTP status to answer with (404 while the
+        endpoints are disabled, 403 for a missing or wrong token)
+    """
+    if not DEBUG_ENDPOINTS_ENABLED or not ADMIN_TOKEN:
+        return 404
+
+    token = headers.get("X-Admin-Token", "")
+    authorization = headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+
+    if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        return 403
+    return None
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_profile(seconds: float, interval_ms: float = 5.0,
+                   concurrent: bool = True) -> Tuple[collections.Counter, int]:
+    """
+    Sample the stacks of every other thread in this process.
+
+    Args:
+        seconds: Profile duration, capped at PROFILE_MAX_SECONDS
+        interval_ms: Time between samples, at least PROFILE_MIN_INTERVAL_MS
+        concurrent: Whether the worker serves other requests while this one
+            runs (False for a gunicorn sync worker without --threads)
+
+    Returns:
+        Tuple of (Counter of root-first stack tuples, number of sampling rounds)
+
+    Raises:
+        NothingToProfile: If no other thread could serve traffic meanwhile;
+            the profile would be empty and only block the worker
+        ProfilerBusy: If another profile is running in this worker
+    """
+    if not concurrent or threading.active_count() == 1:
+        raise NothingToProfile(
+            "This worker serves one request at a time, so there is nothing to profile; "
+            "run gunicorn with --threads or use the ASGI app"
+        )
+
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    interval = max(interval_ms, PROFILE_MIN_INTERVAL_MS) / 1000.0
+
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker")
+
+    try:
+        logger.info(f"Profiling worker {os.getpid()} for {seconds:.1f}s every {interval * 1000:.0f}ms")
+        own_thread = threading.get_ident()
+        stacks = collections.Counter()
+        rounds = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                stacks[tuple(reversed(stack))] += 1
+            rounds += 1
+            time.sleep(interval)
+        return stacks, rounds
+    finally:
+        _profile_lock.release()
+
+
+def format_collapsed(stacks: collections.Counter) -> str:
+    """
+    Format sampled stacks as collapsed stacks ('a;b;c count' per line), as
+    read by flamegraph.pl, speedscope and inferno.
+
+    Args:
+        stacks: Output of sample_profile()
+
+    Returns:
+        Collapsed stack text, most frequent stack first
+    """
+    return "".join(
+        f"{';'.join(frame.replace(';', ':') for frame in stack)} {count}\n"
+        for stack, count in stacks.most_common()
+    )
+
+
+def summarize_profile(stacks: collections.Counter, rounds: int, limit: int = 25) -> Dict:
+    """
+    Summarize sampled stacks per function.
+
+    Args:
+        stacks: Output of sample_profile()
+        rounds: Sampling rounds taken
+        limit: Functions to list
+
+    Returns:
+        Dictionary with sample counts and the top functions by self and
+        total samples
+    """
+    self_counts = collections.Counter()
+    total_counts = collections.Counter()
+    for stack, count in stacks.items():
+        # The last frame is the one executing; a thread's own name is not a function
+        if len(stack) > 1:
+            self_counts[stack[-1]] += count
+        for frame in set(stack[1:]):
+            total_counts[frame] += count
+
+    samples = sum(stacks.values())
+    return {
+        "pid": os.getpid(),
+        "rounds": rounds,
+        "samples": samples,
+        "top_self": [
+            {"function": frame, "samples": count, "percent": round(100.0 * count / samples, 1)}
+            for frame, count in self_counts.most_common(limit)
+        ],
+        "top_total": [
+            {"function": frame, "samples": count, "percent": round(100.0 * count / samples, 1)}
+            for frame, count in total_counts.most_common(limit)
+        ]
+    }
+
+
+def memory_snapshot(limit: int = 25, group_by: str = "lineno") -> Dict:
+    """
+    Take a tracemalloc snapshot and diff it against the previous one.
+
+    The first call starts tracemalloc and returns no statistics; later calls
+    report the largest allocation sites and the growth since the last call.
+
+    Args:
+        limit: Allocation sites to list
+        group_by: tracemalloc grouping ('lineno', 'filename' or 'traceback')
+
+    Returns:
+        Dictionary with traced memory totals, 'top' allocation sites and
+        'diff' against the previous snapshot
+
+    Raises:
+        ValueError: If group_by is invalid
+    """
+    global _last_snapshot
+
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise ValueError(f"Invalid group_by '{group_by}', expected lineno, filename or traceback")
+
+    with _snapshot_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _last_snapshot = _take_snapshot()
+            logger.info(f"tracemalloc started in worker {os.getpid()} with {TRACEMALLOC_FRAMES} frames")
+            return {
+                "pid": os.getpid(),
+                "tracing_started": True,
+                "message": "tracemalloc started; take another snapshot to see allocations and growth"
+            }
+
+        snapshot = _take_snapshot()
+        previous, _last_snapshot = _last_snapshot, snapshot
+
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "pid": os.getpid(),
+        "tracing_started": False,
+        "traced_current_mb": round(current / 1024 / 1024, 2),
+        "traced_peak_mb": round(peak / 1024 / 1024, 2),
+        "top": [
+            {"site": _stat_site(stat), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics(group_by)[:limit]
+        ],
+        "diff": [
+            {
+                "site": _stat_site(stat),
+                "size_kb": round(stat.size / 1024, 1),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count_diff": stat.count_diff
+            }
+            for stat in snapshot.compare_to(previous, group_by)[:limit]
+        ]
+    }
+
+
+def stop_tracemalloc() -> Dict:
+    """Stop tracemalloc and drop the stored snapshot."""
+    global _last_snapshot
+    with _snapshot_lock:
+        was_tracing = tracemalloc.is_tracing()
+        tracemalloc.stop()
+        _last_snapshot = None
+    return {"pid": os.getpid(), "stopped": was_tracing}
+
+
+def _take_snapshot():
+    # Leave out tracemalloc's own bookkeeping and import machinery
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+    ))
+
+
+def _stat_site(stat) -> str:
+    return " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback)
+
+
+def process_memory() -> Dict:
+    """
+    Get memory figures of this worker process.
+
+    Returns:
+        Dictionary with peak RSS (and current RSS where /proc is available)
+    """
+    stats = {"pid": os.getpid()}
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        stats["max_rss_mb"] = round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        stats["rss_mb"] = round(rss_pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    return stats
@@ -0,0 +1,172 @@
+"""
+Embedding store module.
+Keeps rule embeddings on disk as an .npy array plus a JSON manifest (model
+name, row ids and a content hash), so processes that embed the same rulebook
+with the same model load the array instead of encoding it again. The array
+file is named after the content hash, so a changed rulebook or model finds
+no array and the artifact is rebuilt.
+
+Usage:
+    embeddings = embedding_store.load_or_build(
+        "rules", "all-MiniLM-L6-v2", ids, texts, encode=embed_texts
+    )
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import re
+import tempfile
+import threading
+from datetime import datetime
+from typing import Callable, List
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shared by every process on the host; "" disables the store
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "fintech-embeddings"))
+
+# Bump when the artifact layout changes
+FORMAT_VERSION = 2
+
+
+def content_hash(model_name: str, ids: List[str], texts: List[str]) -> str:
+    """
+    Hash everything an embedding array depends on.
+
+    Args:
+        model_name: Embedding model name
+        ids: Row ids (e.g. rule references)
+        texts: Texts that were encoded, row-aligned with ids
+
+    Returns:
+        Hex digest
+    """
+    payload = json.dumps(
+        {"version": FORMAT_VERSION, "model": model_name, "rows": list(zip(ids, texts))},
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _paths(name: str, digest: str):
+    directory = pathlib.Path(EMBEDDING_CACHE_DIR)
+    return directory / f"{name}-{digest[:16]}.npy", directory / f"{name}.json"
+
+
+def load(name: str, model_name: str, ids: List[str], texts: List[str]) -> np.ndarray:
+    """
+    Load stored embeddings if they match the model and texts.
+
+    Args:
+        name: Artifact name (e.g. 'rules')
+        model_name: Embedding model name
+        ids: Row ids
+        texts: Texts to embed, row-aligned with ids
+
+    Returns:
+        Array of shape (len(texts), dimension), or None when missing or stale
+    """
+    if not EMBEDDING_CACHE_DIR:
+        return None
+
+    # The array for these exact texts, whatever the manifest says meanwhile
+    array_path, _ = _paths(name, content_hash(model_name, ids, texts))
+    try:
+        embeddings = np.load(array_path, allow_pickle=False)
+    except FileNotFoundError:
+        logger.info(f"No stored '{name}' embeddings for this model and texts")
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read stored '{name}' embeddings: {e}")
+        return None
+
+    if embeddings.shape[0] != len(ids):
+        logger.warning(f"Stored '{name}' embeddings have {embeddings.shape[0]} rows, expected {len(ids)}")
+        return None
+    return embeddings
+
+
+def save(name: str, model_name: str, ids: List[str], texts: List[str], embeddings: np.ndarray):
+    """
+    Store embeddings with their manifest.
+
+    The array is renamed into place under its content hash, so a reader
+    only ever loads an array built from the texts it asked for; the
+    manifest describes the latest array. Arrays of other content are
+    removed afterwards.
+
+    Args:
+        name: Artifact name
+        model_name: Embedding model name
+        ids: Row ids
+        texts: Encoded texts, row-aligned with ids
+        embeddings: Array of shape (len(texts), dimension)
+    """
+    if not EMBEDDING_CACHE_DIR:
+        return
+
+    digest = content_hash(model_name, ids, texts)
+    array_path, manifest_path = _paths(name, digest)
+    manifest = {
+        "name": name,
+        "model": model_name,
+        "content_hash": digest,
+        "array": array_path.name,
+        "ids": list(ids),
+        "rows": int(embeddings.shape[0]),
+        "dimension": int(embeddings.shape[1]) if embeddings.ndim > 1 else 0,
+        "dtype": str(embeddings.dtype),
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+    suffix = f".{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        array_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_array = array_path.with_name(array_path.name + suffix)
+        with open(temp_array, "wb") as f:
+            np.save(f, embeddings, allow_pickle=False)
+        os.replace(temp_array, array_path)
+
+        temp_manifest = manifest_path.with_name(manifest_path.name + suffix)
+        temp_manifest.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(temp_manifest, manifest_path)
+
+        # Earlier arrays of this artifact, including the unhashed version 1 layout
+        array_name = re.compile(rf"{re.escape(name)}(-[0-9a-f]{{16}})?\.npy")
+        for stale in array_path.parent.glob(f"{name}*.npy"):
+            if stale != array_path and array_name.fullmatch(stale.name):
+                stale.unlink(missing_ok=True)
+        logger.info(f"Stored {manifest['rows']} '{name}' embeddings in {array_path.parent}")
+    except OSError as e:
+        logger.warning(f"Could not store '{name}' embeddings in {array_path.parent}: {e}")
+
+
+def load_or_build(name: str, model_name: str, ids: List[str], texts: List[str],
+                  encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+    """
+    Load stored embeddings, or encode the texts and store the result.
+
+    Args:
+        name: Artifact name, one per text recipe (e.g. 'rules')
+        model_name: Embedding model name
+        ids: Row ids
+        texts: Texts to embed, row-aligned with ids
+        encode: Called with texts on a miss; returns a numpy array
+
+    Returns:
+        Array of shape (len(texts), dimension)
+    """
+    embeddings = load(name, model_name, ids, texts)
+    if embeddings is not None:
+        logger.info(f"Loaded {len(ids)} '{name}' embeddings from {EMBEDDING_CACHE_DIR}")
+        return embeddings
+
+    embeddings = np.asarray(encode(texts))
+    save(name, model_name, ids, texts, embeddings)
+    return embeddings
@@ -0,0 +1,243 @@
+"""
+Local fake Anthropic Messages API server for resilience and load testing.
+Serves POST /v1/messages with canned responses, configurable latency and
+injected failures. Point a client at it with ANTHROPIC_BASE_URL.
+
+Usage:
+    python fake_anthropic.py --port 8089 --latency-ms 800 --error-rate 0.1
+    ANTHROPIC_BASE_URL=http://localhost:8089 ANTHROPIC_API_KEY=fake python app.py
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Canned gap analysis returned for /analyze-style prompts
+DEFAULT_ANALYSIS = {
+    "gaps": [
+        {
+            "title": "Data hosting outside Qatar",
+            "rule_ref": "QCB 2.1.1",
+            "evidence": "Customer data is hosted with a cloud provider outside Qatar",
+            "explanation": "PII and transactional data must be stored on servers located in Qatar",
+            "severity": "high"
+        },
+        {
+            "title": "Compliance Officer not appointed",
+            "rule_ref": "QCB 2.2.1",
+            "evidence": "No dedicated Compliance Officer is named in the documents",
+            "explanation": "An independent Compliance Officer must be approved by QCB before licensing",
+            "severity": "high"
+        },
+        {
+            "title": "AML/CFT policy not board-approved",
+            "rule_ref": "QCB 1.1.4",
+            "evidence": "AML policy is in draft",
+            "explanation": "A board-approved AML/CFT policy is mandatory before licensing",
+            "severity": "medium"
+        }
+    ],
+    "notes": ["Response generated by the local fake Anthropic server"],
+    "confidence": 0.85
+}
+
+# Canned clause mapping returned for aix pipeline prompts
+DEFAULT_MAPPING = {
+    "mapped_rule": "QCB 2.1.1",
+    "compliance": "no",
+    "reason": "Fake server response",
+    "confidence": 0.8,
+    "action_required": "Review against the mapped rule"
+}
+
+
+class FakeAnthropicConfig:
+    """Behaviour knobs shared by all request handler threads."""
+
+    def __init__(self, latency_ms: float = 0, latency_jitter_ms: float = 0,
+                 error_rate: float = 0.0, error_status: int = 529,
+                 malformed_rate: float = 0.0, response: Dict = None):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.response = response
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    def count_request(self) -> int:
+        with self._lock:
+            self.requests_served += 1
+            return self.requests_served
+
+
+def _build_message(request_body: Dict, config: FakeAnthropicConfig) -> Dict:
+    """Build a Messages API response for the request."""
+    system = request_body.get("system") or ""
+    if isinstance(system, list):
+        system = " ".join(block.get("text", "") for block in system)
+
+    tools = request_body.get("tools") or []
+    tool_choice = request_body.get("tool_choice") or {}
+    tool_name = tool_choice.get("name") or (tools[0]["name"] if tools else None)
+
+    if config.response is not None:
+        payload = config.response
+    elif tool_name == "map_clause" or "mapped_rule" in system:
+        payload = DEFAULT_MAPPING
+    else:
+        payload = DEFAULT_ANALYSIS
+
+    malformed = random.random() < config.malformed_rate
+
+    if tool_name:
+        tool_input = json.loads(json.dumps(payload))
+        if malformed:
+            # Drop a required field so the caller's repair pass is exercised
+            if tool_input.get("gaps"):
+                tool_input["gaps"][0].pop("severity", None)
+            else:
+                tool_input.pop("compliance", None)
+        content = [{"type": "tool_use", "id": f"toolu_fake_{uuid.uuid4().hex[:16]}",
+                    "name": tool_name, "input": tool_input}]
+        stop_reason = "tool_use"
+        output_text = json.dumps(tool_input)
+    else:
+        output_text = json.dumps(payload)
+        if malformed:
+            output_text = f"Here is the analysis you asked for:\n{output_text}"
+        content = [{"type": "text", "text": output_text}]
+        stop_reason = "end_turn"
+
+    input_tokens = len(json.dumps(request_body)) // 4
+    return {
+        "id": f"msg_fake_{uuid.uuid4().hex[:16]}",
+        "type": "message",
+        "role": "assistant",
+        "model": request_body.get("model", "fake-model"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": len(output_text) // 4}
+    }
+
+
+def _make_handler(config: FakeAnthropicConfig):
+    class FakeAnthropicHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send_json(self, status: int, body: Dict, headers: Dict = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                request_body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"type": "error", "error": {
+                    "type": "invalid_request_error", "message": "Invalid JSON body"}})
+                return
+
+            if self.path.rstrip("/") != "/v1/messages":
+                self._send_json(404, {"type": "error", "error": {
+                    "type": "not_found_error", "message": f"Unknown path {self.path}"}})
+                return
+
+            config.count_request()
+
+            delay_ms = max(0.0, random.gauss(config.latency_ms, config.latency_jitter_ms))
+            time.sleep(delay_ms / 1000.0)
+
+            if random.random() < config.error_rate:
+                self._send_json(config.error_status, {"type": "error", "error": {
+                    "type": "overloaded_error", "message": "Injected failure"}},
+                    headers={"retry-after": "1"})
+                return
+
+            self._send_json(200, _build_message(request_body, config))
+
+    return FakeAnthropicHandler
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0,
+                      config: FakeAnthropicConfig = None) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the fake server on a background thread.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        config: Latency and failure configuration
+
+    Returns:
+        Tuple of (server, base_url); call server.shutdown() to stop it
+    """
+    config = config or FakeAnthropicConfig()
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Fake Anthropic server listening on {base_url}")
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--latency-jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=529)
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Fraction of responses with prose around the JSON, "
+                             "or an invalid tool input when tools are used")
+    parser.add_argument("--response-file", help="JSON file returned as the model output")
+    args = parser.parse_args()
+
+    response = None
+    if args.response_file:
+        with open(args.response_file, "r", encoding="utf-8") as f:
+            response = json.load(f)
+
+    config = FakeAnthropicConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        malformed_rate=args.malformed_rate,
+        response=response
+    )
+    server, _ = start_fake_server(args.host, args.port, config)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Hot reload module.
+Polls rules.json and resources.json for changes and, when one changes,
+validates it and swaps the new data and its derived caches (rule and
+resource embeddings, keyword and search indexes, precomputed /rules and
+/resources responses) in place, so the rulebook or program catalog can be
+updated without restarting workers and dropping their warm models.
+
+A file that fails validation is logged and the current data stays in
+service until the file changes again.
+
+Usage:
+    hot_reload.start()  # once per process, after the startup loads
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+import precomputed
+import recommender
+import rules
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between file checks; 0 disables the watcher
+DATA_RELOAD_INTERVAL = float(os.getenv("DATA_RELOAD_INTERVAL", "5"))
+
+# Watched files: precomputed response name -> (path, reload function)
+WATCHED = {
+    "rules": (rules.RULES_PATH, rules.reload_rules),
+    "resources": (recommender.RESOURCES_PATH, recommender.reload_resources)
+}
+
+_lock = threading.Lock()
+_thread = None
+
+# Last seen (mtime, size) per watched name
+_signatures: Dict[str, tuple] = {}
+
+
+def _signature(path) -> tuple:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def check() -> List[str]:
+    """
+    Reload every watched file that changed since the last check.
+
+    The first check of a file only records its state, since the data was
+    loaded at startup.
+
+    Returns:
+        Names of the files that were reloaded
+    """
+    reloaded = []
+    with _lock:
+        for name, (path, reload) in WATCHED.items():
+            signature = _signature(path)
+            previous = _signatures.get(name, signature)
+            _signatures[name] = signature
+            if signature == previous or signature is None:
+                continue
+
+            if _reload(name, reload):
+                reloaded.append(name)
+    return reloaded
+
+
+def _reload(name: str, reload: Callable) -> bool:
+    try:
+        reload()
+    except Exception as e:
+        logger.error(f"Not reloading {name}, keeping the current data: {e}")
+        return False
+
+    # Rebuilt from the new data on the next request
+    precomputed.invalidate(name)
+    logger.info(f"Hot reloaded {name}")
+    return True
+
+
+def _watch(interval: float):
+    while True:
+        try:
+            check()
+        except Exception as e:
+            logger.error(f"Data file check failed: {e}")
+        time.sleep(interval)
+
+
+def start(interval: float = None) -> bool:
+    """
+    Start the background watcher for this process (no-op if running).
+
+    Args:
+        interval: Seconds between checks (defaults to DATA_RELOAD_INTERVAL)
+
+    Returns:
+        True if a watcher is running
+    """
+    global _thread
+
+    interval = DATA_RELOAD_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return False
+
+    with _lock:
+        if _thread is None:
+            # Current state is the baseline; data loaded before this is current
+            for name, (path, _) in WATCHED.items():
+                _signatures[name] = _signature(path)
+            _thread = threading.Thread(target=_watch, args=(interval,), name="hot-reload", daemon=True)
+            _thread.start()
+            logger.info(f"Watching {', '.join(WATCHED)} data files every {interval:g}s")
+    return True
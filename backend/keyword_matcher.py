@@ -0,0 +1,112 @@
+"""
+Keyword matcher module.
+An Aho-Corasick automaton over labelled keyword lists: one pass over a text
+finds every label with a keyword occurring in it, with the same substring
+semantics as `keyword in text.lower()` but independent of how many
+keywords there are.
+
+Usage:
+    matcher = KeywordMatcher({"aml": ["aml", "anti-money laundering"], "cyber": ["security"]})
+    matcher.find_labels("Draft AML policy")  # {'aml'}
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton mapping keyword occurrences to their labels."""
+
+    def __init__(self, keywords_by_label: Dict[str, Iterable[str]]):
+        """
+        Compile the automaton.
+
+        Args:
+            keywords_by_label: Label -> keywords; keywords are matched
+                case-insensitively and may belong to several labels
+        """
+        # State 0 is the root; each state has goto edges, a failure link and
+        # the labels and keywords of every keyword ending there
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._labels: List[Set[str]] = [set()]
+        self._keywords: List[Set[str]] = [set()]
+
+        for label, keywords in keywords_by_label.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword:
+                    state = self._add(keyword)
+                    self._labels[state].add(label)
+                    self._keywords[state].add(keyword)
+
+        self._link()
+
+    def _add(self, keyword: str) -> int:
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._labels.append(set())
+                self._keywords.append(set())
+                self._goto[state][char] = next_state
+            state = next_state
+        return state
+
+    def _link(self):
+        # Breadth-first, so a state's failure target is finished before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._labels[child] |= self._labels[self._fail[child]]
+                self._keywords[child] |= self._keywords[self._fail[child]]
+
+    def _states(self, text: str):
+        state = 0
+        for char in text.lower():
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            yield state
+
+    def find_labels(self, text: str) -> Set[str]:
+        """
+        Get the labels with at least one keyword occurring in the text.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            Set of labels
+        """
+        found = set()
+        for state in self._states(text):
+            if self._labels[state]:
+                found |= self._labels[state]
+        return found
+
+    def find_keywords(self, text: str) -> Set[str]:
+        """
+        Get the keywords occurring in the text.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            Set of lower-cased keywords
+        """
+        found = set()
+        for state in self._states(text):
+            if self._keywords[state]:
+                found |= self._keywords[state]
+        return found
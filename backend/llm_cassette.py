@@ -0,0 +1,267 @@
+"""
+Record/replay module for Anthropic calls.
+Wraps the Anthropic client so Messages API calls can be recorded to a JSONL
+cassette and served back offline, with optional injected latency, for
+benchmarking and reproducing issues without an API key.
+
+Modes (LLM_MODE):
+    live    Call the API directly (default)
+    record  Call the API and append every request/response to LLM_CASSETTE
+    replay  Serve responses from LLM_CASSETTE; no API key or network needed
+
+Usage:
+    LLM_MODE=record LLM_CASSETTE=cassettes/analyze.jsonl python app.py
+    LLM_MODE=replay LLM_CASSETTE=cassettes/analyze.jsonl LLM_REPLAY_LATENCY=normal:800,200 python app.py
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from anthropic import Anthropic, AsyncAnthropic
+from anthropic.types import Message
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows development machines
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LLM_MODE = os.getenv("LLM_MODE", "live")
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "cassettes/llm.jsonl")
+
+# Replay latency: "recorded", "none", "fixed:<ms>", "uniform:<min>,<max>",
+# "normal:<mean>,<stddev>" or "lognormal:<median>,<sigma>"
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "none")
+
+MODES = ("live", "record", "replay")
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when no recording matches a request."""
+
+
+def create_client(api_key: str = None, mode: str = None, cassette: str = None,
+                  latency: str = None, async_client: bool = False):
+    """
+    Build the Anthropic client for the configured mode.
+
+    Args:
+        api_key: Anthropic API key (not needed for replay)
+        mode: live, record or replay (defaults to LLM_MODE)
+        cassette: Cassette path (defaults to LLM_CASSETTE)
+        latency: Replay latency spec (defaults to LLM_REPLAY_LATENCY)
+        async_client: Build an AsyncAnthropic-compatible client
+
+    Returns:
+        Client exposing messages.create, or None in live/record mode
+        without an API key
+
+    Raises:
+        ValueError: If the mode or latency spec is invalid
+    """
+    mode = mode or LLM_MODE
+    if mode not in MODES:
+        raise ValueError(f"Invalid LLM_MODE '{mode}', expected one of {', '.join(MODES)}")
+
+    inner = None
+    if mode != "replay":
+        if not api_key:
+            return None
+        # Retries are handled by llm_resilience, not the SDK
+        client_cls = AsyncAnthropic if async_client else Anthropic
+        inner = client_cls(api_key=api_key, max_retries=0)
+        if mode == "live":
+            return inner
+
+    store = Cassette(cassette or LLM_CASSETTE, load=mode == "replay")
+    sampler = latency_sampler(latency or LLM_REPLAY_LATENCY)
+    client_cls = AsyncCassetteClient if async_client else CassetteClient
+    logger.info(f"LLM client in {mode} mode using cassette {store.path}")
+    return client_cls(mode, store, inner, sampler)
+
+
+def request_key(kwargs: Dict) -> str:
+    """
+    Hash a messages.create request.
+
+    Args:
+        kwargs: messages.create arguments
+
+    Returns:
+        Hex SHA-256 digest of the canonical JSON encoding
+    """
+    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def latency_sampler(spec: str):
+    """
+    Parse a replay latency spec.
+
+    Args:
+        spec: none, recorded, fixed:<ms>, uniform:<min>,<max>,
+            normal:<mean>,<stddev> or lognormal:<median>,<sigma>
+
+    Returns:
+        Callable taking the recorded latency in ms (or None) and returning
+        seconds to wait
+
+    Raises:
+        ValueError: If the spec is invalid
+    """
+    kind, _, args = (spec or "none").partition(":")
+    try:
+        values = [float(value) for value in args.split(",")] if args else []
+    except ValueError:
+        raise ValueError(f"Invalid replay latency spec '{spec}'")
+
+    if kind == "none":
+        return lambda recorded_ms: 0.0
+    if kind == "recorded":
+        return lambda recorded_ms: (recorded_ms or 0.0) / 1000.0
+    if kind == "fixed" and len(values) == 1:
+        return lambda recorded_ms: values[0] / 1000.0
+    if kind == "uniform" and len(values) == 2:
+        return lambda recorded_ms: random.uniform(*values) / 1000.0
+    if kind == "normal" and len(values) == 2:
+        return lambda recorded_ms: max(0.0, random.gauss(*values)) / 1000.0
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda recorded_ms: median * random.lognormvariate(0, sigma) / 1000.0
+    raise ValueError(f"Invalid replay latency spec '{spec}'")
+
+
+class Cassette:
+    """JSONL store of recorded requests and responses keyed by request hash."""
+
+    def __init__(self, path: str, load: bool = True):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._cursors = {}
+        if load:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping invalid cassette line {line_number} in {self.path}")
+                    continue
+                self._entries.setdefault(entry["key"], []).append(entry)
+
+        logger.info(f"Loaded {sum(len(e) for e in self._entries.values())} recordings from {self.path}")
+
+    def lookup(self, key: str) -> Dict:
+        """
+        Get the next recording for a request, cycling through repeats.
+
+        Raises:
+            CassetteMiss: If the request was never recorded
+        """
+        with self._lock:
+            entries: List[Dict] = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"No cassette recording for request {key[:12]} in {self.path}")
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return entries[cursor % len(entries)]
+
+    def append(self, key: str, kwargs: Dict, message, latency_ms: float):
+        """Record a request and its response."""
+        entry = {
+            "key": key,
+            "model": kwargs.get("model"),
+            "recorded_at": datetime.utcnow().isoformat(),
+            "latency_ms": round(latency_ms, 1),
+            "request": kwargs,
+            "response": message.model_dump(mode="json")
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+
+
+class _Messages:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, **kwargs):
+        return self._owner._create(kwargs)
+
+
+class CassetteClient:
+    """Recording or replaying stand-in for Anthropic; exposes messages.create."""
+
+    def __init__(self, mode: str, cassette: Cassette, inner=None, latency=None):
+        self.mode = mode
+        self.cassette = cassette
+        self.inner = inner
+        self.latency = latency or latency_sampler("none")
+        self.messages = _Messages(self)
+
+    def _create(self, kwargs: Dict):
+        key = request_key(kwargs)
+        if self.mode == "replay":
+            entry = self.cassette.lookup(key)
+            time.sleep(self.latency(entry.get("latency_ms")))
+            return Message.model_validate(entry["response"])
+
+        started = time.monotonic()
+        message = self.inner.messages.create(**kwargs)
+        self.cassette.append(key, kwargs, message, (time.monotonic() - started) * 1000)
+        return message
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+class AsyncCassetteClient(CassetteClient):
+    """Asyncio counterpart of CassetteClient for AsyncAnthropic callers."""
+
+    async def _create(self, kwargs: Dict):
+        key = request_key(kwargs)
+        if self.mode == "replay":
+            entry = self.cassette.lookup(key)
+            await asyncio.sleep(self.latency(entry.get("latency_ms")))
+            return Message.model_validate(entry["response"])
+
+        started = time.monotonic()
+        message = await self.inner.messages.create(**kwargs)
+        self.cassette.append(key, kwargs, message, (time.monotonic() - started) * 1000)
+        return message
+
+    async def close(self):
+        if self.inner is not None:
+            await self.inner.close()
@@ -0,0 +1,492 @@
+"""
+Outbound LLM rate limiting module.
+Bounds concurrent Claude calls and input tokens per minute across threads,
+gunicorn workers and pipeline processes on the same host.
+
+Waiting calls take a ticket and are admitted in ticket order, so a call
+with a deadline can't be starved by later arrivals. Only the head of the
+queue tries to take a slot; calls further back check less often, and the
+shared state file is only rewritten when it changes. Queue depth, in-flight
+calls, wait times and rejections are exported through metrics.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Optional
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows development machines
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Limits shared by every process using the same LLM_LIMITER_DIR
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "40000"))
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+
+LIMITER_DIR = pathlib.Path(
+    os.getenv("LLM_LIMITER_DIR", os.path.join(tempfile.gettempdir(), "fintech-llm-limiter"))
+)
+
+# Rough characters-per-token ratio for English prompts
+CHARS_PER_TOKEN = 4
+
+# How often the head of the queue retries; calls further back wait one more
+# interval per position ahead of them, up to _MAX_POLL_SECONDS
+_POLL_SECONDS = 0.05
+_MAX_POLL_SECONDS = 1.0
+
+# Tickets still queued this long past their deadline are dropped as abandoned
+_TICKET_GRACE_SECONDS = 5.0
+
+# Per-process fallback state when fcntl is unavailable
+_local_lock = threading.Lock()
+_local_state = {}
+_local_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+# Per-process wait statistics
+_stats_lock = threading.Lock()
+_stats = {
+    "acquired": 0,
+    "rejected_queue_full": 0,
+    "rejected_timeout": 0,
+    "wait_seconds_sum": 0.0,
+    "wait_seconds_max": 0.0
+}
+
+
+class LimiterRejected(Exception):
+    """Raised when a call cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LimiterQueueFull(LimiterRejected):
+    """Raised when too many calls are already waiting."""
+
+
+class LimiterTimeout(LimiterRejected):
+    """Raised when a queued call was not admitted before its deadline."""
+
+
+def estimate_tokens(*texts: str) -> int:
+    """
+    Estimate the token count of prompt text from its length.
+
+    Args:
+        *texts: Prompt fragments (system prompt, user message, ...)
+
+    Returns:
+        Estimated number of tokens
+    """
+    return sum(math.ceil(len(text or "") / CHARS_PER_TOKEN) for text in texts)
+
+
+@contextmanager
+def acquire(estimated_tokens: int, timeout: float = None):
+    """
+    Wait for an in-flight slot and enough token budget, then hold the slot.
+
+    Usage:
+        with acquire(estimate_tokens(system, prompt)):
+            client.messages.create(...)
+
+    Args:
+        estimated_tokens: Estimated input tokens of the call
+        timeout: Maximum seconds to queue (defaults to LLM_QUEUE_TIMEOUT)
+
+    Raises:
+        LimiterQueueFull: If LLM_MAX_QUEUE calls are already waiting
+        LimiterTimeout: If the call could not be admitted before the deadline
+    """
+    cost, started, deadline, ticket = _enter_queue(estimated_tokens, timeout)
+
+    try:
+        while True:
+            slot, wait_for = _try_admit(cost, deadline, ticket)
+            if slot is not None:
+                break
+            time.sleep(wait_for)
+    except BaseException:
+        _leave_queue(ticket)
+        raise
+
+    _record_admitted(started)
+    try:
+        yield
+    finally:
+        _release(slot)
+
+
+@asynccontextmanager
+async def acquire_async(estimated_tokens: int, timeout: float = None):
+    """
+    Asyncio counterpart of acquire(); waits without blocking the event loop.
+
+    The file locking and state I/O run in worker threads. A call cancelled
+    while one of those steps runs undoes the step once it finishes, so a
+    cancelled call never keeps a ticket or a slot.
+
+    Args:
+        estimated_tokens: Estimated input tokens of the call
+        timeout: Maximum seconds to queue (defaults to LLM_QUEUE_TIMEOUT)
+
+    Raises:
+        LimiterQueueFull: If LLM_MAX_QUEUE calls are already waiting
+        LimiterTimeout: If the call could not be admitted before the deadline
+    """
+    cost, started, deadline, ticket = await _in_thread(
+        _enter_queue, estimated_tokens, timeout,
+        undo=lambda entered: _leave_queue(entered[3])
+    )
+
+    try:
+        while True:
+            slot, wait_for = await _in_thread(
+                _try_admit, cost, deadline, ticket,
+                undo=lambda admitted: _release(admitted[0]) if admitted[0] is not None else None
+            )
+            if slot is not None:
+                break
+            await asyncio.sleep(wait_for)
+    except BaseException:
+        await asyncio.to_thread(_leave_queue, ticket)
+        raise
+
+    _record_admitted(started)
+    try:
+        yield
+    finally:
+        # Runs to completion in its thread even if this task is cancelled again
+        await asyncio.to_thread(_release, slot)
+
+
+async def _in_thread(step: Callable, *args, undo: Callable):
+    """
+    Run a blocking limiter step in a thread.
+
+    The step can't be interrupted, so if the caller is cancelled meanwhile
+    it still finishes, and undo is then called with its result.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(step, *args))
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        def undo_when_done(done):
+            if not done.cancelled() and done.exception() is None:
+                threading.Thread(target=undo, args=(done.result(),), daemon=True).start()
+        task.add_done_callback(undo_when_done)
+        raise
+
+
+def _enter_queue(estimated_tokens: int, timeout: float):
+    """Take a ticket at the back of the queue, or reject if the queue is full."""
+    timeout = QUEUE_TIMEOUT_SECONDS if timeout is None else timeout
+    cost = min(max(estimated_tokens, 0), TOKENS_PER_MINUTE)
+    started = time.monotonic()
+
+    with _locked_state() as state:
+        if len(state["queue"]) >= MAX_QUEUE:
+            _record("rejected_queue_full")
+            raise LimiterQueueFull(
+                "Too many AI requests are queued. Please retry shortly.",
+                _retry_after(state, cost, len(state["queue"]))
+            )
+        ticket = state["next_ticket"]
+        state["next_ticket"] += 1
+        state["queue"].append([ticket, os.getpid(), time.time() + timeout])
+
+    return cost, started, started + timeout, ticket
+
+
+def _try_admit(cost: int, deadline: float, ticket: int):
+    """
+    Try once to take a slot and the call's tokens, if no earlier ticket is
+    still waiting.
+
+    Returns:
+        Tuple of (slot, 0) when admitted, or (None, seconds to wait before
+        the next attempt)
+
+    Raises:
+        LimiterTimeout: If the call can't be admitted before the deadline
+    """
+    with _locked_state() as state:
+        position = _position(state, ticket)
+        if position is None:
+            # Dropped as abandoned after stalling past the deadline
+            _record("rejected_timeout")
+            raise LimiterTimeout("AI service is busy. Please retry shortly.", _retry_after(state, cost, 0))
+
+        tokens_wait = 0
+        if position == 0:
+            slot = _try_acquire_slot()
+            if slot is not None:
+                tokens_wait = _take_tokens(state, cost)
+                if tokens_wait == 0:
+                    state["queue"].pop(0)
+                    _adjust(state, "in_flight", 1)
+                    return slot, 0
+                _release_slot(slot)
+            wait_for = min(max(tokens_wait, _POLL_SECONDS), _MAX_POLL_SECONDS)
+        else:
+            wait_for = min(_POLL_SECONDS * (position + 1), _MAX_POLL_SECONDS)
+
+        # The head knows when its tokens accrue; later calls wait for their turn
+        now = time.monotonic()
+        if now + tokens_wait > deadline or now >= deadline:
+            _record("rejected_timeout")
+            raise LimiterTimeout(
+                "AI service is busy. Please retry shortly.",
+                _retry_after(state, cost, position)
+            )
+    return None, min(wait_for, deadline - now)
+
+
+def _leave_queue(ticket: int):
+    with _locked_state() as state:
+        state["queue"] = [entry for entry in state["queue"] if entry[0] != ticket]
+
+
+def _position(state: Dict, ticket: int) -> Optional[int]:
+    """Number of tickets ahead of this one, or None if it is not queued."""
+    for position, entry in enumerate(state["queue"]):
+        if entry[0] == ticket:
+            return position
+    return None
+
+
+def _record_admitted(started: float):
+    waited = time.monotonic() - started
+    _record("acquired", waited)
+    if waited > 1:
+        logger.info(f"LLM call admitted after {waited:.2f}s in queue")
+
+
+def _release(slot):
+    with _locked_state() as state:
+        _adjust(state, "in_flight", -1)
+    _release_slot(slot)
+
+
+def get_limiter_stats() -> Dict:
+    """
+    Get limiter configuration, shared queue state and local wait statistics.
+
+    Returns:
+        Dictionary with limits, queue depth, in-flight calls and wait times
+    """
+    with _locked_state() as state:
+        _refill(state)
+        queue_depth = len(state["queue"])
+        in_flight = _count(state, "in_flight")
+        tokens_available = int(state["tokens"])
+
+    with _stats_lock:
+        stats = dict(_stats)
+
+    admitted = stats["acquired"]
+    return {
+        "max_concurrency": MAX_CONCURRENCY,
+        "tokens_per_minute": TOKENS_PER_MINUTE,
+        "max_queue": MAX_QUEUE,
+        "queue_depth": queue_depth,
+        "in_flight": in_flight,
+        "tokens_available": tokens_available,
+        "acquired": admitted,
+        "rejected_queue_full": stats["rejected_queue_full"],
+        "rejected_timeout": stats["rejected_timeout"],
+        "wait_seconds_avg": round(stats["wait_seconds_sum"] / admitted, 3) if admitted else 0.0,
+        "wait_seconds_max": round(stats["wait_seconds_max"], 3)
+    }
+
+
+def _record(event: str, waited: float = None):
+    """Update local statistics and metrics for an admitted or rejected call."""
+    with _stats_lock:
+        _stats[event] += 1
+        if waited is not None:
+            _stats["wait_seconds_sum"] += waited
+            _stats["wait_seconds_max"] = max(_stats["wait_seconds_max"], waited)
+
+    if waited is not None:
+        metrics.observe("llm_limiter_wait_seconds", waited)
+    else:
+        metrics.inc("llm_limiter_rejected_total", reason=event[len("rejected_"):])
+
+
+def _shared_count(field: str) -> int:
+    with _locked_state() as state:
+        return len(state["queue"]) if field == "queue" else _count(state, field)
+
+
+# Host-wide values, read from the shared state when /metrics is scraped
+metrics.register_gauge("llm_limiter_queue_depth", lambda: _shared_count("queue"))
+metrics.register_gauge("llm_limiter_in_flight", lambda: _shared_count("in_flight"))
+
+
+@contextmanager
+def _locked_state():
+    """Read-modify-write the shared limiter state under an exclusive lock."""
+    if fcntl is None:
+        with _local_lock:
+            if not _local_state:
+                _local_state.update(_initial_state())
+            yield _local_state
+        return
+
+    LIMITER_DIR.mkdir(parents=True, exist_ok=True)
+    state_path = LIMITER_DIR / "state.json"
+
+    with open(LIMITER_DIR / "state.lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    stored = f.read()
+                state = json.loads(stored)
+                if "queue" not in state:
+                    raise ValueError("state file from an older version")
+            except (FileNotFoundError, ValueError):
+                stored = None
+                state = _initial_state()
+
+            _prune(state)
+            yield state
+
+            # Waiters mostly just look up their position; skip those writes
+            updated = json.dumps(state)
+            if updated != stored:
+                tmp_path = state_path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(updated)
+                os.replace(tmp_path, state_path)
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _initial_state() -> Dict:
+    return {
+        "tokens": float(TOKENS_PER_MINUTE),
+        "updated": time.time(),
+        "next_ticket": 0,
+        "queue": [],
+        "in_flight": {}
+    }
+
+
+def _prune(state: Dict):
+    """
+    Drop tickets and in-flight counts of processes that no longer exist,
+    and tickets left queued well past their deadline.
+    """
+    alive = {}
+
+    def is_alive(pid) -> bool:
+        if pid not in alive:
+            try:
+                os.kill(int(pid), 0)
+                alive[pid] = True
+            except ProcessLookupError:
+                alive[pid] = False
+            except PermissionError:
+                alive[pid] = True
+        return alive[pid]
+
+    expired = time.time() - _TICKET_GRACE_SECONDS
+    state["queue"] = [
+        entry for entry in state["queue"]
+        if entry[2] > expired and is_alive(entry[1])
+    ]
+    for pid in list(state["in_flight"]):
+        if not is_alive(pid):
+            del state["in_flight"][pid]
+
+
+def _count(state: Dict, field: str) -> int:
+    return sum(state[field].values())
+
+
+def _adjust(state: Dict, field: str, delta: int):
+    pid = str(os.getpid())
+    value = state[field].get(pid, 0) + delta
+    if value > 0:
+        state[field][pid] = value
+    else:
+        state[field].pop(pid, None)
+
+
+def _refill(state: Dict):
+    """Add tokens accrued since the last update, capped at one minute's budget."""
+    now = time.time()
+    elapsed = max(0.0, now - state["updated"])
+    state["tokens"] = min(
+        float(TOKENS_PER_MINUTE),
+        state["tokens"] + elapsed * TOKENS_PER_MINUTE / 60.0
+    )
+    state["updated"] = now
+
+
+def _take_tokens(state: Dict, cost: int) -> float:
+    """
+    Consume tokens from the shared bucket.
+
+    Returns:
+        0 if the tokens were taken, otherwise seconds until enough accrue
+    """
+    _refill(state)
+    if state["tokens"] >= cost:
+        state["tokens"] -= cost
+        return 0
+    deficit = cost - state["tokens"]
+    return deficit * 60.0 / TOKENS_PER_MINUTE
+
+
+def _retry_after(state: Dict, cost: int, ahead: int) -> int:
+    """Estimate whole seconds until a call of this cost could be admitted."""
+    _refill(state)
+    queued_cost = cost * (ahead + 1)
+    deficit = max(0.0, queued_cost - state["tokens"])
+    return max(1, math.ceil(deficit * 60.0 / TOKENS_PER_MINUTE))
+
+
+def _try_acquire_slot():
+    """Take one of the MAX_CONCURRENCY in-flight slots without blocking."""
+    if fcntl is None:
+        return _local_slots if _local_slots.acquire(blocking=False) else None
+
+    LIMITER_DIR.mkdir(parents=True, exist_ok=True)
+    for i in range(MAX_CONCURRENCY):
+        slot_file = open(LIMITER_DIR / f"slot-{i}.lock", "a")
+        try:
+            fcntl.flock(slot_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return slot_file
+        except BlockingIOError:
+            slot_file.close()
+    return None
+
+
+def _release_slot(slot):
+    if slot is None:
+        return
+    if fcntl is None:
+        slot.release()
+        return
+    fcntl.flock(slot.fileno(), fcntl.LOCK_UN)
+    slot.close()
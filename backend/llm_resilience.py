@@ -0,0 +1,399 @@
+"""
+Resilient LLM call module.
+Wraps client.messages.create with bounded retries and jittered exponential
+backoff, optional hedged requests, and a circuit breaker that fails fast
+while the upstream is degraded. Every attempt goes through llm_limiter.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict
+
+from anthropic import APIConnectionError, APIStatusError
+
+import llm_limiter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Retry policy
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+# Hedging: fire a second request once the first exceeds the observed p95
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "False") == "True"
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "15"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breaker
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# HTTP statuses worth retrying (timeouts, conflicts, rate limits, overload, 5xx)
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+# Recent successful call latencies used to derive the hedge delay
+_latencies = deque(maxlen=200)
+_latencies_lock = threading.Lock()
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed: calls flow normally. After BREAKER_FAILURE_THRESHOLD consecutive
+    upstream failures the breaker opens and rejects calls for
+    BREAKER_RESET_SECONDS. Then one trial call is let through (half-open);
+    its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """
+        Check whether a call may proceed.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with a
+                trial call already in flight
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            remaining = self.reset_seconds - (time.monotonic() - self._opened_at)
+            raise CircuitOpenError(
+                "AI service is temporarily unavailable. Please retry shortly.",
+                max(1, int(remaining) + 1)
+            )
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def cancel_trial(self):
+        """Release a half-open trial that ended without reaching upstream."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(
+                        f"Circuit breaker opened after {self._failures} consecutive failures"
+                    )
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+
+
+def create_message(client, parse: Callable[[Any], Any] = None, hedge: bool = None, **kwargs) -> Any:
+    """
+    Call client.messages.create with retries, optional hedging and a breaker.
+
+    Retries connection errors, timeouts, 408/409/429 and 5xx responses, and
+    ValueErrors raised by parse (e.g. malformed JSON in the model output).
+    Backoff is exponential with full jitter, capped at LLM_BACKOFF_MAX, and
+    honors a Retry-After header when the upstream sends one.
+
+    Args:
+        client: Anthropic client
+        parse: Optional callable turning the Message into the final result;
+            raising ValueError triggers a retry
+        hedge: Fire a backup request after the p95 delay (defaults to
+            LLM_HEDGE_ENABLED)
+        **kwargs: Arguments for client.messages.create
+
+    Returns:
+        parse(message) if parse is given, otherwise the Message
+
+    Raises:
+        CircuitOpenError: If the breaker is open
+        LimiterRejected: If the outbound limiter cannot admit the call
+        APIError: If the upstream keeps failing or the error is not retryable
+        ValueError: If parse keeps failing
+    """
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+
+    for attempt in range(MAX_RETRIES + 1):
+        breaker.before_call()
+
+        try:
+            if hedge:
+                message = _hedged_call(client, kwargs)
+            else:
+                message = _single_call(client, kwargs)
+        except (APIConnectionError, APIStatusError) as e:
+            time.sleep(_after_upstream_error(e, attempt))
+            continue
+        except Exception:
+            breaker.cancel_trial()
+            raise
+
+        breaker.record_success()
+
+        if parse is None:
+            return message
+
+        try:
+            return parse(message)
+        except ValueError as e:
+            time.sleep(_after_parse_error(e, attempt))
+
+
+async def acreate_message(client, parse: Callable[[Any], Any] = None, hedge: bool = None,
+                          **kwargs) -> Any:
+    """
+    Asyncio counterpart of create_message() for an AsyncAnthropic client.
+
+    Same retry, hedging and circuit breaker behaviour; waits use
+    asyncio.sleep and the losing hedged request is cancelled.
+
+    Args:
+        client: AsyncAnthropic client
+        parse: Optional callable turning the Message into the final result;
+            raising ValueError triggers a retry
+        hedge: Fire a backup request after the p95 delay (defaults to
+            LLM_HEDGE_ENABLED)
+        **kwargs: Arguments for client.messages.create
+
+    Returns:
+        parse(message) if parse is given, otherwise the Message
+    """
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+
+    for attempt in range(MAX_RETRIES + 1):
+        breaker.before_call()
+
+        try:
+            if hedge:
+                message = await _ahedged_call(client, kwargs)
+            else:
+                message = await _asingle_call(client, kwargs)
+        except (APIConnectionError, APIStatusError) as e:
+            await asyncio.sleep(_after_upstream_error(e, attempt))
+            continue
+        except Exception:
+            breaker.cancel_trial()
+            raise
+
+        breaker.record_success()
+
+        if parse is None:
+            return message
+
+        try:
+            return parse(message)
+        except ValueError as e:
+            await asyncio.sleep(_after_parse_error(e, attempt))
+
+
+def _after_upstream_error(error: Exception, attempt: int) -> float:
+    """
+    Record an upstream failure and decide whether to retry.
+
+    Returns:
+        Seconds to back off before the next attempt
+
+    Raises:
+        The error itself if it is not retryable or retries are exhausted
+    """
+    if not _is_retryable(error):
+        breaker.record_success()
+        raise error
+    breaker.record_failure()
+    if attempt == MAX_RETRIES:
+        raise error
+    delay = _backoff_delay(attempt, error)
+    logger.warning(
+        f"LLM call failed ({type(error).__name__}), retry {attempt + 1}/{MAX_RETRIES} "
+        f"in {delay:.2f}s"
+    )
+    return delay
+
+
+def _after_parse_error(error: ValueError, attempt: int) -> float:
+    """Decide whether to retry a response the parser rejected."""
+    if attempt == MAX_RETRIES:
+        raise error
+    delay = _backoff_delay(attempt)
+    logger.warning(
+        f"LLM response rejected by parser ({error}), retry {attempt + 1}/{MAX_RETRIES} "
+        f"in {delay:.2f}s"
+    )
+    return delay
+
+
+def get_resilience_stats() -> Dict:
+    """
+    Get breaker state and the latency window used for hedging.
+
+    Returns:
+        Dictionary with breaker state, p95 latency and hedge delay
+    """
+    with _latencies_lock:
+        samples = len(_latencies)
+    return {
+        "breaker_state": breaker.state,
+        "latency_samples": samples,
+        "latency_p95_seconds": round(_latency_p95() or 0.0, 3),
+        "hedge_enabled": HEDGE_ENABLED,
+        "hedge_delay_seconds": round(hedge_delay(), 3)
+    }
+
+
+def hedge_delay() -> float:
+    """Delay before firing a hedge: observed p95, or the default until warm."""
+    p95 = _latency_p95()
+    return p95 if p95 is not None else HEDGE_DEFAULT_DELAY_SECONDS
+
+
+def _latency_p95():
+    with _latencies_lock:
+        if len(_latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(_latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def _single_call(client, kwargs: Dict):
+    """One limiter-admitted request; records its latency on success."""
+    with llm_limiter.acquire(_estimate_request_tokens(kwargs)):
+        started = time.monotonic()
+        message = client.messages.create(**kwargs)
+    with _latencies_lock:
+        _latencies.append(time.monotonic() - started)
+    return message
+
+
+def _hedged_call(client, kwargs: Dict):
+    """
+    Send a request and, if it has not finished after the hedge delay, a
+    duplicate. The first successful response wins; the loser is abandoned.
+    """
+    primary = _hedge_executor.submit(_single_call, client, kwargs)
+    done, _ = wait([primary], timeout=hedge_delay())
+    if done:
+        return primary.result()
+
+    logger.info("LLM call exceeded hedge delay, sending hedged request")
+    pending = {primary, _hedge_executor.submit(_single_call, client, kwargs)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _asingle_call(client, kwargs: Dict):
+    """One limiter-admitted async request; records its latency on success."""
+    async with llm_limiter.acquire_async(_estimate_request_tokens(kwargs)):
+        started = time.monotonic()
+        message = await client.messages.create(**kwargs)
+    with _latencies_lock:
+        _latencies.append(time.monotonic() - started)
+    return message
+
+
+async def _ahedged_call(client, kwargs: Dict):
+    """Async hedged request; the losing request is cancelled."""
+    primary = asyncio.ensure_future(_asingle_call(client, kwargs))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay())
+    if done:
+        return primary.result()
+
+    logger.info("LLM call exceeded hedge delay, sending hedged request")
+    pending = {primary, asyncio.ensure_future(_asingle_call(client, kwargs))}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return status in RETRYABLE_STATUS_CODES or (status is not None and status >= 500)
+
+
+def _backoff_delay(attempt: int, error: Exception = None) -> float:
+    """Full-jitter exponential backoff, raised to any Retry-After hint."""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), BACKOFF_MAX_SECONDS))
+        except ValueError:
+            pass
+
+    return delay
+
+
+def _estimate_request_tokens(kwargs: Dict) -> int:
+    """Estimate input tokens of a messages.create request."""
+    texts = [kwargs.get("system") or ""]
+    for message in kwargs.get("messages", []):
+        content = message.get("content")
+        texts.append(content if isinstance(content, str) else json.dumps(content))
+    if kwargs.get("tools"):
+        texts.append(json.dumps(kwargs["tools"]))
+    return llm_limiter.estimate_tokens(*texts)
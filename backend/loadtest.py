@@ -0,0 +1,554 @@
+"""
+End-to-end load testing harness for the backend API.
+Builds synthetic DOCX data rooms from the sample-documents templates, drives
+/upload, /analyze, /rules and /resources at target concurrency levels and
+reports latency percentiles, throughput and error rates as JSON, with the
+per-stage breakdown summed from each response's Server-Timing header.
+
+Usage:
+    # Against a running backend (start it with ANTHROPIC_BASE_URL pointing at
+    # fake_anthropic.py, or with LLM_MODE=replay)
+    python loadtest.py --url http://localhost:5000 --concurrency 1,4,16 --requests 50
+
+    # Spawn the backend against an in-process fake LLM
+    python loadtest.py --spawn gunicorn --workers 2 --fake-llm-latency-ms 800 --output results.json
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import pathlib
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+import requests
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parent
+TEMPLATES_DIR = BACKEND_DIR.parent / "sample-documents"
+
+ENDPOINTS = ("upload", "analyze", "rules", "resources")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+_COMPANY_NAMES = ["QatarPay Solutions", "Doha Lend", "Pearl Wallet", "Lusail Capital Tech", "Corniche Pay"]
+_HOSTING = ["AWS in Ireland", "Azure in Frankfurt", "Ooredoo's Doha data center", "Google Cloud in Singapore"]
+
+
+# === Synthetic data rooms ===
+
+def load_templates(templates_dir: pathlib.Path = TEMPLATES_DIR) -> List[List[str]]:
+    """
+    Load the sample document templates as lists of paragraphs.
+
+    Returns:
+        One paragraph list per template file
+
+    Raises:
+        FileNotFoundError: If no .txt templates exist
+    """
+    templates = []
+    for path in sorted(templates_dir.glob("*.txt")):
+        text = path.read_text(encoding="utf-8")
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+        templates.append(paragraphs)
+    if not templates:
+        raise FileNotFoundError(f"No .txt templates found in {templates_dir}")
+    return templates
+
+
+def build_docx(paragraphs: List[str]) -> bytes:
+    """
+    Build a minimal DOCX file containing the paragraphs.
+
+    Args:
+        paragraphs: Paragraph texts; line breaks become separate paragraphs
+
+    Returns:
+        DOCX file bytes
+    """
+    body = "".join(
+        f'<w:p><w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r></w:p>'
+        for paragraph in paragraphs
+        for line in paragraph.splitlines()
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        docx.writestr("_rels/.rels", _RELS)
+        docx.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+def _vary(paragraph: str, rng: random.Random, company: str) -> str:
+    """Swap company name, amounts and hosting so every room is distinct."""
+    paragraph = paragraph.replace("QatarPay Solutions", company)
+    paragraph = re.sub(
+        r"QAR ([\d,]+)",
+        lambda m: f"QAR {int(int(m.group(1).replace(',', '')) * rng.uniform(0.5, 2.5)):,}",
+        paragraph
+    )
+    return re.sub(r"AWS (?:in|Ireland)[\w ]*?(?=[.,\n]|$)", rng.choice(_HOSTING), paragraph)
+
+
+def build_data_room(templates: List[List[str]], docs: int, paragraphs_per_doc: int,
+                    seed: int) -> List[Tuple[str, bytes]]:
+    """
+    Build one synthetic data room.
+
+    Args:
+        templates: Paragraph lists from load_templates()
+        docs: Number of documents in the room
+        paragraphs_per_doc: Paragraphs sampled into each document
+        seed: Random seed; the same seed builds the same room
+
+    Returns:
+        List of (filename, docx_bytes)
+    """
+    rng = random.Random(seed)
+    company = rng.choice(_COMPANY_NAMES)
+    room = []
+    for i in range(docs):
+        template = templates[i % len(templates)]
+        paragraphs = [
+            _vary(rng.choice(template), rng, company)
+            for _ in range(paragraphs_per_doc)
+        ]
+        room.append((f"room{seed}-doc{i + 1}.docx", build_docx(paragraphs)))
+    return room
+
+
+def build_summaries(count: int, seed: int) -> List[str]:
+    """Build distinct startup summaries for /analyze requests."""
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(_COMPANY_NAMES)} is a P2P lending platform with paid-up capital of "
+        f"QAR {rng.randint(2, 15) * 1_000_000:,}. Customer data is hosted with {rng.choice(_HOSTING)}. "
+        f"The board has {rng.randint(1, 5)} directors. (variant {i})"
+        for i in range(count)
+    ]
+
+
+# === Load generation ===
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile of values (q in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class LoadRunner:
+    """Sends requests of one kind at a fixed concurrency and collects timings."""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def send(self, endpoint: str, payload) -> Tuple[float, int, Dict, Dict]:
+        """
+        Send one request.
+
+        Returns:
+            Tuple of (latency seconds, status code or 0 on connection error,
+            parsed JSON body or {}, response headers)
+        """
+        session = self._session()
+        started = time.perf_counter()
+        try:
+            if endpoint == "upload":
+                files = [(f"file{i}", (name, data)) for i, (name, data) in enumerate(payload)]
+                response = session.post(f"{self.base_url}/upload", files=files, timeout=self.timeout)
+            elif endpoint == "analyze":
+                response = session.post(f"{self.base_url}/analyze", json={"summary": payload},
+                                        timeout=self.timeout)
+            else:
+                response = session.get(f"{self.base_url}/{endpoint}", timeout=self.timeout)
+            elapsed = time.perf_counter() - started
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            return elapsed, response.status_code, body, response.headers
+        except requests.RequestException as e:
+            logger.debug(f"{endpoint} request failed: {e}")
+            return time.perf_counter() - started, 0, {}, {}
+
+    def run(self, endpoint: str, payloads: List, concurrency: int) -> Dict:
+        """
+        Send one request per payload with the given concurrency.
+
+        Returns:
+            Phase result with latency percentiles, throughput and errors
+        """
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(lambda payload: self.send(endpoint, payload), payloads))
+        wall = time.perf_counter() - started
+
+        return summarize(endpoint, concurrency, outcomes, wall)
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """
+    Sum the durations of a Server-Timing header per metric name.
+
+    Args:
+        header: Server-Timing header value
+
+    Returns:
+        Dictionary of metric name to total duration in ms
+    """
+    totals = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        match = re.search(r"(?:^|;)\s*dur=([\d.]+)", params)
+        if name and match:
+            totals[name] = totals.get(name, 0.0) + float(match.group(1))
+    return totals
+
+
+def summarize_server_timing(outcomes: List[Tuple[float, int, Dict, Dict]]) -> Dict:
+    """
+    Aggregate the Server-Timing spans of successful requests per stage.
+
+    Returns:
+        Dictionary of stage to request count and mean, p50 and p95 in ms
+    """
+    per_stage = {}
+    for _, status, _, headers in outcomes:
+        if 200 <= status < 300:
+            for stage, duration in parse_server_timing(headers.get("Server-Timing")).items():
+                per_stage.setdefault(stage, []).append(duration)
+    return {
+        stage: {
+            "requests": len(durations),
+            "mean_ms": round(sum(durations) / len(durations), 1),
+            "p50_ms": round(percentile(durations, 50), 1),
+            "p95_ms": round(percentile(durations, 95), 1)
+        }
+        for stage, durations in per_stage.items()
+    }
+
+
+def summarize(endpoint: str, concurrency: int, outcomes: List[Tuple[float, int, Dict, Dict]],
+              wall_seconds: float) -> Dict:
+    """
+    Aggregate request outcomes of one phase.
+
+    Args:
+        endpoint: Endpoint name
+        concurrency: Concurrent clients used
+        outcomes: (latency, status, body, headers) per request
+        wall_seconds: Phase duration
+
+    Returns:
+        Phase result dictionary
+    """
+    latencies = [latency * 1000 for latency, status, _, _ in outcomes if 200 <= status < 300]
+    status_counts = {}
+    for _, status, _, _ in outcomes:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+
+    ok = len(latencies)
+    result = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(outcomes),
+        "ok": ok,
+        "errors": len(outcomes) - ok,
+        "error_rate": round((len(outcomes) - ok) / len(outcomes), 4) if outcomes else 0.0,
+        "status_counts": status_counts,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(ok / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        "latency_ms": {
+            "min": round(min(latencies), 1) if latencies else 0.0,
+            "mean": round(sum(latencies) / ok, 1) if ok else 0.0,
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0
+        }
+    }
+
+    # Request IDs of the slowest requests, to look up their server logs
+    slowest = sorted(outcomes, key=lambda outcome: outcome[0], reverse=True)[:3]
+    result["slowest_requests"] = [
+        {"request_id": headers.get("X-Request-ID"), "status": status, "latency_ms": round(latency * 1000, 1)}
+        for latency, status, _, headers in slowest
+    ]
+    result["server_timing"] = summarize_server_timing(outcomes)
+
+    bodies = [body for _, status, body, _ in outcomes if 200 <= status < 300]
+    if endpoint == "upload":
+        result["stages"] = {
+            "chunks_indexed_avg": _mean(body.get("chunks_indexed") for body in bodies)
+        }
+    elif endpoint == "analyze":
+        routes = {}
+        for body in bodies:
+            route = (body.get("model_route") or {}).get("route", "local")
+            routes[route] = routes.get(route, 0) + 1
+        accounting = [body.get("token_accounting") or {} for body in bodies]
+        result["stages"] = {
+            "model_routes": routes,
+            "rules_resolved_locally_avg": _mean(body.get("rules_resolved_locally") for body in bodies),
+            "context_chunks_used_avg": _mean(body.get("context_chunks_used") for body in bodies),
+            "input_tokens_avg": _mean(a.get("total_input_tokens") for a in accounting),
+            "evidence_chunks_dropped_avg": _mean(a.get("evidence_chunks_dropped") for a in accounting)
+        }
+
+    return result
+
+
+def _mean(values) -> float:
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 2) if values else None
+
+
+# === Backend process management ===
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_backend(server: str, workers: int, env: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    """
+    Start the backend in a subprocess.
+
+    Args:
+        server: flask, gunicorn or asgi
+        workers: Worker processes (gunicorn/asgi)
+        env: Extra environment variables
+
+    Returns:
+        Tuple of (process, base_url)
+    """
+    port = _free_port()
+    commands = {
+        "flask": [sys.executable, "app.py"],
+        "gunicorn": [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+                     "--workers", str(workers), "--timeout", "120", "app:app"],
+        "asgi": [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1",
+                 "--port", str(port), "--workers", str(workers)]
+    }
+    process = subprocess.Popen(
+        commands[server],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env, "PORT": str(port)}
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_for_health(base_url: str, timeout: float, process: subprocess.Popen = None):
+    """
+    Wait until GET /health succeeds.
+
+    Raises:
+        RuntimeError: If the backend exits or doesn't become healthy in time
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Backend at {base_url} not healthy after {timeout:.0f}s")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# === Benchmark ===
+
+def run_benchmark(runner: LoadRunner, args) -> List[Dict]:
+    """Run every endpoint phase at every concurrency level."""
+    templates = load_templates()
+    rooms = [build_data_room(templates, args.docs, args.paragraphs, seed=args.seed + i)
+             for i in range(args.rooms)]
+    summaries = build_summaries(args.distinct_summaries, seed=args.seed)
+    room_mb = sum(len(data) for _, data in rooms[0]) / 1024 / 1024
+    logger.info(f"Built {len(rooms)} data rooms of {args.docs} documents ({room_mb:.2f} MB each)")
+
+    results = []
+    for concurrency in args.concurrency:
+        for endpoint in args.endpoints:
+            if endpoint == "upload":
+                payloads = [rooms[i % len(rooms)] for i in range(args.requests)]
+            elif endpoint == "analyze":
+                # The index lives in worker memory: upload the first room enough
+                # times that every worker is likely to hold it
+                for _ in range(args.warm_uploads):
+                    runner.send("upload", rooms[0])
+                payloads = [summaries[i % len(summaries)] for i in range(args.requests)]
+            else:
+                payloads = [None] * args.requests
+
+            result = runner.run(endpoint, payloads, concurrency)
+            results.append(result)
+            latency = result["latency_ms"]
+            logger.info(
+                f"{endpoint:<9} c={concurrency:<3} ok={result['ok']}/{result['requests']} "
+                f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms "
+                f"rps={result['throughput_rps']}"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend API")
+    parser.add_argument("--url", default="http://localhost:5000",
+                        help="Backend base URL (ignored with --spawn)")
+    parser.add_argument("--spawn", choices=["flask", "gunicorn", "asgi"],
+                        help="Start the backend against an in-process fake LLM")
+    parser.add_argument("--workers", type=int, default=2, help="Workers for --spawn gunicorn/asgi")
+    parser.add_argument("--fake-llm-latency-ms", type=float, default=800)
+    parser.add_argument("--fake-llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--fake-llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint and level")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"Comma-separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument("--rooms", type=int, default=4, help="Distinct synthetic data rooms")
+    parser.add_argument("--docs", type=int, default=4, help="Documents per data room")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs per document")
+    parser.add_argument("--distinct-summaries", type=int, default=8,
+                        help="Distinct /analyze summaries (1 exercises request coalescing)")
+    parser.add_argument("--warm-uploads", type=int, default=4,
+                        help="Uploads before each /analyze phase so workers hold an index")
+    parser.add_argument("--timeout", type=float, default=180, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results JSON to this file")
+    args = parser.parse_args()
+
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    args.endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    process = None
+    fake_server = None
+    base_url = args.url
+    try:
+        if args.spawn:
+            from fake_anthropic import FakeAnthropicConfig, start_fake_server
+            fake_server, fake_url = start_fake_server(config=FakeAnthropicConfig(
+                latency_ms=args.fake_llm_latency_ms,
+                latency_jitter_ms=args.fake_llm_jitter_ms,
+                error_rate=args.fake_llm_error_rate
+            ))
+            process, base_url = spawn_backend(args.spawn, args.workers, {
+                "ANTHROPIC_BASE_URL": fake_url,
+                "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY", "fake-key"),
+                "LLM_MODE": "live"
+            })
+        wait_for_health(base_url, timeout=300 if args.spawn else 10, process=process)
+
+        started = datetime.utcnow().isoformat()
+        results = run_benchmark(LoadRunner(base_url, args.timeout), args)
+
+        report = {
+            "meta": {
+                "started": started,
+                "finished": datetime.utcnow().isoformat(),
+                "commit": _git_commit(),
+                "target": base_url,
+                "server": args.spawn or "external",
+                "workers": args.workers if args.spawn else None,
+                "fake_llm": {
+                    "latency_ms": args.fake_llm_latency_ms,
+                    "jitter_ms": args.fake_llm_jitter_ms,
+                    "error_rate": args.fake_llm_error_rate,
+                    "requests_served": fake_server.config.requests_served
+                } if fake_server else None,
+                "workload": {
+                    "requests": args.requests,
+                    "rooms": args.rooms,
+                    "docs": args.docs,
+                    "paragraphs": args.paragraphs,
+                    "distinct_summaries": args.distinct_summaries,
+                    "seed": args.seed
+                }
+            },
+            "results": results
+        }
+
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output)
+            logger.info(f"Results written to {args.output}")
+        else:
+            print(output)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if fake_server is not None:
+            fake_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
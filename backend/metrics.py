@@ -0,0 +1,493 @@
+"""
+Metrics module for per-stage timings and counters.
+Records stage latency histograms and counters in process memory and renders
+them in the Prometheus text format. Each worker writes its values to a file
+in METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, from a background
+thread, so /metrics on any gunicorn worker reports the sum over all workers
+started by the same master. Values of workers that have exited are folded
+into one archive file per master, so counters stay monotonic while dead
+workers' files don't pile up. Files of masters that are gone are deleted.
+
+Stages timed while a request trace is active are also recorded as spans of
+that request, for its Server-Timing header.
+
+Usage:
+    with metrics.timed("rag_search"):
+        ...
+    metrics.inc("chunks_retrieved_total", len(results))
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import pathlib
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Directory shared by the workers of one server; "" keeps metrics per process
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "fintech-metrics"))
+
+# Seconds between writes of this worker's values to METRICS_DIR
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+NAMESPACE = "readiness"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name: (type, help)
+METRICS = {
+    "stage_duration_seconds": ("histogram", "Time spent in each processing stage"),
+    "request_duration_seconds": ("histogram", "HTTP request latency by endpoint and status"),
+    "files_indexed_total": ("counter", "Documents indexed by /upload"),
+    "chunks_indexed_total": ("counter", "Text chunks embedded into the index"),
+    "chunks_retrieved_total": ("counter", "Chunks returned by semantic search"),
+    "evidence_chunks_dropped_total": ("counter", "Retrieved chunks dropped to fit the token budget"),
+    "rules_resolved_total": ("counter", "Relevant rules by resolver (local engine or llm)"),
+    "llm_calls_total": ("counter", "Claude calls by route and outcome"),
+    "llm_tokens_total": ("counter", "Claude tokens by model and direction"),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit or miss)"),
+    "llm_limiter_wait_seconds": ("histogram", "Time Claude calls waited in the LLM limiter queue"),
+    "llm_limiter_rejected_total": ("counter", "Claude calls rejected by the LLM limiter by reason"),
+    "llm_limiter_queue_depth": ("gauge", "Claude calls waiting in the host-wide LLM limiter queue"),
+    "llm_limiter_in_flight": ("gauge", "Claude calls in flight across the host")
+}
+
+# Accepted incoming X-Request-ID values; anything else gets a fresh ID
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+_lock = threading.Lock()
+_counters: Dict[Tuple, float] = {}
+_histograms: Dict[Tuple, Dict] = {}
+
+# Gauge name -> function returning its current value, called on each render
+_gauges: Dict[str, Callable[[], float]] = {}
+
+# Process that started the background flusher; a forked worker starts its own
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+# Trace of the request being served; copied into worker threads by callers
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class RequestTrace:
+    """Spans recorded while serving one request."""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, detail: str = None):
+        """Record a span of the request."""
+        with self._lock:
+            self.spans.append((stage, seconds, detail))
+
+    def elapsed(self) -> float:
+        """Seconds since the request started."""
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """
+        Format the spans as a Server-Timing header value.
+
+        Returns:
+            Comma-separated metrics in order of completion, ending with
+            the request total
+        """
+        with self._lock:
+            spans = list(self.spans)
+        entries = []
+        for stage, seconds, detail in spans + [("total", self.elapsed(), None)]:
+            entry = f"{stage};dur={seconds * 1000:.1f}"
+            if detail:
+                entry += ';desc="' + re.sub(r'["\\\x00-\x1f]', "_", detail)[:100] + '"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict:
+        """
+        Get the trace as a JSON-serializable dictionary.
+
+        Returns:
+            Dictionary with 'request_id', 'total_ms' and 'spans'
+        """
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "request_id": self.request_id,
+            "total_ms": round(self.elapsed() * 1000, 1),
+            "spans": [
+                {"stage": stage, "ms": round(seconds * 1000, 1), **({"detail": detail} if detail else {})}
+                for stage, seconds, detail in spans
+            ]
+        }
+
+
+def start_trace(request_id: str = None):
+    """
+    Start tracing the current request.
+
+    Args:
+        request_id: Incoming X-Request-ID; a new ID is generated if it is
+            missing or malformed
+
+    Returns:
+        Tuple of (trace, token) where token is passed to end_trace()
+    """
+    if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    trace = RequestTrace(request_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    """Stop tracing the request started with the given token."""
+    _current_trace.reset(token)
+
+
+def current_trace() -> RequestTrace:
+    """Get the trace of the request being served, or None."""
+    return _current_trace.get()
+
+
+def _key(name: str, labels: Dict) -> Tuple:
+    if name not in METRICS:
+        raise KeyError(f"Unknown metric '{name}'")
+    return (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """
+    Increment a counter.
+
+    Args:
+        name: Counter name from METRICS
+        value: Amount to add
+        **labels: Label values
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    """
+    Record a histogram observation.
+
+    Args:
+        name: Histogram name from METRICS
+        value: Observed value (seconds)
+        **labels: Label values
+    """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(DEFAULT_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+                break
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def register_gauge(name: str, read: Callable[[], float]):
+    """
+    Report a gauge by calling read() whenever metrics are rendered.
+
+    Gauges describe state shared by the workers (e.g. the host-wide LLM
+    queue), so the scraped worker reads them live instead of summing
+    per-worker values.
+
+    Args:
+        name: Gauge name from METRICS
+        read: Returns the current value
+    """
+    if METRICS.get(name, (None,))[0] != "gauge":
+        raise KeyError(f"Unknown gauge '{name}'")
+    _gauges[name] = read
+
+
+@contextmanager
+def timed(stage: str, detail: str = None):
+    """
+    Time a block (or, as a decorator, a function) as a processing stage.
+
+    Args:
+        stage: Stage label of stage_duration_seconds
+        detail: Optional span description for the request trace (e.g. a
+            filename); not used as a metric label
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, detail)
+
+
+def record_stage(stage: str, seconds: float, detail: str = None):
+    """
+    Record a stage duration measured by the caller.
+
+    Args:
+        stage: Stage label of stage_duration_seconds
+        seconds: Duration
+        detail: Optional span description for the request trace
+    """
+    observe("stage_duration_seconds", seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds, detail)
+
+
+def snapshot() -> Dict:
+    """
+    Copy this process's metric values.
+
+    Returns:
+        Dictionary with 'counters' and 'histograms' lists of
+        [name, labels, value] entries
+    """
+    with _lock:
+        return {
+            "counters": [[name, dict(labels), value] for (name, labels), value in _counters.items()],
+            "histograms": [
+                [name, dict(labels), {**histogram, "buckets": list(histogram["buckets"])}]
+                for (name, labels), histogram in _histograms.items()
+            ]
+        }
+
+
+def _process_start(pid: int) -> str:
+    # Start time in clock ticks since boot (Linux); tells a restarted master
+    # (e.g. PID 1 of a restarted container) from the previous one
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return "0"
+
+
+def _server_id() -> str:
+    # Workers of one gunicorn/uvicorn master share its pid as parent
+    ppid = os.getppid()
+    return f"{ppid}.{_process_start(ppid)}"
+
+
+def _worker_file() -> pathlib.Path:
+    return pathlib.Path(METRICS_DIR) / f"{_server_id()}-{os.getpid()}.json"
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def flush():
+    """Write this process's values to METRICS_DIR for other workers to read."""
+    if not METRICS_DIR:
+        return
+
+    path = _worker_file()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        temp_path.write_text(json.dumps(snapshot()), encoding="utf-8")
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write metrics to {path}: {e}")
+
+
+def ensure_flusher():
+    """
+    Start this process's background flusher if it is not running.
+
+    Cheap enough to call on every request; the thread is started once per
+    process, after gunicorn has forked the worker.
+    """
+    global _flusher_pid
+
+    pid = os.getpid()
+    if not METRICS_DIR or _flusher_pid == pid:
+        return
+
+    with _flusher_lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(flush)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _merge(snapshots: List[Dict]) -> Dict:
+    counters = {}
+    histograms = {}
+    for data in snapshots:
+        for name, labels, value in data["counters"]:
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, histogram in data["histograms"]:
+            key = _key(name, labels)
+            merged = histograms.setdefault(key, {"buckets": [0] * len(DEFAULT_BUCKETS), "sum": 0.0, "count": 0})
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], histogram["buckets"])]
+            merged["sum"] += histogram["sum"]
+            merged["count"] += histogram["count"]
+
+    return {
+        "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, dict(labels), value] for (name, labels), value in histograms.items()]
+    }
+
+
+def _read(path: pathlib.Path) -> Dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+        return None
+
+
+def _sweep(directory: pathlib.Path, server_id: str) -> List[Dict]:
+    """
+    Read the values of this server, folding exited workers into its archive
+    and deleting the files of servers that are gone.
+
+    Must be called with the directory lock held.
+    """
+    archive_path = directory / f"{server_id}-archive.json"
+    live = []
+    dead = []
+    for path in directory.glob("*.json"):
+        owner, _, worker = path.stem.rpartition("-")
+        if owner != server_id:
+            ppid, _, started = owner.partition(".")
+            if ppid.isdigit() and not (_is_alive(int(ppid)) and _process_start(int(ppid)) == started):
+                path.unlink(missing_ok=True)
+            continue
+        if worker.isdigit():
+            (live if _is_alive(int(worker)) else dead).append(path)
+
+    if dead:
+        archived = [_read(archive_path)] + [_read(path) for path in dead]
+        archive = _merge([data for data in archived if data is not None])
+        temp_path = archive_path.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_text(json.dumps(archive), encoding="utf-8")
+        os.replace(temp_path, archive_path)
+        for path in dead:
+            path.unlink(missing_ok=True)
+        logger.info(f"Archived metrics of {len(dead)} exited workers")
+
+    snapshots = [_read(path) for path in live + [archive_path]]
+    return [data for data in snapshots if data is not None]
+
+
+def _collect() -> Dict:
+    """Merge the values of every worker of this server."""
+    if not METRICS_DIR:
+        return snapshot()
+
+    flush()
+    directory = pathlib.Path(METRICS_DIR)
+    server_id = _server_id()
+    try:
+        with open(directory / "sweep.lock", "a") as lock_file:
+            # Without flock, exited workers are left in place rather than
+            # archived twice by concurrent scrapes
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                snapshots = _sweep(directory, server_id)
+            else:
+                snapshots = [_read(path) for path in directory.glob(f"{server_id}-*.json")]
+                snapshots = [data for data in snapshots if data is not None]
+    except OSError as e:
+        logger.warning(f"Could not read metrics from {directory}: {e}")
+        return snapshot()
+
+    if not snapshots:
+        return snapshot()
+    return _merge(snapshots)
+
+
+def _format_labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for label, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{label}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def render() -> str:
+    """
+    Render all metrics of this server in the Prometheus text format.
+
+    Returns:
+        Exposition text (version 0.0.4)
+    """
+    data = _collect()
+    by_name = {}
+    for name, labels, value in data["counters"] + data["histograms"]:
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        full_name = f"{NAMESPACE}_{name}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        if metric_type == "gauge":
+            if name in _gauges:
+                try:
+                    lines.append(f"{full_name} {_gauges[name]()}")
+                except Exception as e:
+                    logger.warning(f"Could not read gauge {name}: {e}")
+            continue
+        for labels, value in sorted(by_name.get(name, []), key=lambda item: sorted(item[0].items())):
+            if metric_type == "counter":
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(DEFAULT_BUCKETS, value["buckets"]):
+                cumulative += count
+                lines.append(f"{full_name}_bucket{_format_labels({**labels, 'le': repr(bound)})} {cumulative}")
+            lines.append(f"{full_name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {value['count']}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {value['sum']}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {value['count']}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,224 @@
+"""
+Model routing module.
+Sends easy structured-output calls to a fast, cheap model and escalates to
+the large model when the fast call fails (API error, e.g. a retired model
+ID), its answer fails validation or it reports low confidence. Records
+latency, token and cost metrics per route.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Tuple, Type, TypeVar
+
+from anthropic import APIConnectionError, APIStatusError
+from pydantic import BaseModel
+
+import metrics
+from structured_output import acreate_structured, create_structured
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+# USD per million (input, output) tokens
+DEFAULT_PRICING = {
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00),
+    "claude-haiku-4-5-20251001": (1.00, 5.00),
+    "claude-sonnet-4-5-20250929": (3.00, 15.00)
+}
+
+
+class ModelRouter:
+    """
+    Fast-then-large model router for structured tool calls.
+
+    Usage:
+        router = ModelRouter("claude-3-5-haiku-20241022", "claude-3-5-sonnet-20241022")
+        result, route = router.create(client, GapAnalysis, REPORT_GAPS_TOOL,
+                                      use_fast=True, system=..., messages=...)
+    """
+
+    def __init__(self, fast_model: str, large_model: str,
+                 escalate_below_confidence: float = 0.6, pricing: Dict = None):
+        """
+        Args:
+            fast_model: Model tried first for easy cases (None disables routing)
+            large_model: Model used for hard cases and escalations
+            escalate_below_confidence: Fast answers with a lower 'confidence'
+                field are retried on the large model
+            pricing: Optional {model: (input, output)} USD per million tokens
+        """
+        self.fast_model = fast_model
+        self.large_model = large_model
+        self.escalate_below_confidence = escalate_below_confidence
+        self.pricing = {**DEFAULT_PRICING, **{
+            model: tuple(prices) for model, prices in (pricing or {}).items()
+        }}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def create(self, client, model_cls: Type[T], tool: Dict, use_fast: bool = False,
+               **kwargs) -> Tuple[T, Dict]:
+        """
+        Run a structured call on the routed model.
+
+        Args:
+            client: Anthropic client
+            model_cls: Pydantic model the tool input must satisfy
+            tool: Tool definition built from model_cls
+            use_fast: Whether the caller judged the case easy enough for the
+                fast model
+            **kwargs: Arguments for client.messages.create, without 'model'
+
+        Returns:
+            Tuple of (validated result, route) where route has 'route'
+            ('fast', 'large' or 'escalated'), 'model' and 'escalation_reason'
+
+        Raises:
+            ValueError: If the large model's output is unusable
+            APIError: If the large model call fails; fast model API errors
+                escalate instead
+        """
+        escalation_reason = None
+        if use_fast and self.fast_model:
+            try:
+                result = self._timed("fast", self.fast_model, lambda usage: create_structured(
+                    client, model_cls, tool, usage=usage, model=self.fast_model, **kwargs
+                ))
+                escalation_reason = self._escalation_reason(result)
+                if escalation_reason is None:
+                    return result, self._route("fast", self.fast_model)
+            except ValueError as e:
+                escalation_reason = f"fast model output invalid: {str(e).splitlines()[0]}"
+            except (APIStatusError, APIConnectionError) as e:
+                escalation_reason = self._error_reason(e)
+            self._escalated(escalation_reason)
+
+        result = self._timed("large", self.large_model, lambda usage: create_structured(
+            client, model_cls, tool, usage=usage, model=self.large_model, **kwargs
+        ))
+        return result, self._route("escalated" if escalation_reason else "large",
+                                   self.large_model, escalation_reason)
+
+    async def acreate(self, client, model_cls: Type[T], tool: Dict, use_fast: bool = False,
+                      **kwargs) -> Tuple[T, Dict]:
+        """
+        Asyncio counterpart of create() for an AsyncAnthropic client.
+
+        Returns:
+            Tuple of (validated result, route)
+        """
+        escalation_reason = None
+        if use_fast and self.fast_model:
+            try:
+                result = await self._atimed("fast", self.fast_model, lambda usage: acreate_structured(
+                    client, model_cls, tool, usage=usage, model=self.fast_model, **kwargs
+                ))
+                escalation_reason = self._escalation_reason(result)
+                if escalation_reason is None:
+                    return result, self._route("fast", self.fast_model)
+            except ValueError as e:
+                escalation_reason = f"fast model output invalid: {str(e).splitlines()[0]}"
+            except (APIStatusError, APIConnectionError) as e:
+                escalation_reason = self._error_reason(e)
+            self._escalated(escalation_reason)
+
+        result = await self._atimed("large", self.large_model, lambda usage: acreate_structured(
+            client, model_cls, tool, usage=usage, model=self.large_model, **kwargs
+        ))
+        return result, self._route("escalated" if escalation_reason else "large",
+                                   self.large_model, escalation_reason)
+
+    def get_stats(self) -> Dict:
+        """
+        Get per-route call counts, latency, tokens and estimated cost.
+
+        Returns:
+            Dictionary keyed by route ('fast', 'large')
+        """
+        with self._lock:
+            stats = {route: dict(values) for route, values in self._stats.items()}
+
+        for values in stats.values():
+            calls = values.pop("latency_count")
+            values["latency_seconds_avg"] = round(values.pop("latency_seconds_sum") / calls, 3) if calls else 0.0
+            values["latency_seconds_max"] = round(values["latency_seconds_max"], 3)
+            values["cost_usd"] = round(values["cost_usd"], 6)
+        return stats
+
+    def _escalation_reason(self, result):
+        confidence = getattr(result, "confidence", None)
+        if confidence is not None and confidence < self.escalate_below_confidence:
+            return f"fast model confidence {confidence:.2f} below {self.escalate_below_confidence:.2f}"
+        return None
+
+    def _error_reason(self, error: Exception) -> str:
+        status = getattr(error, "status_code", None)
+        return f"fast model call failed: {type(error).__name__}" + (f" ({status})" if status else "")
+
+    def _route(self, route: str, model: str, escalation_reason: str = None) -> Dict:
+        return {"route": route, "model": model, "escalation_reason": escalation_reason}
+
+    def _escalated(self, reason: str):
+        logger.info(f"Escalating to {self.large_model}: {reason}")
+        with self._lock:
+            self._route_stats("fast", self.fast_model)["escalations"] += 1
+
+    def _timed(self, route: str, model: str, call):
+        """Run call(usage) and record its latency, tokens and cost for the route."""
+        usage = {}
+        started = time.monotonic()
+        failed = True
+        try:
+            result = call(usage)
+            failed = False
+            return result
+        finally:
+            self._record(route, model, usage, time.monotonic() - started, failed)
+
+    async def _atimed(self, route: str, model: str, call):
+        """Asyncio counterpart of _timed()."""
+        usage = {}
+        started = time.monotonic()
+        failed = True
+        try:
+            result = await call(usage)
+            failed = False
+            return result
+        finally:
+            self._record(route, model, usage, time.monotonic() - started, failed)
+
+    def _route_stats(self, route: str, model: str) -> Dict:
+        return self._stats.setdefault(route, {
+            "model": model,
+            "calls": 0,
+            "failures": 0,
+            "escalations": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cost_usd": 0.0,
+            "latency_count": 0,
+            "latency_seconds_sum": 0.0,
+            "latency_seconds_max": 0.0
+        })
+
+    def _record(self, route: str, model: str, usage: Dict, elapsed: float, failed: bool = False):
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        input_price, output_price = self.pricing.get(model, (0.0, 0.0))
+        metrics.inc("llm_calls_total", route=route, outcome="failure" if failed else "success")
+        metrics.inc("llm_tokens_total", input_tokens, model=model, direction="input")
+        metrics.inc("llm_tokens_total", output_tokens, model=model, direction="output")
+        with self._lock:
+            stats = self._route_stats(route, model)
+            stats["calls"] += 1
+            stats["failures"] += int(failed)
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost_usd"] += (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+            stats["latency_count"] += 1
+            stats["latency_seconds_sum"] += elapsed
+            stats["latency_seconds_max"] = max(stats["latency_seconds_max"], elapsed)
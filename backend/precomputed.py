@@ -0,0 +1,139 @@
+"""
+Precomputed response module.
+Serializes static JSON payloads (rules, resources) once, with gzip and
+brotli variants and a strong ETag, and answers conditional GETs with 304
+so repeated fetches cost a header comparison.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Browser cache lifetime; after it expires clients revalidate with If-None-Match
+CACHE_MAX_AGE_SECONDS = int(os.getenv("STATIC_RESPONSE_MAX_AGE", "60"))
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+_lock = threading.Lock()
+_responses = {}
+
+
+class PrecomputedResponse:
+    """A JSON body serialized once, with its compressed variants and ETag."""
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+
+        # Each encoding is a different representation and needs its own strong ETag
+        self.variants = {"identity": (self.body, f'"{digest}"')}
+        if len(self.body) >= MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = (gzip.compress(self.body, compresslevel=9, mtime=0), f'"{digest}-gzip"')
+            if brotli is not None:
+                self.variants["br"] = (brotli.compress(self.body), f'"{digest}-br"')
+
+    def respond(self, accept_encoding: str = None, if_none_match: str = None) -> Tuple[bytes, int, Dict]:
+        """
+        Pick the representation for a request.
+
+        Args:
+            accept_encoding: Accept-Encoding request header
+            if_none_match: If-None-Match request header
+
+        Returns:
+            Tuple of (body, status_code, headers); 304 with an empty body
+            when the client already holds the current payload
+        """
+        encoding = self._negotiate(accept_encoding)
+        body, etag = self.variants[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={CACHE_MAX_AGE_SECONDS}",
+            "Vary": "Accept-Encoding"
+        }
+
+        if if_none_match and self._matches(if_none_match):
+            return b"", 304, headers
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return body, 200, headers
+
+    def _negotiate(self, accept_encoding: str) -> str:
+        accepted = {}
+        for item in (accept_encoding or "").split(","):
+            name, _, params = item.strip().partition(";")
+            quality = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            if name:
+                accepted[name.lower()] = quality
+
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return "identity"
+
+    def _matches(self, if_none_match: str) -> bool:
+        # If-None-Match uses weak comparison; a match on any encoding of this
+        # payload means the client's copy is current
+        if if_none_match.strip() == "*":
+            return True
+        etags = {etag for _, etag in self.variants.values()}
+        return any(
+            tag.strip().removeprefix("W/") in etags
+            for tag in if_none_match.split(",")
+        )
+
+
+def get(name: str, build_payload: Callable[[], object]) -> PrecomputedResponse:
+    """
+    Get the precomputed response for a payload, building it on first use.
+
+    Args:
+        name: Cache key (e.g. 'rules')
+        build_payload: Returns the JSON-serializable payload
+
+    Returns:
+        PrecomputedResponse
+    """
+    response = _responses.get(name)
+    if response is None:
+        with _lock:
+            response = _responses.get(name)
+            if response is None:
+                response = PrecomputedResponse(build_payload())
+                _responses[name] = response
+                sizes = ", ".join(f"{encoding} {len(body)}B" for encoding, (body, _) in response.variants.items())
+                logger.info(f"Precomputed /{name} response ({sizes})")
+    return response
+
+
+def invalidate(name: str = None):
+    """
+    Drop precomputed responses so they are rebuilt from fresh data.
+
+    Args:
+        name: Response to drop, or None for all
+    """
+    with _lock:
+        if name is None:
+            _responses.clear()
+        else:
+            _responses.pop(name, None)
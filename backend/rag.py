@@ -4,42 +4,57 @@ Handles document parsing, chunking, embedding, and FAISS-based retrieval.
 """
 
 import docx2txt
+import hashlib
 import io
 import logging
+import sys
+import threading
 from pypdf import PdfReader
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 from typing import List, Tuple
 
+import metrics
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
 # Global state for embeddings model and index
 _model = None
 _index = None
 _chunks = []
 _metadata = []
+_fingerprint = None
+
+# Guards the one-time model load when called from worker threads
+_model_lock = threading.Lock()
 
 
 def get_model():
     """Lazy load the sentence transformer model."""
     global _model
     if _model is None:
-        logger.info("Loading sentence transformer model...")
-        _model = SentenceTransformer("all-MiniLM-L6-v2")
-        logger.info("Model loaded successfully")
+        with _model_lock:
+            if _model is None:
+                logger.info("Loading sentence transformer model...")
+                _model = SentenceTransformer(EMBEDDING_MODEL)
+                logger.info("Model loaded successfully")
     return _model
 
 
-def extract_text(file_bytes: bytes, filename: str) -> str:
+def extract_text(file_bytes: bytes, filename: str, keep_lines: bool = False) -> str:
     """
     Extract text from DOCX or PDF files.
 
     Args:
         file_bytes: Raw file content as bytes
         filename: Original filename with extension
+        keep_lines: Keep line breaks (one non-empty line per paragraph) for
+            callers that need the document structure
 
     Returns:
         Extracted text content
@@ -63,7 +78,10 @@ def extract_text(file_bytes: bytes, filename: str) -> str:
             return ""
 
         # Clean up excessive whitespace
-        text = " ".join(text.split())
+        if keep_lines:
+            text = "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+        else:
+            text = " ".join(text.split())
 
         if not text or len(text.strip()) < 50:
             logger.warning(f"Minimal text extracted from {filename} - may be image-based")
@@ -118,58 +136,85 @@ def build_index(files: List[Tuple[bytes, str]]) -> dict:
     Raises:
         ValueError: If no valid text could be extracted
     """
-    global _index, _chunks, _metadata
+    global _index, _chunks, _metadata, _fingerprint
 
-    _chunks = []
-    _metadata = []
+    # Build into locals and swap at the end so concurrent searches never see
+    # a partially built index
+    chunks = []
+    metadata = []
 
     logger.info(f"Building index from {len(files)} files")
 
     # Extract and chunk all files
     for file_bytes, filename in files:
-        text = extract_text(file_bytes, filename)
+        with metrics.timed("rag_extract", detail=filename):
+            text = extract_text(file_bytes, filename)
 
         if text:
-            file_chunks = chunk_text(text)
-            _chunks.extend(file_chunks)
-            _metadata.extend([{"filename": filename, "chunk_id": i}
+            with metrics.timed("rag_chunk"):
+                file_chunks = chunk_text(text)
+            chunks.extend(file_chunks)
+            metadata.extend([{"filename": filename, "chunk_id": i}
                             for i in range(len(file_chunks))])
         else:
             logger.warning(f"No text extracted from {filename}")
 
-    if not _chunks:
+    if not chunks:
         raise ValueError(
             "No text could be extracted from the uploaded files. "
             "Please ensure files contain readable text (not just images)."
         )
 
     # Generate embeddings
-    logger.info(f"Generating embeddings for {len(_chunks)} chunks...")
+    logger.info(f"Generating embeddings for {len(chunks)} chunks...")
     model = get_model()
-    embeddings = model.encode(
-        _chunks,
-        convert_to_numpy=True,
-        show_progress_bar=False,
-        batch_size=32
-    )
+    with metrics.timed("rag_embed"):
+        embeddings = model.encode(
+            chunks,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            batch_size=32
+        )
 
-    # Normalize for cosine similarity
-    faiss.normalize_L2(embeddings)
+    with metrics.timed("rag_index"):
+        # Normalize for cosine similarity
+        faiss.normalize_L2(embeddings)
 
-    # Build FAISS index
-    dimension = embeddings.shape[1]
-    _index = faiss.IndexFlatIP(dimension)  # Inner product = cosine after normalization
-    _index.add(embeddings)
+        # Build FAISS index
+        dimension = embeddings.shape[1]
+        index = faiss.IndexFlatIP(dimension)  # Inner product = cosine after normalization
+        index.add(embeddings)
 
-    logger.info(f"Index built successfully with {_index.ntotal} vectors")
+    _index, _chunks, _metadata, _fingerprint = index, chunks, metadata, compute_fingerprint(chunks)
+    metrics.inc("files_indexed_total", len(files))
+    metrics.inc("chunks_indexed_total", len(chunks))
+
+    logger.info(f"Index built successfully with {index.ntotal} vectors")
 
     return {
-        "chunks_indexed": len(_chunks),
+        "chunks_indexed": len(chunks),
         "files_processed": len(files),
         "embedding_dimension": dimension
     }
 
 
+def compute_fingerprint(chunks: List[str]) -> str:
+    """
+    Compute a content hash identifying an indexed document set.
+
+    Args:
+        chunks: Indexed text chunks in index order
+
+    Returns:
+        Hex SHA-256 digest of the chunks
+    """
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
 def search(query: str, k: int = 8) -> List[Tuple[float, str, dict]]:
     """
     Perform semantic search over indexed documents.
@@ -184,45 +229,112 @@ def search(query: str, k: int = 8) -> List[Tuple[float, str, dict]]:
     Raises:
         ValueError: If index hasn't been built yet
     """
-    if _index is None or not _chunks:
+    index, chunks, metadata = _index, _chunks, _metadata
+    if index is None or not chunks:
         raise ValueError("No documents have been indexed yet. Please upload files first.")
 
     # Encode query
     model = get_model()
-    query_embedding = model.encode([query], convert_to_numpy=True)
-    faiss.normalize_L2(query_embedding)
+    with metrics.timed("rag_query_embed"):
+        query_embedding = model.encode([query], convert_to_numpy=True)
+        faiss.normalize_L2(query_embedding)
 
     # Search
-    k = min(k, len(_chunks))  # Don't request more results than chunks
-    distances, indices = _index.search(query_embedding, k)
+    k = min(k, len(chunks))  # Don't request more results than chunks
+    with metrics.timed("rag_search"):
+        distances, indices = index.search(query_embedding, k)
 
     # Prepare results
     results = []
     for i, idx in enumerate(indices[0]):
-        if idx < len(_chunks):  # Safety check
+        if 0 <= idx < len(chunks):  # Safety check
             results.append((
                 float(distances[0][i]),
-                _chunks[idx],
-                _metadata[idx]
+                chunks[idx],
+                {**metadata[idx], "vector_id": int(idx)}
             ))
 
+    metrics.inc("chunks_retrieved_total", len(results))
     logger.info(f"Retrieved {len(results)} chunks for query")
     return results
 
 
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """
+    Encode texts into L2-normalized embeddings.
+
+    Args:
+        texts: Texts to encode
+
+    Returns:
+        Array of shape (len(texts), dimension)
+    """
+    model = get_model()
+    with metrics.timed("rag_embed_texts"):
+        embeddings = model.encode(
+            texts,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            batch_size=32
+        ).astype("float32")
+        faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def get_chunk_embeddings(vector_ids: List[int]) -> np.ndarray:
+    """
+    Get stored embeddings of indexed chunks without re-encoding them.
+
+    Args:
+        vector_ids: Index positions (the 'vector_id' in search metadata)
+
+    Returns:
+        Array of normalized embeddings, one row per id
+    """
+    if _index is None or not vector_ids:
+        return np.zeros((0, _index.d if _index else 0), dtype="float32")
+    return np.vstack([_index.reconstruct(int(i)) for i in vector_ids])
+
+
+def get_memory_stats() -> dict:
+    """
+    Estimate the memory held by the index globals.
+
+    Returns:
+        Dictionary with entry counts and approximate bytes of the chunk
+        texts, chunk metadata and FAISS index vectors
+    """
+    index, chunks, metadata = _index, _chunks, _metadata
+    metadata_bytes = sys.getsizeof(metadata) + sum(
+        sys.getsizeof(entry) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in entry.items())
+        for entry in metadata
+    )
+    return {
+        "chunks": len(chunks),
+        "chunks_bytes": sys.getsizeof(chunks) + sum(sys.getsizeof(chunk) for chunk in chunks),
+        "metadata_entries": len(metadata),
+        "metadata_bytes": metadata_bytes,
+        "index_vectors": index.ntotal if index is not None else 0,
+        "index_dimension": index.d if index is not None else 0,
+        "index_bytes": index.ntotal * getattr(index, "code_size", index.d * 4) if index is not None else 0
+    }
+
+
 def get_index_stats() -> dict:
     """Get statistics about the current index."""
     return {
         "indexed": _index is not None,
         "total_chunks": len(_chunks),
-        "index_size": _index.ntotal if _index else 0
+        "index_size": _index.ntotal if _index else 0,
+        "fingerprint": _fingerprint
     }
 
 
 def clear_index():
     """Clear the current index and free memory."""
-    global _index, _chunks, _metadata
+    global _index, _chunks, _metadata, _fingerprint
     _index = None
     _chunks = []
     _metadata = []
+    _fingerprint = None
     logger.info("Index cleared")
@@ -4,17 +4,99 @@ Matches regulatory gaps to QDB programs and compliance experts.
 """
 
 import json
+import os
 import pathlib
 import logging
+import threading
 from typing import List, Dict
-from rapidfuzz import fuzz
+import numpy as np
+from rapidfuzz import fuzz, process
+
+import embedding_store
+import metrics
+from keyword_matcher import KeywordMatcher
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Cache for loaded resources
+RESOURCES_PATH = pathlib.Path(__file__).parent / "data" / "resources.json"
+
+# Cache for loaded resources; replaced as a whole on reload, never mutated,
+# so a caller holding the dictionary keeps a consistent snapshot
 _resources_cache = None
 
+# Serializes swapping the resources and their derived indexes
+_swap_lock = threading.Lock()
+
+# Gap title keywords and the programs and experts they lead to, in the order
+# recommendations are made. Programs are looked up by name or focus area,
+# experts by specialization.
+MATCH_RULES = [
+    {
+        "topic": "data_residency",
+        "keywords": ["data residency", "data storage", "data hosting", "cloud"],
+        "programs": [],
+        "experts": ["Data Residency"]
+    },
+    {
+        "topic": "aml_cft",
+        "keywords": ["aml", "anti-money laundering", "cft", "financing of terrorism"],
+        "programs": [("name", "AML Compliance Workshop")],
+        "experts": ["AML/CFT"]
+    },
+    {
+        "topic": "governance",
+        "keywords": ["compliance officer", "governance", "board", "corporate structure"],
+        "programs": [("focus", "Corporate Structure")],
+        "experts": ["Corporate Governance"]
+    },
+    {
+        "topic": "cybersecurity",
+        "keywords": ["cybersecurity", "security", "iso 27001", "penetration", "cyber"],
+        "programs": [("name", "Cybersecurity Excellence")],
+        "experts": ["Cybersecurity"]
+    },
+    {
+        "topic": "capital",
+        "keywords": ["capital", "financial", "funding", "paid-up"],
+        "programs": [("name", "Capital Readiness")],
+        "experts": ["Financial"]
+    },
+    {
+        "topic": "due_diligence",
+        "keywords": ["due diligence", "cdd", "customer verification", "kyc"],
+        "programs": [],
+        "experts": ["AML/CFT"]
+    }
+]
+
+# Program for high severity gaps no rule matched
+FALLBACK_PROGRAM = "Regulatory Accelerator"
+
+# Semantic matching fills in programs/experts for gaps the keyword rules miss
+# (e.g. "Hosting outside Qatar"), by cosine similarity to resource descriptions
+RECOMMEND_SEMANTIC_ENABLED = os.getenv("RECOMMEND_SEMANTIC_ENABLED", "True") == "True"
+RECOMMEND_SIMILARITY_THRESHOLD = float(os.getenv("RECOMMEND_SIMILARITY_THRESHOLD", "0.35"))
+RECOMMEND_SEMANTIC_TOP_K = int(os.getenv("RECOMMEND_SEMANTIC_TOP_K", "1"))
+
+# One pass over a gap title finds every matching topic
+_gap_matcher = KeywordMatcher({rule["topic"]: rule["keywords"] for rule in MATCH_RULES})
+
+# Programs and experts of each topic, resolved once per loaded resources
+_match_index = None
+
+# Normalized program and expert embeddings, row-aligned with the loaded resources
+_resource_embeddings = None
+
+# Resource search: most results per kind, rapidfuzz worker threads (-1 = all
+# cores) and the catalog size below which a single thread is faster
+SEARCH_MAX_RESULTS = int(os.getenv("RESOURCE_SEARCH_MAX_RESULTS", "20"))
+SEARCH_WORKERS = int(os.getenv("RESOURCE_SEARCH_WORKERS", "-1"))
+SEARCH_PARALLEL_MIN_FIELDS = 2000
+
+# Lower-cased search fields of all programs and experts, built once per loaded resources
+_search_index = None
+
 
 def load_resources() -> Dict:
     """
@@ -26,33 +108,129 @@ def load_resources() -> Dict:
     Raises:
         FileNotFoundError: If resources.json doesn't exist
         json.JSONDecodeError: If resources.json is invalid
+        ValueError: If a program or expert is malformed
     """
     global _resources_cache
 
     if _resources_cache is not None:
         return _resources_cache
 
-    resources_path = pathlib.Path(__file__).parent / "data" / "resources.json"
+    resources = read_resources()
+    with _swap_lock:
+        if _resources_cache is None:
+            _resources_cache = resources
+        return _resources_cache
 
-    if not resources_path.exists():
-        logger.error(f"Resources file not found at {resources_path}")
-        raise FileNotFoundError(f"Resources file not found: {resources_path}")
 
-    try:
-        with open(resources_path, "r", encoding="utf-8") as f:
-            _resources_cache = json.load(f)
+def read_resources(path: str = None) -> Dict:
+    """
+    Read and validate a resources file without touching the cache.
 
-        logger.info(
-            f"Loaded {len(_resources_cache.get('qdb_programs', []))} programs "
-            f"and {len(_resources_cache.get('compliance_experts', []))} experts"
-        )
-        return _resources_cache
+    Args:
+        path: Resources file (defaults to data/resources.json)
+
+    Returns:
+        Dictionary with 'qdb_programs' and 'compliance_experts' lists
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        json.JSONDecodeError: If the file is invalid JSON
+        ValueError: If a program or expert is malformed
+    """
+    path = pathlib.Path(path) if path else RESOURCES_PATH
+
+    if not path.exists():
+        logger.error(f"Resources file not found at {path}")
+        raise FileNotFoundError(f"Resources file not found: {path}")
 
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            resources = json.load(f)
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON in resources file: {e}")
         raise
 
+    validate_resources(resources)
+    logger.info(
+        f"Loaded {len(resources.get('qdb_programs', []))} programs "
+        f"and {len(resources.get('compliance_experts', []))} experts"
+    )
+    return resources
+
 
+# Fields every program and expert needs for matching, search and embeddings
+_REQUIRED_FIELDS = {
+    "qdb_programs": ("program_id", "program_name"),
+    "compliance_experts": ("expert_id", "name", "specialization")
+}
+
+
+def validate_resources(resources: Dict):
+    """
+    Check that a resources catalog is well formed.
+
+    Raises:
+        ValueError: If a list is missing or not a list, an item lacks a
+            required string field, focus areas are not a list of strings,
+            or an id is duplicated
+    """
+    if not isinstance(resources, dict):
+        raise ValueError("Resources file must contain an object")
+
+    for kind, fields in _REQUIRED_FIELDS.items():
+        items = resources.get(kind, [])
+        if not isinstance(items, list):
+            raise ValueError(f"'{kind}' must be a list")
+
+        ids = set()
+        for item in items:
+            if not isinstance(item, dict) or not all(isinstance(item.get(field), str) for field in fields):
+                raise ValueError(f"Invalid entry in '{kind}': {item}")
+            focus_areas = item.get("focus_areas", [])
+            if not isinstance(focus_areas, list) or not all(isinstance(area, str) for area in focus_areas):
+                raise ValueError(f"Invalid focus areas for {item[fields[0]]}")
+            if item[fields[0]] in ids:
+                raise ValueError(f"Duplicate id in '{kind}': {item[fields[0]]}")
+            ids.add(item[fields[0]])
+
+
+def reload_resources() -> Dict:
+    """
+    Re-read resources.json and swap it in with its derived indexes.
+
+    The keyword match index, the search index and (if they were in use) the
+    resource embeddings are built for the new catalog before anything is
+    replaced, so requests never see resources without their indexes and a
+    bad file leaves the current catalog in place.
+
+    Returns:
+        The new resources dictionary
+
+    Raises:
+        FileNotFoundError, json.JSONDecodeError, ValueError: If the file
+            cannot be loaded; the current resources are kept
+    """
+    global _resources_cache, _match_index, _search_index, _resource_embeddings
+
+    resources = read_resources()
+    match_index = _build_match_index(resources)
+    search_index = _build_search_index(resources)
+    embeddings = _build_resource_embeddings(resources) if _resource_embeddings is not None else None
+
+    with _swap_lock:
+        _match_index = match_index
+        _search_index = search_index
+        _resource_embeddings = embeddings
+        _resources_cache = resources
+
+    logger.info(
+        f"Reloaded {len(resources.get('qdb_programs', []))} programs "
+        f"and {len(resources.get('compliance_experts', []))} experts"
+    )
+    return resources
+
+
+@metrics.timed("recommend")
 def recommend(gaps: List[Dict]) -> List[Dict]:
     """
     Generate recommendations based on identified gaps.
@@ -64,6 +242,8 @@ def recommend(gaps: List[Dict]) -> List[Dict]:
     - Cybersecurity gaps -> Cybersecurity program + expert
     - Capital gaps -> Capital advisory program + expert
     - General governance gaps -> Corporate governance program
+    - Gaps left without a program or expert -> the most similar ones by
+      embedding (RECOMMEND_SEMANTIC_ENABLED)
 
     Args:
         gaps: List of gap dictionaries with 'title', 'rule_ref', 'severity'
@@ -72,15 +252,14 @@ def recommend(gaps: List[Dict]) -> List[Dict]:
         List of recommendation dictionaries
     """
     resources = load_resources()
-    programs = resources.get("qdb_programs", [])
-    experts = resources.get("compliance_experts", [])
+    index = get_match_index(resources)
+    semantic = semantic_candidates(gaps, resources) if RECOMMEND_SEMANTIC_ENABLED and gaps else None
 
-    recommendations = []
+    entries = []
     matched_programs = set()
     matched_experts = set()
 
     for gap in gaps:
-        title_lower = gap.get("title", "").lower()
         rule_ref = gap.get("rule_ref", "")
         severity = gap.get("severity", "low")
 
@@ -92,83 +271,223 @@ def recommend(gaps: List[Dict]) -> List[Dict]:
             "experts": []
         }
 
-        # Data residency matching
-        if any(keyword in title_lower for keyword in ["data residency", "data storage", "data hosting", "cloud"]):
-            expert = find_expert_by_specialization(experts, "Data Residency")
-            if expert and expert["expert_id"] not in matched_experts:
-                gap_recommendations["experts"].append(expert)
-                matched_experts.add(expert["expert_id"])
-
-        # AML/CFT matching
-        if any(keyword in title_lower for keyword in ["aml", "anti-money laundering", "cft", "financing of terrorism"]):
-            program = find_program_by_name(programs, "AML Compliance Workshop")
-            if program and program["program_id"] not in matched_programs:
-                gap_recommendations["programs"].append(program)
-                matched_programs.add(program["program_id"])
-
-            expert = find_expert_by_specialization(experts, "AML/CFT")
-            if expert and expert["expert_id"] not in matched_experts:
-                gap_recommendations["experts"].append(expert)
-                matched_experts.add(expert["expert_id"])
-
-        # Compliance officer / governance matching
-        if any(keyword in title_lower for keyword in ["compliance officer", "governance", "board", "corporate structure"]):
-            program = find_program_by_focus(programs, "Corporate Structure")
-            if program and program["program_id"] not in matched_programs:
-                gap_recommendations["programs"].append(program)
-                matched_programs.add(program["program_id"])
-
-            expert = find_expert_by_specialization(experts, "Corporate Governance")
-            if expert and expert["expert_id"] not in matched_experts:
-                gap_recommendations["experts"].append(expert)
-                matched_experts.add(expert["expert_id"])
-
-        # Cybersecurity matching
-        if any(keyword in title_lower for keyword in ["cybersecurity", "security", "iso 27001", "penetration", "cyber"]):
-            program = find_program_by_name(programs, "Cybersecurity Excellence")
-            if program and program["program_id"] not in matched_programs:
-                gap_recommendations["programs"].append(program)
-                matched_programs.add(program["program_id"])
-
-            expert = find_expert_by_specialization(experts, "Cybersecurity")
-            if expert and expert["expert_id"] not in matched_experts:
-                gap_recommendations["experts"].append(expert)
-                matched_experts.add(expert["expert_id"])
-
-        # Capital requirements matching
-        if any(keyword in title_lower for keyword in ["capital", "financial", "funding", "paid-up"]):
-            program = find_program_by_name(programs, "Capital Readiness")
-            if program and program["program_id"] not in matched_programs:
-                gap_recommendations["programs"].append(program)
-                matched_programs.add(program["program_id"])
-
-            expert = find_expert_by_specialization(experts, "Financial")
-            if expert and expert["expert_id"] not in matched_experts:
-                gap_recommendations["experts"].append(expert)
-                matched_experts.add(expert["expert_id"])
-
-        # Customer due diligence
-        if any(keyword in title_lower for keyword in ["due diligence", "cdd", "customer verification", "kyc"]):
-            expert = find_expert_by_specialization(experts, "AML/CFT")
-            if expert and expert["expert_id"] not in matched_experts:
-                gap_recommendations["experts"].append(expert)
-                matched_experts.add(expert["expert_id"])
-
-        # Add general regulatory accelerator for high severity gaps without specific matches
-        if severity == "high" and not gap_recommendations["programs"] and not gap_recommendations["experts"]:
-            program = find_program_by_name(programs, "Regulatory Accelerator")
-            if program and program["program_id"] not in matched_programs:
-                gap_recommendations["programs"].append(program)
-                matched_programs.add(program["program_id"])
-
-        # Only add if we found recommendations
-        if gap_recommendations["programs"] or gap_recommendations["experts"]:
-            recommendations.append(gap_recommendations)
-
+        topics = _gap_matcher.find_labels(gap.get("title", ""))
+        for rule in MATCH_RULES:
+            if rule["topic"] not in topics:
+                continue
+
+            programs, experts = index["topics"][rule["topic"]]
+            for program in programs:
+                if program["program_id"] not in matched_programs:
+                    gap_recommendations["programs"].append(program)
+                    matched_programs.add(program["program_id"])
+
+            for expert in experts:
+                if expert["expert_id"] not in matched_experts:
+                    gap_recommendations["experts"].append(expert)
+                    matched_experts.add(expert["expert_id"])
+
+        if semantic is None:
+            _add_fallback_program(gap_recommendations, index, matched_programs)
+        entries.append(gap_recommendations)
+
+    # Keyword matches of every gap are claimed first, so the semantic fill
+    # only hands out resources no rule asked for
+    if semantic is not None:
+        for gap_recommendations, (program_candidates, expert_candidates) in zip(entries, semantic):
+            if not gap_recommendations["programs"]:
+                for program in program_candidates:
+                    if len(gap_recommendations["programs"]) >= RECOMMEND_SEMANTIC_TOP_K:
+                        break
+                    if program["program_id"] not in matched_programs:
+                        gap_recommendations["programs"].append(program)
+                        matched_programs.add(program["program_id"])
+
+            if not gap_recommendations["experts"]:
+                for expert in expert_candidates:
+                    if len(gap_recommendations["experts"]) >= RECOMMEND_SEMANTIC_TOP_K:
+                        break
+                    if expert["expert_id"] not in matched_experts:
+                        gap_recommendations["experts"].append(expert)
+                        matched_experts.add(expert["expert_id"])
+
+            _add_fallback_program(gap_recommendations, index, matched_programs)
+
+    # Only add if we found recommendations
+    recommendations = [entry for entry in entries if entry["programs"] or entry["experts"]]
     logger.info(f"Generated {len(recommendations)} recommendations for {len(gaps)} gaps")
     return recommendations
 
 
+def get_match_index(resources: Dict = None) -> Dict:
+    """
+    Get the programs and experts of each MATCH_RULES topic, resolved once
+    per loaded resources so recommend() does no catalog scans.
+
+    Args:
+        resources: Resources snapshot (defaults to load_resources())
+
+    Returns:
+        Dictionary with 'topics' (topic -> (programs, experts)) and
+        'fallback_program'
+    """
+    global _match_index
+
+    if resources is None:
+        resources = load_resources()
+    cached = _match_index
+    if cached is not None and cached["resources"] is resources:
+        return cached
+
+    index = _build_match_index(resources)
+    with _swap_lock:
+        # A request still holding a replaced catalog must not evict the current index
+        if resources is _resources_cache:
+            _match_index = index
+    return index
+
+
+def _build_match_index(resources: Dict) -> Dict:
+    programs = resources.get("qdb_programs", [])
+    experts = resources.get("compliance_experts", [])
+
+    topics = {}
+    for rule in MATCH_RULES:
+        rule_programs = [
+            find_program_by_name(programs, value) if by == "name" else find_program_by_focus(programs, value)
+            for by, value in rule["programs"]
+        ]
+        rule_experts = [find_expert_by_specialization(experts, value) for value in rule["experts"]]
+        topics[rule["topic"]] = (
+            [program for program in rule_programs if program],
+            [expert for expert in rule_experts if expert]
+        )
+
+    return {
+        "resources": resources,
+        "topics": topics,
+        "fallback_program": find_program_by_name(programs, FALLBACK_PROGRAM)
+    }
+
+
+def _add_fallback_program(gap_recommendations: Dict, index: Dict, matched_programs: set):
+    """Add the general regulatory accelerator for high severity gaps without specific matches."""
+    if (gap_recommendations["severity"] == "high"
+            and not gap_recommendations["programs"] and not gap_recommendations["experts"]):
+        program = index["fallback_program"]
+        if program and program["program_id"] not in matched_programs:
+            gap_recommendations["programs"].append(program)
+            matched_programs.add(program["program_id"])
+
+
+def program_text(program: Dict) -> str:
+    """Text a program is embedded from."""
+    return (
+        f"{program.get('program_name', '')}. Focus areas: {', '.join(program.get('focus_areas', []))}. "
+        f"{program.get('description', '')}"
+    )
+
+
+def expert_text(expert: Dict) -> str:
+    """Text an expert is embedded from."""
+    return f"{expert.get('specialization', '')}. {expert.get('background', '')}"
+
+
+def get_resource_embeddings(resources: Dict = None) -> Dict:
+    """
+    Get normalized embeddings of all programs and experts, loaded from the
+    embedding store or encoded once per loaded resources.
+
+    Args:
+        resources: Resources snapshot (defaults to load_resources())
+
+    Returns:
+        Dictionary with 'programs' and 'experts' arrays, row-aligned with
+        the snapshot's 'qdb_programs' and 'compliance_experts'
+    """
+    global _resource_embeddings
+
+    if resources is None:
+        resources = load_resources()
+    cached = _resource_embeddings
+    if cached is not None and cached["resources"] is resources:
+        return cached
+
+    embeddings = _build_resource_embeddings(resources)
+    with _swap_lock:
+        if resources is _resources_cache:
+            _resource_embeddings = embeddings
+    return embeddings
+
+
+def _build_resource_embeddings(resources: Dict) -> Dict:
+    # Imported here so loading resources does not pull in the embedding stack
+    from rag import EMBEDDING_MODEL, embed_texts
+
+    programs = resources.get("qdb_programs", [])
+    experts = resources.get("compliance_experts", [])
+    embeddings = {"resources": resources}
+    for name, items, id_key, to_text in (
+        ("programs", programs, "program_id", program_text),
+        ("experts", experts, "expert_id", expert_text)
+    ):
+        if items:
+            embeddings[name] = embedding_store.load_or_build(
+                f"resource-{name}",
+                EMBEDDING_MODEL,
+                [item.get(id_key, "") for item in items],
+                [to_text(item) for item in items],
+                encode=embed_texts
+            )
+        else:
+            embeddings[name] = None
+
+    logger.info(f"Resource embeddings ready for {len(programs)} programs and {len(experts)} experts")
+    return embeddings
+
+
+def semantic_candidates(gaps: List[Dict], resources: Dict = None) -> List:
+    """
+    Rank programs and experts for each gap by embedding similarity.
+
+    All gaps are encoded in one batch and scored against the whole catalog
+    with two matrix products.
+
+    Args:
+        gaps: Gap dictionaries with 'title' and optionally 'explanation'
+        resources: Resources snapshot (defaults to load_resources())
+
+    Returns:
+        One (programs, experts) tuple per gap, each list ordered by
+        similarity and limited to scores at or above
+        RECOMMEND_SIMILARITY_THRESHOLD; None if embeddings are unavailable
+    """
+    try:
+        embeddings = get_resource_embeddings(resources)
+        from rag import embed_texts
+        gap_embeddings = embed_texts([
+            f"{gap.get('title', '')}. {gap.get('explanation', '')}" for gap in gaps
+        ])
+    except Exception as e:
+        logger.warning(f"Semantic recommendations unavailable: {e}")
+        return None
+
+    resources = embeddings["resources"]
+    ranked = [([], []) for _ in gaps]
+    for slot, name, items in (
+        (0, "programs", resources.get("qdb_programs", [])),
+        (1, "experts", resources.get("compliance_experts", []))
+    ):
+        if embeddings[name] is None:
+            continue
+        similarity = gap_embeddings @ embeddings[name].T
+        for gap_index, row in enumerate(similarity):
+            candidates = np.flatnonzero(row >= RECOMMEND_SIMILARITY_THRESHOLD)
+            candidates = candidates[np.argsort(-row[candidates], kind="stable")]
+            ranked[gap_index][slot].extend(items[i] for i in candidates)
+    return ranked
+
+
 def find_program_by_name(programs: List[Dict], name_substring: str) -> Dict:
     """Find a program by partial name match."""
     for program in programs:
@@ -206,48 +525,101 @@ def get_all_experts() -> List[Dict]:
     return resources.get("compliance_experts", [])
 
 
-def search_resources(query: str, threshold: int = 60) -> Dict:
+def get_search_index(resources: Dict = None) -> Dict:
+    """
+    Get the lower-cased search fields of all programs and experts as flat
+    lists, built once per loaded resources.
+
+    Program fields are the name and each focus area, expert fields the name
+    and specialization. Each owner's fields are contiguous, so 'starts'
+    holds the offset of every owner's first field.
+
+    Args:
+        resources: Resources snapshot (defaults to load_resources())
+
+    Returns:
+        Dictionary with 'programs' and 'experts', each holding 'items',
+        'fields' and 'starts'
+    """
+    global _search_index
+
+    if resources is None:
+        resources = load_resources()
+    cached = _search_index
+    if cached is not None and cached["resources"] is resources:
+        return cached
+
+    index = _build_search_index(resources)
+    with _swap_lock:
+        if resources is _resources_cache:
+            _search_index = index
+    return index
+
+
+def _build_search_index(resources: Dict) -> Dict:
+    index = {"resources": resources}
+    for name, items, to_fields in (
+        ("programs", resources.get("qdb_programs", []),
+         lambda program: [program["program_name"], *program.get("focus_areas", [])]),
+        ("experts", resources.get("compliance_experts", []),
+         lambda expert: [expert["name"], expert["specialization"]])
+    ):
+        fields = []
+        starts = []
+        for item in items:
+            starts.append(len(fields))
+            fields.extend(field.lower() for field in to_fields(item))
+        index[name] = {"items": items, "fields": fields, "starts": np.array(starts, dtype=np.intp)}
+    return index
+
+
+def _search_matches(query: str, entry: Dict, threshold: int, limit: int) -> List[Dict]:
+    if not entry["items"]:
+        return []
+
+    fields = entry["fields"]
+    workers = SEARCH_WORKERS if len(fields) >= SEARCH_PARALLEL_MIN_FIELDS else 1
+
+    # One row of partial_ratio scores against every field; below-threshold
+    # scores come back as 0, which the filter below drops anyway
+    scores = process.cdist(
+        [query], fields, scorer=fuzz.partial_ratio, score_cutoff=threshold,
+        dtype=np.float64, workers=workers
+    )[0]
+
+    # Best field per owner, then threshold and top-N on the owner scores
+    owner_scores = np.maximum.reduceat(scores, entry["starts"])
+    hits = np.flatnonzero(owner_scores >= threshold)
+    if limit and len(hits) > limit:
+        # Everything above the limit-th best score, then owners tied with it
+        # in catalog order, as a full sort would have picked them
+        cutoff = -np.partition(-owner_scores[hits], limit - 1)[limit - 1]
+        above = hits[owner_scores[hits] > cutoff]
+        tied = hits[owner_scores[hits] == cutoff][:limit - len(above)]
+        hits = np.sort(np.concatenate([above, tied]))
+    hits = hits[np.argsort(-owner_scores[hits], kind="stable")]
+
+    return [{**entry["items"][i], "match_score": int(round(owner_scores[i]))} for i in hits]
+
+
+def search_resources(query: str, threshold: int = 60, limit: int = None) -> Dict:
     """
     Search programs and experts using fuzzy matching.
 
     Args:
         query: Search query
         threshold: Minimum similarity score (0-100)
+        limit: Most results per kind (defaults to RESOURCE_SEARCH_MAX_RESULTS,
+            0 for no limit)
 
     Returns:
-        Dictionary with matching programs and experts
+        Dictionary with matching programs and experts, best match first
     """
-    resources = load_resources()
-    programs = resources.get("qdb_programs", [])
-    experts = resources.get("compliance_experts", [])
-
-    matching_programs = []
-    matching_experts = []
-
-    # Search programs
-    for program in programs:
-        score = max(
-            fuzz.partial_ratio(query.lower(), program["program_name"].lower()),
-            max([fuzz.partial_ratio(query.lower(), area.lower())
-                 for area in program.get("focus_areas", [])] or [0])
-        )
-        if score >= threshold:
-            matching_programs.append({**program, "match_score": score})
-
-    # Search experts
-    for expert in experts:
-        score = max(
-            fuzz.partial_ratio(query.lower(), expert["name"].lower()),
-            fuzz.partial_ratio(query.lower(), expert["specialization"].lower())
-        )
-        if score >= threshold:
-            matching_experts.append({**expert, "match_score": score})
-
-    # Sort by match score
-    matching_programs.sort(key=lambda x: x["match_score"], reverse=True)
-    matching_experts.sort(key=lambda x: x["match_score"], reverse=True)
+    index = get_search_index()
+    query = query.lower()
+    limit = SEARCH_MAX_RESULTS if limit is None else limit
 
     return {
-        "programs": matching_programs,
-        "experts": matching_experts
+        "programs": _search_matches(query, index["programs"], threshold, limit),
+        "experts": _search_matches(query, index["experts"], threshold, limit)
     }
@@ -0,0 +1,576 @@
+"""
+Deterministic rule engine module.
+Resolves mechanically checkable QCB requirements (capital thresholds, data
+hosting location, board size, mandatory roles) from extracted facts, so only
+the remaining rules need to be judged by Claude.
+
+Only plain statements of fact are decided. Requirements, plans, targets and
+negated or qualified statements are left undecided; their findings are
+returned as hints for Claude instead of resolving the rule.
+
+A predicate checks one condition of a rule, so a failed check resolves the
+rule but a passed one only becomes a hint, unless the predicate sets
+"covers_rule" because it checks every condition of the rule.
+"""
+
+import json
+import logging
+import pathlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cache for loaded predicates
+_predicates_cache = None
+
+# Required fields per check type
+CHECK_FIELDS = {
+    "money": ("context",),
+    "location": ("context", "allowed"),
+    "count": ("context", "nouns", "min"),
+    "role": ("roles",)
+}
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12
+}
+
+_MONEY_MULTIPLIERS = {
+    "k": 1_000, "thousand": 1_000,
+    "m": 1_000_000, "mn": 1_000_000, "million": 1_000_000,
+    "bn": 1_000_000_000, "billion": 1_000_000_000
+}
+
+_AMOUNT = r"(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|mn|m|million|bn|billion)?\b"
+_CURRENCY = r"(?:qar|qr|qatari riyals?|riyals?)"
+_MONEY_PATTERNS = [
+    re.compile(rf"\b{_CURRENCY}\s*{_AMOUNT}", re.IGNORECASE),
+    re.compile(rf"\b{_AMOUNT}\s*{_CURRENCY}\b", re.IGNORECASE)
+]
+
+# Place names mapped to the country they are in
+_LOCATIONS = {
+    "qatar": "Qatar", "doha": "Qatar",
+    "united arab emirates": "UAE", "uae": "UAE", "dubai": "UAE", "abu dhabi": "UAE",
+    "saudi arabia": "Saudi Arabia", "ksa": "Saudi Arabia", "riyadh": "Saudi Arabia",
+    "bahrain": "Bahrain", "kuwait": "Kuwait", "oman": "Oman",
+    "ireland": "Ireland", "dublin": "Ireland",
+    "united kingdom": "United Kingdom", "uk": "United Kingdom", "london": "United Kingdom",
+    "germany": "Germany", "frankfurt": "Germany",
+    "netherlands": "Netherlands", "amsterdam": "Netherlands",
+    "france": "France", "paris": "France",
+    "united states": "United States", "usa": "United States",
+    "singapore": "Singapore",
+    "india": "India", "mumbai": "India",
+    "hong kong": "Hong Kong", "japan": "Japan", "tokyo": "Japan",
+    "australia": "Australia", "sydney": "Australia"
+}
+_LOCATION_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(name) for name in sorted(_LOCATIONS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+
+# Institution names that mention a country without saying where data lives
+_INSTITUTION_PATTERN = re.compile(
+    r"\bqatar (?:central bank|development bank|financial centre|fintech hub)\b", re.IGNORECASE
+)
+
+# Requirements, plans, targets and intentions state no current fact
+_UNDECIDED_PATTERN = re.compile(
+    r"\b(must|shall|should|required|requires?|requirements?|needs? to|will|would|"
+    r"plan(?:s|ned|ning)?|intends?|intended|target(?:s|ed)?|aims?|goals?|expects?|expected|"
+    r"projected|projections?|forecast|propos(?:e|es|ed|al)|evaluat(?:e|es|ed|ing)|"
+    r"consider(?:s|ed|ing)?|explor(?:e|es|ed|ing)|assess(?:es|ed|ing)?|migrat(?:e|es|ed|ing|ion)|"
+    r"mov(?:e|es|ed|ing) to|minimum|at least|action items?|to be appointed|"
+    r"by (?:year \d+|20\d\d|q[1-4]|end of)|within \d+ (?:days|weeks|months|years))\b",
+    re.IGNORECASE
+)
+
+# Hosting verbs; a location counts only as the object of one ("hosted ... in Qatar")
+_HOSTING_VERB = r"\b(?:host|stor|kept|keep|hold|held|hous|locat|resid|process|run)\w*\b"
+_HOSTED_LOCATION_PATTERN = re.compile(
+    _HOSTING_VERB + r"[^.;]{0,60}?\b(?:in|within|inside)\s+(?:the\s+)?(?:[\w-]+\s+){0,2}?"
+    + _LOCATION_PATTERN.pattern,
+    re.IGNORECASE
+)
+# Further locations coordinated with a hosted one ("in Ireland and Singapore")
+_COORDINATED_LOCATION_PATTERN = re.compile(
+    r"\s*(?:,\s*(?:and\s+|or\s+)?|\s+and\s+|\s+or\s+|\s*&\s*)(?:the\s+)?" + _LOCATION_PATTERN.pattern,
+    re.IGNORECASE
+)
+
+# Negations and qualifiers that turn "in Qatar" into something else
+_LOCATION_NEGATION_PATTERN = re.compile(
+    r"\b(no|not|never|outside|except|excluding|other than|rather than|instead of|neither|nor)\b",
+    re.IGNORECASE
+)
+
+# Money that is raised, invested or earned is not paid-up capital
+_FUNDING_PATTERN = re.compile(
+    r"\b(seed|series [a-z]|round|rais(?:e|ed|es|ing)|invest(?:ed|ment|ments|or|ors)|"
+    r"funding|valuation|revenue|loan|grant|venture capital|working capital)\b",
+    re.IGNORECASE
+)
+
+# Verbs stating that a role is filled; the role must be within a few words
+_APPOINTMENT_PATTERN = re.compile(
+    r"\b(appointed|designated|hired|named|engaged|employs?|employed|onboarded|in place|"
+    r"serves as|serving as|acts as|acting as)\b",
+    re.IGNORECASE
+)
+_ROLE_DISTANCE_WORDS = 12
+
+# Negation of an appointment verb within its own clause
+_APPOINTMENT_NEGATION_PATTERN = re.compile(r"\b(not|no|never|yet to|nobody|none)\b", re.IGNORECASE)
+
+# Clause boundaries inside a sentence, so "has no prior experience but has
+# been appointed" negates the experience, not the appointment
+_CLAUSE_SPLIT = re.compile(r",|\s+-\s+|\b(?:but|although|though|while|whereas|however)\b", re.IGNORECASE)
+
+# Wording that makes a later count part of an earlier one ("5 directors,
+# including 2 independent directors"), so the counts can't be added up
+_SUBSET_PATTERN = re.compile(r"\b(including|incl|of whom|of which|of them|among them|among whom|out of)\b", re.IGNORECASE)
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+
+def load_predicates(path: str = None) -> List[Dict]:
+    """
+    Load declarative rule predicates from JSON.
+
+    Args:
+        path: Predicates file (defaults to data/rule_predicates.json)
+
+    Returns:
+        List of predicate dictionaries
+
+    Raises:
+        FileNotFoundError: If the predicates file doesn't exist
+        ValueError: If a predicate has an unknown check or missing fields
+    """
+    global _predicates_cache
+
+    if path is None and _predicates_cache is not None:
+        return _predicates_cache
+
+    predicates_path = pathlib.Path(path) if path else pathlib.Path(__file__).parent / "data" / "rule_predicates.json"
+
+    if not predicates_path.exists():
+        logger.error(f"Predicates file not found at {predicates_path}")
+        raise FileNotFoundError(f"Predicates file not found: {predicates_path}")
+
+    with open(predicates_path, "r", encoding="utf-8") as f:
+        predicates = json.load(f)
+
+    for predicate in predicates:
+        validate_predicate(predicate)
+
+    logger.info(f"Loaded {len(predicates)} rule predicates")
+    if path is None:
+        _predicates_cache = predicates
+    return predicates
+
+
+def validate_predicate(predicate: Dict):
+    """
+    Check that a predicate is well formed.
+
+    Raises:
+        ValueError: If the check type is unknown or required fields are missing
+    """
+    check = predicate.get("check")
+    if "rule" not in predicate or check not in CHECK_FIELDS:
+        raise ValueError(f"Invalid rule predicate: {predicate}")
+
+    missing = [field for field in CHECK_FIELDS[check] if field not in predicate]
+    if check == "money" and "fail_below" not in predicate and "pass_at_least" not in predicate:
+        missing.append("fail_below/pass_at_least")
+    if missing:
+        raise ValueError(f"Predicate for {predicate['rule']} is missing {', '.join(missing)}")
+
+
+def extract_money(text: str) -> List[int]:
+    """
+    Extract QAR amounts from text.
+
+    Handles "QAR 5,000,000", "QR 5M", "QAR 7.5 million" and "5 million QAR".
+
+    Args:
+        text: Text to scan
+
+    Returns:
+        Amounts in QAR, in order of appearance
+    """
+    found = []
+    for pattern in _MONEY_PATTERNS:
+        for match in pattern.finditer(text):
+            number = float(match.group(1).replace(",", ""))
+            multiplier = _MONEY_MULTIPLIERS.get((match.group(2) or "").lower(), 1)
+            found.append((match.start(), int(round(number * multiplier))))
+    return [amount for _, amount in sorted(found)]
+
+
+def extract_locations(text: str) -> List[str]:
+    """
+    Extract countries mentioned in text.
+
+    Args:
+        text: Text to scan
+
+    Returns:
+        Distinct country names in order of appearance
+    """
+    text = _INSTITUTION_PATTERN.sub(" ", text)
+    countries = []
+    for match in _LOCATION_PATTERN.finditer(text):
+        country = _LOCATIONS[match.group(1).lower()]
+        if country not in countries:
+            countries.append(country)
+    return countries
+
+
+def extract_hosting_locations(text: str) -> List[str]:
+    """
+    Extract countries that are the object of a hosting verb, e.g.
+    "hosted on AWS in Ireland and Singapore" or "stored within Qatar".
+
+    Args:
+        text: Text to scan
+
+    Returns:
+        Distinct country names in order of appearance
+    """
+    text = _INSTITUTION_PATTERN.sub(" ", text)
+    countries = []
+    for match in _HOSTED_LOCATION_PATTERN.finditer(text):
+        names = [match.group(match.lastindex)]
+        end = match.end()
+        while True:
+            coordinated = _COORDINATED_LOCATION_PATTERN.match(text, end)
+            if coordinated is None:
+                break
+            names.append(coordinated.group(1))
+            end = coordinated.end()
+
+        for name in names:
+            country = _LOCATIONS[name.lower()]
+            if country not in countries:
+                countries.append(country)
+    return countries
+
+
+def extract_counts(text: str, nouns: List[str]) -> List[int]:
+    """
+    Extract counts of the given nouns, e.g. "2 directors" or "five board members".
+
+    Args:
+        text: Text to scan
+        nouns: Nouns being counted
+
+    Returns:
+        Counts in order of appearance
+    """
+    pattern = re.compile(
+        r"\b(\d+|" + "|".join(_NUMBER_WORDS) + r")\s+(?:[a-z-]+\s+){0,2}?(?:"
+        + "|".join(re.escape(noun) for noun in sorted(nouns, key=len, reverse=True)) + r")\b",
+        re.IGNORECASE
+    )
+    counts = []
+    for match in pattern.finditer(text):
+        value = match.group(1).lower()
+        counts.append(int(value) if value.isdigit() else _NUMBER_WORDS[value])
+    return counts
+
+
+def extract_role_status(text: str, roles: List[str]) -> Optional[bool]:
+    """
+    Decide whether text says a role is filled.
+
+    The role must be within a few words of an appointment verb ("has been
+    appointed", "hired a ..."), and only a negation in the verb's own clause
+    counts ("has no prior experience but has been appointed" is filled).
+    "No compliance officer" or a vacant role is a plain statement of absence.
+
+    Args:
+        text: Text to scan
+        roles: Names of the role
+
+    Returns:
+        True if the role is stated as filled, False if stated as missing,
+        None if the text doesn't mention the role, states a requirement or
+        plan, or is unclear
+    """
+    lowered = text.lower()
+    role_positions = [match.start() for role in roles for match in re.finditer(re.escape(role), lowered)]
+    if not role_positions or _UNDECIDED_PATTERN.search(text):
+        return None
+
+    role_pattern = "|".join(re.escape(role) for role in roles)
+    if re.search(
+        rf"\b(?:no|without|lacks?|lacking)\s+(?:an?\s+|the\s+)?(?:[\w-]+\s+)?(?:{role_pattern})\b"
+        rf"|\b(?:yet to|not yet)\s+(?:appoint|hire|designate|name)\s+(?:an?\s+|the\s+)?(?:[\w-]+\s+)?(?:{role_pattern})\b"
+        rf"|(?:{role_pattern})\s+(?:\w+\s+){{0,2}}(?:is|remains)\s+(?:vacant|unfilled)\b",
+        lowered
+    ):
+        return False
+
+    statuses = set()
+    offset = 0
+    for clause in _CLAUSE_SPLIT.split(text):
+        start = lowered.find(clause.lower(), offset)
+        offset = start + len(clause)
+        for verb in _APPOINTMENT_PATTERN.finditer(clause):
+            verb_start = start + verb.start()
+            near = any(
+                len(lowered[min(position, verb_start):max(position, verb_start)].split()) <= _ROLE_DISTANCE_WORDS
+                for position in role_positions
+            )
+            if near:
+                statuses.add(not _APPOINTMENT_NEGATION_PATTERN.search(clause[:verb.start()]))
+
+    if len(statuses) == 1:
+        return statuses.pop()
+    return None
+
+
+def evaluate(texts: List[str], predicates: List[Dict] = None) -> Dict[str, Dict]:
+    """
+    Resolve rules against all the given texts taken together.
+
+    Args:
+        texts: Document chunks, summaries or clauses
+        predicates: Predicates to evaluate (defaults to load_predicates())
+
+    Returns:
+        Mapping of rule reference to resolution for every rule that could be
+        decided locally: failed rules, and passed rules whose predicate
+        covers the whole rule. Each resolution has rule_ref, check, status
+        ('pass' or 'fail'), evidence, explanation, severity and action.
+    """
+    return evaluate_with_hints(texts, predicates)[0]
+
+
+def evaluate_with_hints(texts: List[str], predicates: List[Dict] = None) -> Tuple[Dict[str, Dict], Dict[str, List[Dict]]]:
+    """
+    Resolve rules against all the given texts, keeping the findings of the
+    rules that could not be decided.
+
+    Args:
+        texts: Document chunks, summaries or clauses
+        predicates: Predicates to evaluate (defaults to load_predicates())
+
+    Returns:
+        Tuple of (resolutions as returned by evaluate(), hints): hints map
+        each unresolved rule with findings, including passed checks of
+        a single condition, to a list of dictionaries with
+        'evidence', 'status' ('pass', 'fail' or None) and 'explanation'
+    """
+    if predicates is None:
+        predicates = load_predicates()
+    return _evaluate(_split_sentences(texts), predicates)
+
+
+def evaluate_each(texts: List[str], predicates: List[Dict] = None) -> List[Dict[str, Dict]]:
+    """
+    Resolve rules separately for each text, e.g. one result per clause.
+
+    Args:
+        texts: Texts to evaluate independently
+        predicates: Predicates to evaluate (defaults to load_predicates())
+
+    Returns:
+        One evaluate() result per text
+    """
+    if predicates is None:
+        predicates = load_predicates()
+    return [_evaluate(_split_sentences([text]), predicates)[0] for text in texts]
+
+
+def format_hints(hints: Dict[str, List[Dict]], rule_refs: List[str] = None) -> str:
+    """
+    Format undecided findings as prompt text for Claude.
+
+    Args:
+        hints: Hints from evaluate_with_hints()
+        rule_refs: Only include these rules (defaults to all)
+
+    Returns:
+        Prompt section, or '' if there are no hints
+    """
+    lines = []
+    for rule_ref, findings in hints.items():
+        if rule_refs is not None and rule_ref not in rule_refs:
+            continue
+        for finding in findings:
+            explanation = finding["explanation"]
+            if finding["status"] == "pass":
+                explanation += "; the rule's other conditions were not checked"
+            lines.append(f"- {rule_ref}: \"{finding['evidence']}\" ({explanation})")
+
+    if not lines:
+        return ""
+    return (
+        "AUTOMATED PRE-CHECK FINDINGS (unconfirmed; verify against the evidence before relying on them):\n"
+        + "\n".join(lines)
+    )
+
+
+def _split_sentences(texts: List[str]) -> List[str]:
+    sentences = []
+    seen = set()
+    for text in texts:
+        for sentence in _SENTENCE_SPLIT.split(text or ""):
+            sentence = sentence.strip()
+            if sentence and sentence not in seen:
+                seen.add(sentence)
+                sentences.append(sentence)
+    return sentences
+
+
+def _evaluate(sentences: List[str], predicates: List[Dict]) -> Tuple[Dict[str, Dict], Dict[str, List[Dict]]]:
+    resolved = {}
+    hints = {}
+    for predicate in predicates:
+        if predicate["rule"] in resolved:
+            continue
+        findings = []
+        for sentence in sentences:
+            finding = _CHECKS[predicate["check"]](sentence, predicate)
+            if finding is not None:
+                findings.append((sentence, *finding))
+
+        resolution = _decide(predicate, findings)
+        if resolution is not None and (resolution["status"] == "fail" or predicate.get("covers_rule")):
+            resolved[predicate["rule"]] = resolution
+            hints.pop(predicate["rule"], None)
+        elif findings:
+            hints.setdefault(predicate["rule"], []).extend(
+                {"evidence": evidence, "status": status, "explanation": explanation}
+                for evidence, status, explanation in findings
+            )
+    return resolved, hints
+
+
+def _decide(predicate: Dict, findings: List) -> Optional[Dict]:
+    """
+    Combine per-sentence findings into one resolution.
+
+    A rule is resolved only when every finding is decided and they agree;
+    undecided or conflicting findings leave it to Claude.
+    """
+    if not findings:
+        return None
+
+    statuses = {status for _, status, _ in findings}
+    if len(statuses) != 1 or None in statuses:
+        return None
+    status = statuses.pop()
+
+    evidence, _, explanation = findings[0]
+    return {
+        "rule_ref": predicate["rule"],
+        "check": predicate["check"],
+        "status": status,
+        "evidence": evidence,
+        "explanation": explanation,
+        "severity": predicate.get("severity", "medium"),
+        "action": predicate.get("action") if status == "fail" else None
+    }
+
+
+def _mentions(sentence: str, keywords: List[str]) -> bool:
+    lowered = sentence.lower()
+    return any(keyword in lowered for keyword in keywords)
+
+
+def _check_money(sentence: str, predicate: Dict):
+    if not _mentions(sentence, predicate["context"]):
+        return None
+    amounts = extract_money(sentence)
+    if not amounts or _FUNDING_PATTERN.search(sentence):
+        return None
+
+    label = predicate.get("label", "Amount")
+    if _UNDECIDED_PATTERN.search(sentence):
+        return None, f"{label}: stated as a requirement, plan or target"
+
+    fail_below = predicate.get("fail_below")
+    pass_at_least = predicate.get("pass_at_least")
+    if len(amounts) > 1:
+        return None, f"{label}: several amounts stated"
+
+    amount = amounts[0]
+    if fail_below is not None and amount < fail_below:
+        return "fail", f"{label} of QAR {amount:,} is below the QAR {fail_below:,} minimum"
+    if pass_at_least is not None and amount >= pass_at_least:
+        return "pass", f"{label} of QAR {amount:,} meets the QAR {pass_at_least:,} minimum"
+    return None, f"{label} of QAR {amount:,} depends on the licence category"
+
+
+def _check_location(sentence: str, predicate: Dict):
+    if not _mentions(sentence, predicate["context"]):
+        return None
+    countries = extract_locations(sentence)
+    if not countries:
+        return None
+
+    label = predicate.get("label", "Location")
+    if _UNDECIDED_PATTERN.search(sentence):
+        return None, f"{label}: stated as a requirement, plan or evaluation"
+    if _LOCATION_NEGATION_PATTERN.search(sentence):
+        return None, f"{label}: location is negated or qualified"
+
+    hosted = extract_hosting_locations(sentence)
+    if not hosted:
+        return None
+    if len(hosted) < len(countries):
+        others = [country for country in countries if country not in hosted]
+        return None, f"{label}: hosted in {', '.join(hosted)}, also mentions {', '.join(others)}"
+
+    outside = [country for country in hosted if country not in predicate["allowed"]]
+    if outside:
+        return "fail", f"{label} is in {', '.join(outside)}, outside {', '.join(predicate['allowed'])}"
+    return "pass", f"{label} is in {', '.join(hosted)}"
+
+
+def _check_count(sentence: str, predicate: Dict):
+    if not _mentions(sentence, predicate["context"]):
+        return None
+    counts = extract_counts(sentence, predicate["nouns"])
+    if not counts:
+        return None
+
+    label = predicate.get("label", "Count")
+    if _UNDECIDED_PATTERN.search(sentence):
+        return None, f"{label}: stated as a requirement, plan or target"
+    if len(counts) > 1 and _SUBSET_PATTERN.search(sentence):
+        return None, f"{label}: several overlapping counts stated"
+
+    # "2 board members and 1 independent director" is a board of 3
+    total = sum(counts)
+    if total < predicate["min"]:
+        return "fail", f"{label} of {total} is below the minimum of {predicate['min']}"
+    return "pass", f"{label} of {total} meets the minimum of {predicate['min']}"
+
+
+def _check_role(sentence: str, predicate: Dict):
+    label = predicate.get("label", "Role")
+    filled = extract_role_status(sentence, predicate["roles"])
+    if filled is None:
+        if _mentions(sentence, predicate["roles"]) and _UNDECIDED_PATTERN.search(sentence):
+            return None, f"{label}: stated as a requirement or plan"
+        return None
+    if filled:
+        return "pass", f"{label} is appointed"
+    return "fail", f"{label} is not appointed"
+
+
+_CHECKS = {
+    "money": _check_money,
+    "location": _check_location,
+    "count": _check_count,
+    "role": _check_role
+}
@@ -4,16 +4,41 @@ Loads and provides access to QCB regulatory requirements.
 """
 
 import json
+import os
 import pathlib
 import logging
+import threading
 from typing import List, Dict
 
+import numpy as np
+
+import embedding_store
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Cache for loaded rules
+RULES_PATH = pathlib.Path(__file__).parent / "data" / "rules.json"
+
+# Cache for loaded rules; replaced as a whole on reload, never mutated, so a
+# caller holding the list keeps a consistent snapshot
 _rules_cache = None
 
+# Normalized rule embeddings and the rules list they are row-aligned with
+_rule_embeddings = None
+
+# Serializes swapping the rules and their derived caches
+_swap_lock = threading.Lock()
+
+# Rule pre-filtering for LLM prompts
+RULE_SIMILARITY_THRESHOLD = float(os.getenv("RULE_SIMILARITY_THRESHOLD", "0.3"))
+RULE_MIN_SELECTED = int(os.getenv("RULE_MIN_SELECTED", "3"))
+RULE_MAX_SELECTED = int(os.getenv("RULE_MAX_SELECTED", "20"))
+RULE_MUST_INCLUDE_CATEGORIES = [
+    category.strip()
+    for category in os.getenv("RULE_MUST_INCLUDE_CATEGORIES", "").split(",")
+    if category.strip()
+]
+
 
 def load_rules() -> List[Dict]:
     """
@@ -25,38 +50,115 @@ def load_rules() -> List[Dict]:
     Raises:
         FileNotFoundError: If rules.json doesn't exist
         json.JSONDecodeError: If rules.json is invalid
+        ValueError: If a rule is malformed
     """
     global _rules_cache
 
     if _rules_cache is not None:
         return _rules_cache
 
-    rules_path = pathlib.Path(__file__).parent / "data" / "rules.json"
+    rules = read_rules()
+    with _swap_lock:
+        if _rules_cache is None:
+            _rules_cache = rules
+        return _rules_cache
 
-    if not rules_path.exists():
-        logger.error(f"Rules file not found at {rules_path}")
-        raise FileNotFoundError(f"Rules file not found: {rules_path}")
 
-    try:
-        with open(rules_path, "r", encoding="utf-8") as f:
-            _rules_cache = json.load(f)
+def read_rules(path: str = None) -> List[Dict]:
+    """
+    Read and validate a rules file without touching the cache.
 
-        logger.info(f"Loaded {len(_rules_cache)} regulatory rules")
-        return _rules_cache
+    Args:
+        path: Rules file (defaults to data/rules.json)
 
+    Returns:
+        List of rule dictionaries
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        json.JSONDecodeError: If the file is invalid JSON
+        ValueError: If a rule is malformed
+    """
+    path = pathlib.Path(path) if path else RULES_PATH
+
+    if not path.exists():
+        logger.error(f"Rules file not found at {path}")
+        raise FileNotFoundError(f"Rules file not found: {path}")
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON in rules file: {e}")
         raise
 
+    validate_rules(rules)
+    logger.info(f"Loaded {len(rules)} regulatory rules")
+    return rules
 
-def get_rules_text() -> str:
+
+def validate_rules(rules: List[Dict]):
+    """
+    Check that a rulebook is well formed.
+
+    Raises:
+        ValueError: If it is not a non-empty list of rules with string
+            'ref', 'title' and 'text' and unique references
+    """
+    if not isinstance(rules, list) or not rules:
+        raise ValueError("Rules file must contain a non-empty list of rules")
+
+    refs = set()
+    for rule in rules:
+        if not isinstance(rule, dict) or not all(
+            isinstance(rule.get(field), str) and rule[field].strip() for field in ("ref", "title", "text")
+        ):
+            raise ValueError(f"Invalid rule: {rule}")
+        if rule["ref"] in refs:
+            raise ValueError(f"Duplicate rule reference: {rule['ref']}")
+        refs.add(rule["ref"])
+
+
+def reload_rules() -> List[Dict]:
     """
-    Get formatted text representation of all rules for LLM prompts.
+    Re-read rules.json and swap it in with its derived caches.
+
+    The new rules are validated and, if rule embeddings were in use, embedded
+    before anything is replaced, so requests never see rules without their
+    embeddings and a bad file leaves the current rules in place.
 
     Returns:
-        Formatted string with all rules
+        The new list of rules
+
+    Raises:
+        FileNotFoundError, json.JSONDecodeError, ValueError: If the file
+            cannot be loaded; the current rules are kept
     """
-    rules = load_rules()
+    global _rules_cache, _rule_embeddings
+
+    rules = read_rules()
+    embeddings = _build_rule_embeddings(rules) if _rule_embeddings is not None else None
+
+    with _swap_lock:
+        _rule_embeddings = embeddings
+        _rules_cache = rules
+
+    logger.info(f"Reloaded {len(rules)} regulatory rules")
+    return rules
+
+
+def get_rules_text(rules: List[Dict] = None) -> str:
+    """
+    Get formatted text representation of rules for LLM prompts.
+
+    Args:
+        rules: Subset of rules to format (defaults to all rules)
+
+    Returns:
+        Formatted string with the rules
+    """
+    if rules is None:
+        rules = load_rules()
 
     formatted = []
     for rule in rules:
@@ -67,6 +169,126 @@ def get_rules_text() -> str:
     return "\n\n".join(formatted)
 
 
+def get_rule_category(rule: Dict) -> str:
+    """
+    Get the category of a rule from its reference, e.g. "QCB 2.1.1" -> "2".
+
+    Args:
+        rule: Rule dictionary
+
+    Returns:
+        Category string, or empty string if the reference has no category
+    """
+    parts = rule["ref"].split()
+    if len(parts) > 1:
+        return parts[1].split(".")[0]
+    return ""
+
+
+def get_rule_embeddings(rules: List[Dict] = None) -> np.ndarray:
+    """
+    Get normalized embeddings of all rules, loaded from the embedding store
+    or encoded once and stored for other processes.
+
+    Args:
+        rules: Rules snapshot to embed (defaults to load_rules())
+
+    Returns:
+        Array of shape (num_rules, dimension) aligned with the rules
+    """
+    global _rule_embeddings
+
+    if rules is None:
+        rules = load_rules()
+
+    cached = _rule_embeddings
+    if cached is not None and cached["rules"] is rules:
+        return cached["embeddings"]
+
+    entry = _build_rule_embeddings(rules)
+    with _swap_lock:
+        # A request still holding replaced rules must not evict the current ones
+        if rules is _rules_cache:
+            _rule_embeddings = entry
+    return entry["embeddings"]
+
+
+def _build_rule_embeddings(rules: List[Dict]) -> Dict:
+    # Imported here so loading rules does not pull in the embedding stack
+    from rag import EMBEDDING_MODEL, embed_texts
+
+    embeddings = embedding_store.load_or_build(
+        "rules",
+        EMBEDDING_MODEL,
+        [rule["ref"] for rule in rules],
+        [f"{rule['title']}. {rule['text']}" for rule in rules],
+        encode=embed_texts
+    )
+    logger.info(f"Rule embeddings ready for {len(rules)} regulatory rules")
+    return {"rules": rules, "embeddings": embeddings}
+
+
+def select_relevant_rules(evidence_embeddings: np.ndarray,
+                          threshold: float = None,
+                          must_include_categories: List[str] = None,
+                          max_rules: int = None) -> List[Dict]:
+    """
+    Select the rules relevant to the retrieved evidence.
+
+    A rule is selected if its category is in must_include_categories, or if
+    its best cosine similarity to any evidence embedding reaches threshold.
+    The RULE_MIN_SELECTED most similar rules are always kept, and at most
+    max_rules are returned, in rulebook order. If the must-include rules
+    alone exceed max_rules, the most similar of them are kept.
+
+    Args:
+        evidence_embeddings: Normalized embeddings of evidence chunks and summary
+        threshold: Minimum similarity (defaults to RULE_SIMILARITY_THRESHOLD)
+        must_include_categories: Categories always included
+            (defaults to RULE_MUST_INCLUDE_CATEGORIES)
+        max_rules: Maximum rules returned (defaults to RULE_MAX_SELECTED)
+
+    Returns:
+        List of selected rule dictionaries
+    """
+    threshold = RULE_SIMILARITY_THRESHOLD if threshold is None else threshold
+    if must_include_categories is None:
+        must_include_categories = RULE_MUST_INCLUDE_CATEGORIES
+    max_rules = RULE_MAX_SELECTED if max_rules is None else max_rules
+
+    rules = load_rules()
+    if len(evidence_embeddings) == 0:
+        return rules[:max_rules]
+
+    # Best similarity of each rule to any piece of evidence
+    similarity = (evidence_embeddings @ get_rule_embeddings(rules).T).max(axis=0)
+    ranked = np.argsort(-similarity)
+
+    must_include = {
+        i for i, rule in enumerate(rules)
+        if get_rule_category(rule) in must_include_categories
+    }
+    by_similarity = [
+        i for rank, i in enumerate(ranked)
+        if rank < RULE_MIN_SELECTED or similarity[i] >= threshold
+    ]
+
+    # Most similar first, so the cap drops the least relevant must-include rules
+    selected = sorted(must_include, key=lambda i: (-similarity[i], i))
+    for i in by_similarity:
+        if len(selected) >= max_rules:
+            break
+        if i not in must_include:
+            selected.append(i)
+
+    selected = sorted(selected[:max_rules])
+    logger.info(
+        f"Selected {len(selected)} of {len(rules)} rules "
+        f"(threshold={threshold}, must_include={must_include_categories})"
+    )
+    return [rules[i] for i in selected]
+
+
 def get_rule_by_ref(ref: str) -> Dict:
     """
     Get a specific rule by its reference code.
@@ -108,23 +330,21 @@ def search_rules(keyword: str) -> List[Dict]:
     return matches
 
 
-def get_rules_summary() -> dict:
+def get_rules_summary(rules: List[Dict] = None) -> dict:
     """
     Get summary statistics about loaded rules.
 
+    Args:
+        rules: Rules snapshot to summarize (defaults to load_rules())
+
     Returns:
         Dictionary with rule statistics
     """
-    rules = load_rules()
+    if rules is None:
+        rules = load_rules()
 
     # Extract categories from rule references
-    categories = set()
-    for rule in rules:
-        # Extract category from ref like "QCB 2.1.1" -> "2"
-        parts = rule["ref"].split()
-        if len(parts) > 1:
-            cat = parts[1].split(".")[0]
-            categories.add(cat)
+    categories = {get_rule_category(rule) for rule in rules} - {""}
 
     return {
         "total_rules": len(rules),
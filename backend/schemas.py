@@ -0,0 +1,120 @@
+"""
+Structured output schemas module.
+Pydantic models for Claude's gap analysis and clause mapping, and the
+Anthropic tool definitions generated from them.
+"""
+
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+# Common severity wording the model uses instead of high/medium/low
+_SEVERITY_ALIASES = {
+    "critical": "high",
+    "major": "high",
+    "moderate": "medium",
+    "med": "medium",
+    "minor": "low"
+}
+
+
+class Gap(BaseModel):
+    """A single compliance gap identified by Claude."""
+
+    title: str = Field(description="Brief gap title")
+    rule_ref: str = Field(default="", description="QCB regulation reference, e.g. QCB 2.1.1")
+    evidence: str = Field(default="", description="What the startup currently has (or lacks)")
+    explanation: str = Field(default="", description="Clear explanation of the compliance gap")
+    severity: Literal["high", "medium", "low"] = Field(description="Gap severity")
+
+    @field_validator("severity", mode="before")
+    @classmethod
+    def normalize_severity(cls, value):
+        if isinstance(value, str):
+            value = value.strip().lower()
+            return _SEVERITY_ALIASES.get(value, value)
+        return value
+
+
+class GapAnalysis(BaseModel):
+    """Gap analysis returned by the report_gaps tool."""
+
+    gaps: List[Gap] = Field(default_factory=list, description="Identified compliance gaps")
+    notes: List[str] = Field(default_factory=list, description="Additional observations")
+    confidence: Optional[float] = Field(
+        default=None, ge=0, le=1, description="Overall confidence in the analysis from 0 to 1"
+    )
+
+    @field_validator("notes", mode="before")
+    @classmethod
+    def coerce_notes(cls, value):
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, list):
+            return [note if isinstance(note, str) else str(note) for note in value]
+        return value
+
+
+class ClauseMapping(BaseModel):
+    """Clause-to-rule mapping returned by the map_clause tool."""
+
+    mapped_rule: str = Field(description="Best matching QCB rule, e.g. QCB 2.1.1")
+    compliance: Literal["yes", "no"] = Field(description="Whether the clause complies with the rule")
+    reason: str = Field(description="Detailed explanation of compliance status")
+    confidence: Optional[float] = Field(default=None, ge=0, le=1, description="Confidence from 0 to 1")
+    action_required: Optional[str] = Field(
+        default=None, description="Specific action if non-compliant, null if compliant"
+    )
+
+    @field_validator("compliance", mode="before")
+    @classmethod
+    def normalize_compliance(cls, value):
+        return value.strip().lower() if isinstance(value, str) else value
+
+
+def tool_definition(name: str, description: str, model: type) -> Dict:
+    """
+    Build an Anthropic tool definition whose input schema is a pydantic model.
+
+    Args:
+        name: Tool name
+        description: What the tool is for
+        model: Pydantic model describing the tool input
+
+    Returns:
+        Tool definition for messages.create(tools=[...])
+    """
+    return {
+        "name": name,
+        "description": description,
+        "input_schema": _inline_refs(model.model_json_schema())
+    }
+
+
+def _inline_refs(schema: Dict) -> Dict:
+    """Replace $ref pointers with their $defs so the schema is self-contained."""
+    definitions = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(dict(definitions[node["$ref"].split("/")[-1]]))
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+
+    return resolve(schema)
+
+
+REPORT_GAPS_TOOL = tool_definition(
+    "report_gaps",
+    "Report the compliance gaps and observations found in the startup documentation.",
+    GapAnalysis
+)
+
+MAP_CLAUSE_TOOL = tool_definition(
+    "map_clause",
+    "Report the QCB rule a startup clause maps to and whether it complies.",
+    ClauseMapping
+)
@@ -6,6 +6,8 @@ Calculates readiness scores based on identified regulatory gaps.
 from typing import List, Dict
 import logging
 
+import metrics
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -155,6 +157,7 @@ def needs_expert_review(score: int, gaps: List[Dict]) -> bool:
     return False
 
 
+@metrics.timed("scoring")
 def get_detailed_score_breakdown(gaps: List[Dict]) -> Dict:
     """
     Get detailed breakdown of score calculation.
@@ -0,0 +1,201 @@
+"""
+Clause segmentation module.
+Splits extracted documents into clause-sized statements with their source
+file, section and position, dropping non-normative boilerplate (headings,
+page furniture, confidentiality notices, signature blocks). Everything is a
+generator so a whole data room can stream into the clause matcher without
+intermediate files.
+
+Usage:
+    for clause in iter_document_clauses(["data-room/"]):
+        ...  # {'clause': ..., 'source': ..., 'section': ..., 'position': ...}
+"""
+
+import logging
+import pathlib
+import re
+from typing import Dict, Iterable, Iterator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md")
+
+# Clauses shorter than this carry no checkable statement
+MIN_CLAUSE_WORDS = 3
+
+# Unpunctuated runs (e.g. PDF tables) are cut into windows of this size
+MAX_CLAUSE_WORDS = 80
+
+# Headings: short upper-case lines (optionally numbered) or Markdown '#' lines
+MAX_HEADING_WORDS = 8
+
+_RULE_LINE = re.compile(r"^[\s=\-_*#~.]+$")
+_BULLET = re.compile(r"^(?:[-*•▪●◦‣–✓✔→]|\(?\d{1,3}[.)]|\(?[a-zA-Z][.)])\s+")
+_SENTENCE_END = re.compile(
+    r"(?<!\be\.g\.)(?<!\bi\.e\.)(?<!\bMr\.)(?<!\bMs\.)(?<!\bDr\.)(?<!\bNo\.)(?<!\bArt\.)(?<!\bvs\.)"
+    r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])"
+)
+
+# Non-normative text: page furniture, notices, signature and revision blocks
+BOILERPLATE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"^page \d+(\s+of\s+\d+)?$",
+    r"^(strictly )?(confidential|private|draft|internal use only)\b[\w\s&-]{0,40}$",
+    r"©|\bcopyright\b|\ball rights reserved\b",
+    r"^table of contents\b",
+    r"\bintentionally left blank\b",
+    r"\b(for information(al)? purposes only|does not constitute (legal|financial|investment) advice)\b",
+    r"^(signature|signed|date|version|revision|prepared by|document (no|number|id|ref))\b\s*[:.\-]?\s*[\w ./,-]{0,40}$",
+)]
+
+
+def is_boilerplate(text: str) -> bool:
+    """
+    Check whether a statement is non-normative boilerplate.
+
+    Args:
+        text: Candidate clause
+
+    Returns:
+        True if the text should not be analyzed
+    """
+    if len(text.split()) < MIN_CLAUSE_WORDS or not re.search(r"[A-Za-z]{2}", text):
+        return True
+    return any(pattern.search(text) for pattern in BOILERPLATE_PATTERNS)
+
+
+def _is_heading(line: str) -> bool:
+    letters = [c for c in line if c.isalpha()]
+    return (
+        bool(letters)
+        and len(line.split()) <= MAX_HEADING_WORDS
+        and all(c.isupper() for c in letters)
+        and not line.endswith((".", ";"))
+    )
+
+
+def split_sentences(text: str) -> Iterator[str]:
+    """
+    Split a paragraph into sentences, cutting overlong runs into windows.
+
+    Args:
+        text: Paragraph text on one line
+
+    Yields:
+        Sentences
+    """
+    for sentence in _SENTENCE_END.split(text):
+        words = sentence.split()
+        for start in range(0, len(words), MAX_CLAUSE_WORDS):
+            yield " ".join(words[start:start + MAX_CLAUSE_WORDS])
+
+
+def segment_text(text: str, source: str) -> Iterator[Dict]:
+    """
+    Segment extracted document text into clauses.
+
+    Upper-case lines become the section of the clauses below them, and a
+    lead-in line ending in ':' is prefixed to the bullets that follow it
+    ("Transaction Monitoring: Manual review above QAR 50,000").
+
+    Args:
+        text: Document text with line breaks kept
+        source: Source label, usually the file name
+
+    Yields:
+        Dictionaries with 'clause', 'source', 'section' and 'position'
+        (ordinal of the clause within the document)
+    """
+    section = ""
+    lead_in = ""
+    position = 0
+    skipped = 0
+
+    for raw_line in text.splitlines():
+        line = " ".join(raw_line.split())
+        if not line or _RULE_LINE.match(line):
+            continue
+
+        bullet = _BULLET.match(line)
+        body = line[bullet.end():] if bullet else line
+
+        if body.startswith("#"):
+            section = body.lstrip("#").strip()
+            lead_in = ""
+            continue
+
+        if _is_heading(body.rstrip(":")):
+            section = body.rstrip(":")
+            lead_in = ""
+            continue
+
+        if body.endswith(":"):
+            lead_in = body[:-1]
+            continue
+
+        if bullet and lead_in:
+            body = f"{lead_in}: {body}"
+        elif not bullet:
+            lead_in = ""
+
+        for sentence in split_sentences(body):
+            if is_boilerplate(sentence):
+                skipped += 1
+                continue
+            position += 1
+            yield {"clause": sentence, "source": source, "section": section, "position": position}
+
+    logger.info(f"Segmented {position} clauses from {source} ({skipped} boilerplate skipped)")
+
+
+def read_document(path: pathlib.Path) -> str:
+    """
+    Extract text from a document with its line structure.
+
+    Args:
+        path: PDF, DOCX, TXT or MD file
+
+    Returns:
+        Extracted text ('' for unsupported or unreadable files)
+    """
+    if path.suffix.lower() in (".txt", ".md"):
+        return path.read_text(encoding="utf-8", errors="replace")
+
+    # Imported here so plain-text segmentation does not pull in the embedding stack
+    from rag import extract_text
+    return extract_text(path.read_bytes(), path.name, keep_lines=True)
+
+
+def iter_documents(paths: Iterable) -> Iterator[pathlib.Path]:
+    """
+    Expand files and directories (recursively) into supported documents.
+
+    Args:
+        paths: File or directory paths
+
+    Yields:
+        Document paths, directories in sorted order
+    """
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            for child in sorted(path.rglob("*")):
+                if child.is_file() and child.suffix.lower() in SUPPORTED_EXTENSIONS:
+                    yield child
+        elif path.suffix.lower() in SUPPORTED_EXTENSIONS:
+            yield path
+        else:
+            logger.warning(f"Skipping unsupported document: {path}")
+
+
+def iter_document_clauses(paths: Iterable) -> Iterator[Dict]:
+    """
+    Stream clauses out of every document under the given paths.
+
+    Args:
+        paths: File or directory paths
+
+    Yields:
+        Clause dictionaries from segment_text(), one document at a time
+    """
+    for path in iter_documents(paths):
+        yield from segment_text(read_document(path), path.name)
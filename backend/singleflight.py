@@ -0,0 +1,214 @@
+"""
+Single-flight request coalescing module.
+Runs identical concurrent computations once and shares the result with every
+caller, both across threads in a worker and across gunicorn worker processes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows development machines
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shared directory for cross-process lock and result files
+SINGLEFLIGHT_DIR = pathlib.Path(
+    os.getenv("SINGLEFLIGHT_DIR", os.path.join(tempfile.gettempdir(), "fintech-singleflight"))
+)
+
+# How long a follower waits for the leader before giving up
+WAIT_TIMEOUT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_TIMEOUT", "180"))
+
+# Result files older than this are pruned
+RESULT_TTL_SECONDS = float(os.getenv("SINGLEFLIGHT_RESULT_TTL", "60"))
+
+# Retry-After suggested to a follower that gave up on a slow leader
+RETRY_AFTER_SECONDS = 15
+
+_LOCK_POLL_SECONDS = 0.05
+
+# In-process registry of in-flight calls keyed by input hash
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class WaitTimeout(TimeoutError):
+    """Raised when a follower gives up waiting for the leader's result."""
+
+    def __init__(self, message: str = "Timed out waiting for identical in-flight request"):
+        super().__init__(message)
+        self.retry_after = RETRY_AFTER_SECONDS
+
+
+class _Call:
+    """An in-flight computation that followers in the same process wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def make_key(*parts: Any) -> str:
+    """
+    Build a stable hash key from the inputs of a computation.
+
+    Args:
+        *parts: JSON-serializable values that fully determine the result
+
+    Returns:
+        Hex SHA-256 digest of the canonical JSON encoding of the parts
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def do(key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+    """
+    Run fn once for all concurrent callers that share the same key.
+
+    The first caller (the leader) runs fn. Callers that arrive while it is in
+    flight wait and receive the same result, or the same exception. Results
+    must be JSON-serializable so they can be handed to other worker processes.
+
+    Args:
+        key: Hash of the computation inputs (see make_key)
+        fn: Zero-argument callable producing the result
+
+    Returns:
+        Tuple of (result, shared) where shared is True if the result was
+        computed by another caller
+
+    Raises:
+        WaitTimeout: If the leader did not finish within WAIT_TIMEOUT_SECONDS
+    """
+    with _inflight_lock:
+        call = _inflight.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _Call()
+            _inflight[key] = call
+
+    if not is_leader:
+        logger.info(f"Coalescing with in-flight computation {key[:12]}")
+        if not call.done.wait(WAIT_TIMEOUT_SECONDS):
+            raise WaitTimeout()
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    try:
+        call.result, shared = _do_across_processes(key, fn)
+        return call.result, shared
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        call.done.set()
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _do_across_processes(key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+    """Coalesce with other worker processes through a lock file per key."""
+    if fcntl is None:
+        return fn(), False
+
+    SINGLEFLIGHT_DIR.mkdir(parents=True, exist_ok=True)
+    lock_path = SINGLEFLIGHT_DIR / f"{key}.lock"
+    result_path = SINGLEFLIGHT_DIR / f"{key}.json"
+
+    with open(lock_path, "a") as lock_file:
+        wait_started = time.time()
+        waited = not _try_lock(lock_file)
+        if waited:
+            logger.info(f"Waiting on computation {key[:12]} in another worker")
+            _lock_with_timeout(lock_file, WAIT_TIMEOUT_SECONDS)
+
+        try:
+            os.utime(lock_path)
+            if waited:
+                result = _read_result(result_path, newer_than=wait_started)
+                if result is not None:
+                    return result, True
+                # The other worker failed; compute it ourselves
+
+            result = fn()
+            _write_result(result_path, result)
+            return result, False
+
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _try_lock(lock_file) -> bool:
+    """Try to take the exclusive lock without blocking."""
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _lock_with_timeout(lock_file, timeout: float):
+    """Block until the exclusive lock is taken or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while not _try_lock(lock_file):
+        if time.monotonic() >= deadline:
+            raise WaitTimeout()
+        time.sleep(_LOCK_POLL_SECONDS)
+
+
+def _read_result(result_path: pathlib.Path, newer_than: float):
+    """Read a result file written after the given timestamp, if any."""
+    try:
+        if result_path.stat().st_mtime < newer_than:
+            return None
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_result(result_path: pathlib.Path, result: Any):
+    """Atomically publish a result for followers in other processes."""
+    tmp_path = result_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, result_path)
+    except (TypeError, OSError) as e:
+        logger.warning(f"Could not share result {result_path.stem[:12]}: {e}")
+        tmp_path.unlink(missing_ok=True)
+        return
+
+    _prune_results()
+
+
+def _prune_results():
+    """Remove result files past their TTL and lock files nobody holds."""
+    now = time.time()
+    lock_cutoff = now - max(RESULT_TTL_SECONDS, WAIT_TIMEOUT_SECONDS) * 2
+    for path in SINGLEFLIGHT_DIR.iterdir():
+        try:
+            mtime = path.stat().st_mtime
+            if path.suffix != ".lock":
+                if mtime < now - RESULT_TTL_SECONDS:
+                    path.unlink()
+            elif mtime < lock_cutoff:
+                with open(path, "a") as lock_file:
+                    if _try_lock(lock_file):
+                        path.unlink()
+        except FileNotFoundError:
+            continue
@@ -0,0 +1,199 @@
+"""
+Structured output module.
+Forces Claude to answer through a tool whose input schema is a pydantic model,
+validates the result, and repairs invalid output with a small follow-up call
+instead of re-running the full prompt.
+"""
+
+import json
+import logging
+from typing import Dict, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+import llm_resilience
+import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+REPAIR_SYSTEM_PROMPT = (
+    "You fix tool inputs that failed schema validation. Keep the content the same, "
+    "only correct the structure, field names and values named in the errors. "
+    "Call the tool with the corrected input."
+)
+
+# Output budget for the repair call; it only re-emits the tool input
+REPAIR_MAX_TOKENS = 2000
+
+
+def create_structured(client, model_cls: Type[T], tool: Dict, usage: Dict = None, **kwargs) -> T:
+    """
+    Call Claude with a forced tool and return the validated tool input.
+
+    The call goes through llm_resilience, so transport errors and responses
+    with no usable tool input are retried. Input that fails validation gets
+    one repair call carrying only the invalid input and the errors.
+
+    Args:
+        client: Anthropic client
+        model_cls: Pydantic model the tool input must satisfy
+        tool: Tool definition built from model_cls (see schemas.tool_definition)
+        usage: Optional dict that input_tokens and output_tokens of every
+            response, including retries and the repair call, are added to
+        **kwargs: Arguments for client.messages.create (model, system, messages, ...)
+
+    Returns:
+        Validated model_cls instance
+
+    Raises:
+        ValidationError: If the input is still invalid after the repair call
+        ValueError: If no tool input could be extracted after retries
+    """
+    raw = llm_resilience.create_message(
+        client,
+        parse=_tool_input_parser(tool["name"], usage),
+        tools=[tool],
+        tool_choice={"type": "tool", "name": tool["name"]},
+        **kwargs
+    )
+
+    try:
+        return _validate(model_cls, raw)
+    except ValidationError as e:
+        logger.warning(
+            f"{tool['name']} output failed validation ({e.error_count()} errors), repairing"
+        )
+        repaired = llm_resilience.create_message(
+            client,
+            parse=_tool_input_parser(tool["name"], usage),
+            **_repair_request(tool, raw, e, model=kwargs["model"])
+        )
+        return _validate(model_cls, repaired)
+
+
+async def acreate_structured(client, model_cls: Type[T], tool: Dict, usage: Dict = None,
+                             **kwargs) -> T:
+    """
+    Asyncio counterpart of create_structured() for an AsyncAnthropic client.
+
+    Args:
+        client: AsyncAnthropic client
+        model_cls: Pydantic model the tool input must satisfy
+        tool: Tool definition built from model_cls
+        usage: Optional dict accumulating input_tokens and output_tokens
+        **kwargs: Arguments for client.messages.create
+
+    Returns:
+        Validated model_cls instance
+    """
+    raw = await llm_resilience.acreate_message(
+        client,
+        parse=_tool_input_parser(tool["name"], usage),
+        tools=[tool],
+        tool_choice={"type": "tool", "name": tool["name"]},
+        **kwargs
+    )
+
+    try:
+        return _validate(model_cls, raw)
+    except ValidationError as e:
+        logger.warning(
+            f"{tool['name']} output failed validation ({e.error_count()} errors), repairing"
+        )
+        repaired = await llm_resilience.acreate_message(
+            client,
+            parse=_tool_input_parser(tool["name"], usage),
+            **_repair_request(tool, raw, e, model=kwargs["model"])
+        )
+        return _validate(model_cls, repaired)
+
+
+def _tool_input_parser(tool_name: str, usage: Dict = None):
+    """Build a parse callable that extracts the tool input and tallies token usage."""
+    def parse(message):
+        if usage is not None and getattr(message, "usage", None) is not None:
+            usage["input_tokens"] = usage.get("input_tokens", 0) + message.usage.input_tokens
+            usage["output_tokens"] = usage.get("output_tokens", 0) + message.usage.output_tokens
+        with metrics.timed("llm_parse"):
+            return extract_tool_input(message, tool_name)
+    return parse
+
+
+def _validate(model_cls: Type[T], raw: Dict) -> T:
+    """Validate tool input against model_cls, timed as the llm_validate stage."""
+    with metrics.timed("llm_validate"):
+        return model_cls.model_validate(raw)
+
+
+def _repair_request(tool: Dict, raw: Dict, error: ValidationError, model: str) -> Dict:
+    """
+    Build the messages.create arguments for a repair call.
+
+    The request carries only the invalid tool input and its validation
+    errors, so it is far cheaper than re-running the original prompt.
+
+    Args:
+        tool: Tool definition the input must satisfy
+        raw: The invalid tool input
+        error: Validation error raised for raw
+        model: Claude model to use
+
+    Returns:
+        Keyword arguments for client.messages.create
+    """
+    errors = [
+        {"location": ".".join(str(part) for part in item["loc"]), "message": item["msg"]}
+        for item in error.errors()
+    ]
+    user_message = (
+        f"Invalid {tool['name']} input:\n{json.dumps(raw, ensure_ascii=False, default=str)}\n\n"
+        f"Validation errors:\n{json.dumps(errors, ensure_ascii=False)}"
+    )
+
+    return {
+        "model": model,
+        "system": REPAIR_SYSTEM_PROMPT,
+        "max_tokens": REPAIR_MAX_TOKENS,
+        "temperature": 0,
+        "tools": [tool],
+        "tool_choice": {"type": "tool", "name": tool["name"]},
+        "messages": [{"role": "user", "content": user_message}]
+    }
+
+
+def extract_tool_input(message, tool_name: str) -> Dict:
+    """
+    Get the input of the named tool call from a Message.
+
+    Falls back to the first JSON object in the text content when the model
+    answered in prose, with or without markdown fences.
+
+    Args:
+        message: Anthropic Message
+        tool_name: Expected tool name
+
+    Returns:
+        Tool input dictionary
+
+    Raises:
+        ValueError: If the message contains neither the tool call nor a JSON object
+    """
+    text_parts = []
+    for block in message.content:
+        if block.type == "tool_use" and block.name == tool_name:
+            return block.input
+        if block.type == "text":
+            text_parts.append(block.text)
+
+    text = "\n".join(text_parts)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError(f"Response contains no {tool_name} tool call or JSON object")
+
+    parsed = json.loads(text[start:end + 1])
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Response JSON for {tool_name} is not an object")
+    return parsed
@@ -0,0 +1,6 @@
+"""Make the backend modules importable the way app.py imports them."""
+
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
@@ -0,0 +1,115 @@
+"""Fixture sentences for the deterministic rule engine."""
+
+import pytest
+
+from rule_engine import evaluate, evaluate_with_hints, format_hints
+
+
+# Sentences the engine must leave to Claude: requirements, plans, negated or
+# qualified locations and mixed hosting statements
+UNDECIDED = [
+    ("Customer data is hosted outside Qatar.", "QCB 2.1.1"),
+    ("We are evaluating Qatar-based cloud providers for data hosting.", "QCB 2.1.1"),
+    ("Action Item: Evaluate Qatar-based cloud providers", "QCB 2.1.1"),
+    ("Data hosted outside Qatar (compliance gap)", "QCB 2.1.1"),
+    ("We plan to migrate customer data to AWS in Qatar.", "QCB 2.1.1"),
+    ("Customer data is hosted on AWS in Qatar, with encrypted backups replicated to Frankfurt", "QCB 2.1.1"),
+    ("A compliance officer must be appointed before licensing.", "QCB 2.2.1"),
+    ("Paid-up capital target: QAR 10,000,000 by year 3.", "QCB 3.1.1"),
+    ("The minimum paid-up capital is QAR 10,000,000.", "QCB 3.1.1"),
+    ("The board will have 5 directors after the next round.", "QCB 4.1.1"),
+    ("The board has 5 directors, including 2 independent directors.", "QCB 4.1.1"),
+]
+
+# Plain statements that meet one condition of a rule; the rule's other
+# conditions still need Claude, so the pass is only a hint
+PASSED_CONDITIONS = [
+    ("Our compliance officer has no prior QCB experience but has been appointed.", "QCB 2.2.1"),
+    ("Ms. Al-Thani has been appointed as Chief Compliance Officer.", "QCB 2.2.1"),
+    ("The company has appointed a compliance officer who reports to the CEO.", "QCB 2.2.1"),
+    ("All customer data is stored on servers in Doha.", "QCB 2.1.1"),
+    ("Paid-up capital is QAR 12,000,000.", "QCB 3.1.1"),
+    ("We have 2 board members and 1 independent director.", "QCB 4.1.1"),
+]
+
+# Plain statements of a failed condition the engine decides on its own
+DECIDED = [
+    ("We have not yet appointed a compliance officer.", "QCB 2.2.1"),
+    ("No dedicated Compliance Officer assigned yet", "QCB 2.2.1"),
+    ("Our company hosts all customer data on AWS in Ireland.", "QCB 2.1.1"),
+    ("Data hosted in AWS in Ireland and Singapore", "QCB 2.1.1"),
+    ("Paid-up capital is QAR 2,000,000.", "QCB 3.1.1"),
+    ("The board has 2 directors.", "QCB 4.1.1"),
+    ("We have 1 board member and 1 independent director.", "QCB 4.1.1"),
+]
+
+
+@pytest.mark.parametrize("sentence,rule_ref", UNDECIDED)
+def test_undecided_sentences_are_hints(sentence, rule_ref):
+    resolved, hints = evaluate_with_hints([sentence])
+    assert rule_ref not in resolved
+    assert rule_ref in hints
+
+
+@pytest.mark.parametrize("sentence,rule_ref", PASSED_CONDITIONS)
+def test_passed_conditions_are_hints(sentence, rule_ref):
+    resolved, hints = evaluate_with_hints([sentence])
+    assert rule_ref not in resolved
+    assert [hint["status"] for hint in hints[rule_ref]] == ["pass"]
+
+
+@pytest.mark.parametrize("sentence,rule_ref", DECIDED)
+def test_failed_statements_are_resolved(sentence, rule_ref):
+    resolved = evaluate([sentence])
+    assert resolved[rule_ref]["status"] == "fail"
+
+
+def test_counts_are_summed_within_a_sentence():
+    _, hints = evaluate_with_hints(["We have 2 board members and 1 independent director."])
+    assert "Board size of 3" in hints["QCB 4.1.1"][0]["explanation"]
+
+
+def test_pass_resolves_when_predicate_covers_rule():
+    predicates = [{
+        "rule": "QCB 3.1.1",
+        "check": "money",
+        "context": ["paid-up capital"],
+        "pass_at_least": 10000000,
+        "covers_rule": True
+    }]
+    resolved = evaluate(["Paid-up capital is QAR 12,000,000."], predicates)
+    assert resolved["QCB 3.1.1"]["status"] == "pass"
+
+
+@pytest.mark.parametrize("sentence", [
+    "We raised QAR 12 million in our Series A round.",
+    "Seed funding of QAR 3,000,000 was secured from angel investors to build share capital."
+])
+def test_funding_is_not_paid_up_capital(sentence):
+    resolved, hints = evaluate_with_hints([sentence])
+    assert "QCB 3.1.1" not in resolved
+    assert "QCB 3.1.1" not in hints
+
+
+def test_conflicting_findings_are_not_resolved():
+    resolved, hints = evaluate_with_hints([
+        "Customer data is stored on servers in Doha.",
+        "Our analytics data is hosted on AWS in Ireland."
+    ])
+    assert "QCB 2.1.1" not in resolved
+    assert [hint["status"] for hint in hints["QCB 2.1.1"]] == ["pass", "fail"]
+
+
+def test_format_hints_marks_passes_as_partial():
+    _, hints = evaluate_with_hints(["Paid-up capital is QAR 12,000,000."])
+    assert "other conditions were not checked" in format_hints(hints)
+
+
+def test_format_hints_filters_rules():
+    _, hints = evaluate_with_hints([
+        "Customer data is hosted outside Qatar.",
+        "A compliance officer must be appointed before licensing."
+    ])
+    text = format_hints(hints, ["QCB 2.1.1"])
+    assert "QCB 2.1.1" in text and "QCB 2.2.1" not in text
+    assert format_hints(hints, []) == ""
@@ -0,0 +1,127 @@
+"""
+Prompt token budgeting module.
+Counts prompt tokens before a Claude call, caps user-supplied text and
+drops the lowest-ranked evidence so a prompt fits its input budget.
+
+Counts are a chars/4 estimate scaled up by TOKEN_ESTIMATE_MARGIN, so the
+preflight errs towards dropping evidence rather than sending an oversized
+prompt.
+"""
+
+import json
+import logging
+import math
+import os
+from typing import Dict, List, Tuple
+
+from llm_limiter import CHARS_PER_TOKEN, estimate_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Input tokens allowed for one /analyze prompt (system, tools, rules, evidence, summary)
+ANALYSIS_INPUT_TOKEN_BUDGET = int(os.getenv("ANALYSIS_INPUT_TOKEN_BUDGET", "12000"))
+
+# Longest startup summary sent to Claude; longer summaries are truncated
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "1500"))
+
+# Context window of the analysis models
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "200000"))
+
+# Factor applied to the chars/4 estimate. English prose is close to 4 chars
+# per token; JSON, code and non-English text use fewer, so the estimate
+# undercounts them. Raise it for traffic that is mostly non-Latin script.
+TOKEN_ESTIMATE_MARGIN = float(os.getenv("TOKEN_ESTIMATE_MARGIN", "1.25"))
+
+TRUNCATION_MARKER = " [truncated]"
+
+
+def count_tokens(text) -> int:
+    """
+    Estimate the token count of prompt text, or of a JSON-serializable value
+    such as a tool definition, including TOKEN_ESTIMATE_MARGIN.
+
+    Args:
+        text: String, or value to serialize as JSON
+
+    Returns:
+        Estimated number of tokens
+    """
+    if not isinstance(text, str):
+        text = json.dumps(text)
+    return math.ceil(estimate_tokens(text) * TOKEN_ESTIMATE_MARGIN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """
+    Cut text to at most max_tokens, at a word boundary.
+
+    Args:
+        text: Text to cap
+        max_tokens: Token limit
+
+    Returns:
+        Tuple of (text, truncated)
+    """
+    if count_tokens(text) <= max_tokens:
+        return text, False
+
+    limit = max(0, int(max_tokens / TOKEN_ESTIMATE_MARGIN) * CHARS_PER_TOKEN - len(TRUNCATION_MARKER))
+    cut = text[:limit]
+    boundary = cut.rfind(" ")
+    if boundary > limit // 2:
+        cut = cut[:boundary]
+    return cut.rstrip() + TRUNCATION_MARKER, True
+
+
+def fit_evidence(ranked_evidence: List[str], available_tokens: int,
+                 separator: str = "") -> Tuple[List[str], int]:
+    """
+    Keep the highest-ranked evidence that fits the remaining budget.
+
+    Evidence is kept in rank order until the next item would not fit; the
+    rest (the lowest-ranked items) are dropped.
+
+    Args:
+        ranked_evidence: Evidence texts, best first
+        available_tokens: Tokens left after the fixed parts of the prompt
+        separator: Text placed between evidence items in the prompt
+
+    Returns:
+        Tuple of (kept evidence, tokens used)
+    """
+    kept = []
+    used = 0
+    for text in ranked_evidence:
+        cost = count_tokens(text) + (count_tokens(separator) if kept else 0)
+        if used + cost > available_tokens:
+            break
+        kept.append(text)
+        used += cost
+    return kept, used
+
+
+def accounting(parts: Dict[str, int], budget: int, max_output_tokens: int, **details) -> Dict:
+    """
+    Build the token accounting reported with an analysis.
+
+    Args:
+        parts: Estimated input tokens per prompt part
+        budget: Input token budget
+        max_output_tokens: Output tokens requested from the model
+        **details: Extra fields (e.g. evidence_chunks_dropped)
+
+    Returns:
+        Dictionary with per-part tokens, total, budget and context window use
+    """
+    total = sum(parts.values())
+    return {
+        **parts,
+        "total_input_tokens": total,
+        "input_budget": budget,
+        "max_output_tokens": max_output_tokens,
+        "context_window": MODEL_CONTEXT_TOKENS,
+        "estimate_margin": TOKEN_ESTIMATE_MARGIN,
+        "within_budget": total <= budget and total + max_output_tokens <= MODEL_CONTEXT_TOKENS,
+        **details
+    }